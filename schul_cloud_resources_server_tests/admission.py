@@ -0,0 +1,125 @@
+"""This module protects the server from clients which send too many requests.
+
+Each user has a token bucket which is refilled at a constant rate.
+A request takes one token.
+Additionally, the number of requests handled at the same time is limited.
+Rejected requests get a 429 Too Many Requests response with a
+Retry-After header so that the client knows when to try again.
+"""
+import time
+import math
+from threading import Lock
+from bottle import HTTPError
+
+get_time = getattr(time, "monotonic", time.time)
+
+RATE_ERROR = "Too many requests. Please wait {} seconds before you try again."
+IN_FLIGHT_ERROR = "The server is busy. Please wait {} seconds before you try again."
+
+
+def too_many_requests(message, seconds):
+    """Return an error which tells the client to retry after some seconds."""
+    seconds = max(1, int(math.ceil(seconds)))
+    return HTTPError(429, message.format(seconds),
+                     headers={"Retry-After": str(seconds)})
+
+
+class TokenBucket(object):
+    """A token bucket which refills rate tokens per second up to the capacity."""
+
+    def __init__(self, rate, capacity):
+        """Create a full bucket."""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._time = get_time()
+        self._lock = Lock()
+
+    def take(self):
+        """Take a token out of the bucket.
+
+        Return 0 if a token could be taken.
+        Otherwise, return the seconds until the next token is available.
+        """
+        with self._lock:
+            now = get_time()
+            self._tokens = min(self.capacity, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class AdmissionControl(object):
+    """A bottle plugin which rejects requests before they are handled.
+
+    - rate is the number of requests per second a user can make, None for no limit
+    - burst is the number of requests a user can make at once
+    - max_in_flight is the number of requests handled at the same time, None for no limit
+    """
+
+    name = "admission"
+    api = 2
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None):
+        """Create a new admission control."""
+        self.configure(rate, burst, max_in_flight)
+
+    def configure(self, rate=None, burst=None, max_in_flight=None):
+        """Change the limits and forget about previous requests."""
+        self.rate = rate
+        self.burst = (burst or (max(1, rate) if rate else None))
+        self.max_in_flight = max_in_flight
+        self._buckets = {} # user: bucket
+        self._buckets_lock = Lock()
+        self._in_flight = 0
+        self._in_flight_lock = Lock()
+
+    def admit(self, user):
+        """Take a request of the user into account.
+
+        If the user made too many requests, this raises a 429 error.
+        """
+        if self.rate is None:
+            return
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            with self._buckets_lock:
+                bucket = self._buckets.setdefault(user, TokenBucket(self.rate, self.burst))
+        seconds = bucket.take()
+        if seconds:
+            raise too_many_requests(RATE_ERROR, seconds)
+
+    def apply(self, callback, route):
+        """Limit the number of requests handled at the same time."""
+        def admission_wrapper(*args, **kw):
+            if self.max_in_flight is None:
+                return callback(*args, **kw)
+            with self._in_flight_lock:
+                if self._in_flight >= self.max_in_flight:
+                    raise too_many_requests(IN_FLIGHT_ERROR, 1)
+                self._in_flight += 1
+            try:
+                return callback(*args, **kw)
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight -= 1
+        return admission_wrapper
+
+    @classmethod
+    def from_environment(cls, environ):
+        """Create an admission control configured by environment variables.
+
+        - SCRST_RATE requests per second per user
+        - SCRST_BURST requests a user can make at once
+        - SCRST_MAX_IN_FLIGHT requests handled at the same time
+        """
+        def get(name, convert):
+            value = environ.get(name)
+            return (convert(value) if value else None)
+        return cls(get("SCRST_RATE", float), get("SCRST_BURST", int),
+                   get("SCRST_MAX_IN_FLIGHT", int))
+
+
+__all__ = ["AdmissionControl", "TokenBucket"]
@@ -1,20 +1,29 @@
 import sys
 import json
-import jsonschema
 import base64
-import traceback
 import os
 import re
+import time
+from collections import OrderedDict
 HERE = os.path.dirname(__file__)
 try:
     import schul_cloud_resources_server_tests
 except ImportError:
     sys.path.insert(0, os.path.join(HERE, ".."))
     import schul_cloud_resources_server_tests
-from schul_cloud_resources_api_v1.schema import validate_resource, ValidationFailed
-from bottle import request, response, tob, touni, Bottle, abort, static_file, route
-from pprint import pprint
+from bottle import request, response, tob, touni, Bottle, abort, static_file, route, parse_auth, HTTPError
 from schul_cloud_resources_server_tests.errors import errors
+from schul_cloud_resources_server_tests.store import get_store_class, ADDED, OperationFailed
+from schul_cloud_resources_server_tests.validation import get_validation_error, warm_up
+from schul_cloud_resources_server_tests.journal import Journal
+from schul_cloud_resources_server_tests.admission import AdmissionControl
+from schul_cloud_resources_server_tests.budget import Budget
+from schul_cloud_resources_server_tests.cache import ResponseCache
+from schul_cloud_resources_server_tests.events import EventStream, CONTENT_TYPE as EVENTS_CONTENT_TYPE
+from schul_cloud_resources_server_tests.transfer import Import, iter_export, CONTENT_TYPE as NDJSON_CONTENT_TYPE
+from schul_cloud_resources_server_tests.log import Logger
+from schul_cloud_resources_server_tests.profiling import Profiler
+from schul_cloud_resources_server_tests.metrics import Metrics, get_resident_memory, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 if sys.version_info[0] == 2:
     STR_TYPE = basestring
@@ -28,44 +37,73 @@ run = app.run
 post = app.post
 get = app.get
 delete = app.delete
+put = app.put
+patch = app.patch
 error = app.error
 route = app.route
 
 # configuration constants
 BASE = "/v1"
 
-# global variables
-last_id = 0
+# measure the requests, see the metrics module
+metrics = Metrics()
+app.install(metrics)
+
+# write the log, see the log module
+log = Logger.from_environment(os.environ)
+app.install(log)
+
+# limit the requests, see the admission module
+admission = AdmissionControl.from_environment(os.environ)
+app.install(admission)
+
+# profile the requests on demand, see the profiling module
+profiler = Profiler.from_environment(os.environ)
+app.install(profiler)
 
 # set the error pages
 def _error(error, code):
     """Return an error as json"""
-    _error = {
-        "status": str(code),
-        "title": errors[code],
-        "detail": error.body
-    }
-    traceback.print_exception(type(error), error, error.traceback)
+    if code >= 500:
+        # client errors are in the request log, server errors need attention
+        log.error("error", status=code, detail=error.body, traceback=error.traceback)
     response.headers["Content-Type"] = "application/vnd.api+json"
-    return response_object(errors=[_error])
+    return error_object(code, error.body)
 
-for code in [401, 403, 404, 405, 406, 415, 422]:
+for code in [401, 403, 404, 405, 406, 409, 410, 415, 422, 429, 500, 503, 507]:
     error(code)(lambda error, code=code:_error(error, code))
 
 
 class data(object):
     """The data interface the server operates with."""
 
+    # the class to store the resources of a user, see the store module
+    store_class = get_store_class(os.environ.get("SCRST_STORE", "dedup"))
+
+    # listener(operation, user, _id, resource) is called for each change
+    listeners = []
+
     @staticmethod
-    def delete_resources():
-        """Initialize the resources."""
+    def create_stores():
+        """Create the stores of the users.
+
+        Resources which outlive the stores, e.g. in a shared store, are kept.
+        """
         global _resources
         _resources = {
-            "valid1@schul-cloud.org": {},
-            "valid2@schul-cloud.org": {},
-            None: {}
+            "valid1@schul-cloud.org": data.store_class("valid1@schul-cloud.org", data.listeners),
+            "valid2@schul-cloud.org": data.store_class("valid2@schul-cloud.org", data.listeners),
+            None: data.store_class(None, data.listeners)
         } # user: id: resource
 
+    @staticmethod
+    def delete_resources():
+        """Initialize the resources."""
+        data.create_stores()
+        data.store_class.delete_all()
+        for listener in data.listeners:
+            listener("reset", None, None, None)
+
     @staticmethod
     def get_resources():
         """Return all stored resources."""
@@ -74,14 +112,101 @@ class data(object):
             resources.extend(user_resources.values())
         return resources
 
+    @staticmethod
+    def get_store(user):
+        """Return the store of the user."""
+        return _resources[user]
+
+    @staticmethod
+    def get_stores():
+        """Return the stores of all users."""
+        return list(_resources.values())
+
+    @staticmethod
+    def apply(operation, user, _id=None, resource=None):
+        """Apply an operation as reported to the listeners."""
+        if operation == "add":
+            _resources[user].add(_id, resource)
+            data.store_class.reserve_id(_id)
+        elif operation == "put":
+            _resources[user].put(_id, resource)
+            data.store_class.reserve_id(_id)
+        elif operation == "delete":
+            _resources[user].pop(_id)
+        elif operation == "clear":
+            _resources[user].clear()
+        elif operation == "reset":
+            data.delete_resources()
+        else:
+            raise ValueError("Unknown operation {}".format(repr(operation)))
+
+    @staticmethod
+    def use_journal(directory):
+        """Load the resources from the journal directory and record all changes."""
+        journal = Journal(directory)
+        journal.load(data.apply)
+        journal.open(data.get_stores)
+        data.listeners.append(journal.record)
+        return journal
+
+    @staticmethod
+    def use_replication_log(max_records=100000):
+        """Keep the latest changes for followers, see the replication module."""
+        global replication_log
+        from schul_cloud_resources_server_tests.replication import ReplicationLog
+        replication_log = ReplicationLog(max_records)
+        data.listeners.append(replication_log.record)
+        app.install(replication_log)
+        return replication_log
+
+    @staticmethod
+    def follow(url, token=None):
+        """Copy the resources of the leader at the url, see the replication module."""
+        global follower
+        from schul_cloud_resources_server_tests.replication import Follower
+        follower = Follower(url, data, token)
+        app.install(follower)
+        follower.start()
+        return follower
+
+    @staticmethod
+    def get_size():
+        """Return the number of bytes used by all stored resources."""
+        return data.store_class.get_shared_size() + \
+            sum(user_resources.get_size() for user_resources in _resources.values())
+
+    @staticmethod
+    def get_bytes_per_resource():
+        """Return the average number of bytes a stored resource uses."""
+        count = sum(map(len, _resources.values()))
+        return (data.get_size() / float(count) if count else 0)
+
+
+# the replication, see data.use_replication_log() and data.follow()
+replication_log = None
+follower = None
+REPLICATION_TOKEN = os.environ.get("SCRST_REPLICATION_TOKEN")
+
 
 def get_id():
     """Return a new id."""
-    global last_id
-    last_id += 1
-    return str(last_id)
+    return data.store_class.new_id()
+
+data.create_stores()
+
+# limit the stored resources, see the budget module
+budget = Budget.from_environment(os.environ, data.get_store, data.get_size)
+data.listeners.append(budget.record)
 
-data.delete_resources()
+# the encoded id listings until the resources change, see the cache module
+ids_cache = ResponseCache(int(os.environ.get("SCRST_IDS_CACHE_BYTES", 4 * 1024 * 1024)))
+data.listeners.append(ids_cache.record)
+
+# the changes as Server-Sent Events, see the events module
+events = EventStream()
+data.listeners.append(events.record)
+# Each stream holds one of the threads of the server.
+MAX_SUBSCRIPTIONS = int(os.environ.get("SCRST_MAX_SUBSCRIPTIONS", 4))
 
 passwords = {
     "valid1@schul-cloud.org": "123abc",
@@ -93,9 +218,8 @@ api_keys = {
 
 HEADER_ERROR = "Malfomred Authorization header."
 
-def get_api_key():
-    """Return the api key or None."""
-    header = request.headers.get('Authorization')
+def get_api_key(header):
+    """Return the api key of the Authorization header or None."""
     if not header: return
     try:
         method, data = header.split(None, 1)
@@ -107,40 +231,61 @@ def get_api_key():
 BASIC_ERROR = "Could not do basic authentication. Wrong username or password."
 API_KEY_ERROR = "Could not authenticate using the given api key."
 
-def get_resources():
-    """Return the resources of the authenticated user.
+def authenticate(header):
+    """Return the user name for the Authorization header.
 
     If authentication failed, this aborts the execution with
     401 Unauthorized.
     """
-    #pprint(dict(request.headers))
-    header = request.environ.get('HTTP_AUTHORIZATION','')
-    if header:
-        print("Authorization:", header)
-    basic = request.auth
+    basic = (parse_auth(header) if header else None)
     if basic:
         username, password = basic
         if passwords.get(username) != password:
             abort(401, BASIC_ERROR)
     else:
-        api_key = get_api_key()
+        api_key = get_api_key(header)
         if api_key is not None:
             username = api_keys.get(api_key)
             if username is None:
                 abort(401, API_KEY_ERROR)
         else:
             username = None
-    return _resources[username]
+    log.debug("authenticated", user=username)
+    admission.admit(username)
+    return username
+
+
+def identify(header):
+    """Return the authentication method and the user name for a capture."""
+    from schul_cloud_resources_server_tests.capture import identify as identify_header
+    auth, username = identify_header(header)
+    if auth == "apikey":
+        try:
+            username = api_keys.get(get_api_key(header))
+        except HTTPError:
+            username = None
+        if username is None:
+            auth = "invalid"
+    return auth, username
+
+
+def get_resources():
+    """Return the resources of the authenticated user.
+
+    If authentication failed, this aborts the execution with
+    401 Unauthorized.
+    """
+    return data.get_store(authenticate(request.environ.get("HTTP_AUTHORIZATION")))
 
 
-def get_endpoint_url():
+def get_endpoint_url(host=None):
     """Return the url that this server is reachable at."""
-    return "http://" + request.headers["Host"] + BASE
+    return "http://" + (host or request.headers["Host"]) + BASE
 
 
-def get_location_url(resource_id):
+def get_location_url(resource_id, host=None):
     """Return the location orl of a resource given by id."""
-    return get_endpoint_url() + "/resources/{}".format(resource_id)
+    return get_endpoint_url(host) + "/resources/{}".format(resource_id)
 
 
 def response_object(cnf={}, **kw):
@@ -151,37 +296,112 @@ def response_object(cnf={}, **kw):
         "name": "schul_cloud_resources_server_tests.app",
         "source": "https://gitub.com/schul-cloud/schul_cloud_resources_server_tests",
         "description": "A test server to test crawlers agains the resources api."}}
-    return json.dumps(kw, indent=2) + "\r\n"
+    start = time.time()
+    result = json.dumps(kw, indent=2) + "\r\n"
+    metrics.observe("scrst_serialization_duration_seconds", time.time() - start)
+    return result
+
+
+def error_object(code, detail, pointer=None):
+    """Return an error response with the status code.
+
+    pointer is the JSON pointer to the part of the request which caused the error.
+    """
+    error = {
+        "status": str(code),
+        "title": errors[code],
+        "detail": detail
+    }
+    if pointer is not None:
+        error["source"] = {"pointer": pointer}
+    return response_object(errors=[error])
+
+
+def resource_object(resource, _id, link):
+    """Return a response for a resource."""
+    return response_object({"data": {"attributes": resource, "type": "resource", "id": _id},
+                            "links": {"self": link}})
+
+
+def ids_object(resources, link):
+    """Return a response listing the ids of the resources."""
+    return response_object({"data": [{"type": "id", "id": _id} for _id in resources],
+                            "links": {"self": link}})
+
+
+def get_ids_response(resources, host=None):
+    """Return the encoded response listing the ids of the resources."""
+    create = lambda: tob(ids_object(budget.get_ids(resources),
+                                    get_location_url("ids", host)))
+    if budget.ttl is not None:
+        # resources expire without a change
+        return create()
+    return ids_cache.get(resources.user, host or request.headers["Host"], create,
+                         resources.get_version())
+
 
 def test_jsonapi_header():
+    """Make sure that the content type is set accordingly."""
+    check_jsonapi_headers(request.content_type, request.headers.get("Accept", "*/*"))
+
+
+def get_extension(media_type):
+    """Return the media type without parameters and the value of its ext parameter."""
+    parameters = media_type.split(";")
+    extension = None
+    for parameter in parameters[1:]:
+        name, _, value = parameter.partition("=")
+        if name.strip().lower() == "ext":
+            extension = value.strip().strip('"')
+    return parameters[0].strip().lower(), extension
+
+
+def check_jsonapi_headers(content_type, accept, extension=None):
     """Make sure that the content type is set accordingly.
 
     http://jsonapi.org/format/#content-negotiation-clients
+    If the request uses an extension, the media types may name it.
     """
-    content_type = request.content_type
     content_type_expected = "application/vnd.api+json"
+    if extension is not None:
+        if get_extension(content_type) == (content_type_expected, extension):
+            content_type = content_type_expected
+        accept = ",".join((content_type_expected
+                           if get_extension(media_type) == (content_type_expected, extension)
+                           else media_type) for media_type in accept.split(","))
     if content_type != content_type_expected and content_type.startswith(content_type_expected):
         abort(415, "The Content-Type header must be \"{}\", not \"{}\".".format(
                    content_type_expected, content_type))
-    accepts = request.headers.get("Accept", "*/*").split(",")
+    accepts = accept.split(",")
     expected_accept = ["*/*", "application/*", "application/vnd.api+json"]
     if not any([accept in expected_accept for accept in accepts]):
         abort(406, "The Accept header must one of \"{}\", not \"{}\".".format(
                        expected_accept, ",".join(accepts)))
 
 
-@post(BASE + "/resources")
-def add_resource():
-    """Add a new resource."""
-    test_jsonapi_header()
-    resources = get_resources()
+# ids which can not be used for resources
+RESERVED_IDS = ("ids", "delete", "events")
+
+
+def parse_resource_request(body):
+    """Return the data of a request which contains a resource.
+
+    If the request is invalid, this aborts the execution with an error.
+    """
     try:
-        data = touni(request.body.read())
-        #pprint(data)
+        data = touni(body)
         add_request = json.loads(data)
     except (ValueError):
         abort(400, "The expected content should be json, encoded in utf8.")
-    if not "data" in add_request:
+    return get_resource_data(add_request)
+
+
+def get_resource_data(add_request):
+    """Return the data of a request object which contains a resource.
+
+    If the request is invalid, this aborts the execution with an error.
+    """
+    if not isinstance(add_request, dict) or not "data" in add_request:
         abort(422, "The data property must be present.")
     if "errors" in add_request:
         abort(422, "The errors property must not be present.")
@@ -189,22 +409,283 @@ def add_resource():
         abort(422, "There must be a \"type\" property set to \"resource\" in the data field.")
     if not isinstance(add_request["data"].get("attributes"), dict):
         abort(422, "There must be a \"attributes\" property set to an object in the data field.")
-    resource = add_request["data"]["attributes"]
-    try:
-        validate_resource(resource)
-    except ValidationFailed as error:
-        abort(422, str(error))
-    _id = add_request["data"].get("id", get_id())
+    return add_request["data"]
+
+
+def validate_resource(resource):
+    """Abort if the resource does not match the schema."""
+    start = time.time()
+    validation_error = get_validation_error(resource)
+    metrics.observe("scrst_validation_duration_seconds", time.time() - start)
+    if validation_error is not None:
+        abort(422, str(validation_error))
+
+
+def check_id(_id):
+    """Abort if the id can not be used for a new resource."""
     if not isinstance(_id, STR_TYPE) or not re.match("^([!*\"'(),+a-zA-Z0-9$_@.&+-])+$", _id):
         abort(403, "The id {} is invalid, can not be part of a url.".format(repr(_id)))
-    if _id in resources or _id == "ids":
-        abort(403, "The id \"{}\" already exists.".format(_id))
-    resources[_id] = resource
+    if _id in RESERVED_IDS:
+        abort_id_exists(_id)
+
+
+def parse_add_request(body):
+    """Return the resource and the id of a request to add a resource.
+
+    If the request is invalid, this aborts the execution with an error.
+    """
+    resource_data = parse_resource_request(body)
+    resource = resource_data["attributes"]
+    validate_resource(resource)
+    if "id" in resource_data:
+        _id = resource_data["id"]
+    else:
+        _id = get_id()
+    check_id(_id)
+    return resource, _id
+
+
+def update_resource(resources, _id, body, partial=False):
+    """Add or replace the resource with the id by a PUT or PATCH request.
+
+    With partial=True, the attributes are merged into the stored resource.
+    Return the result of Store.put() and the resource.
+    If the request is invalid, this aborts the execution with an error.
+    """
+    resource_data = parse_resource_request(body)
+    if "id" in resource_data and resource_data["id"] != _id:
+        abort(409, "The id {} does not match the id in the url \"{}\".".format(
+                   repr(resource_data["id"]), _id))
+    check_id(_id)
+    resource = resource_data["attributes"]
+    if partial:
+        old = get_resource_or_none(resources, _id)
+        if old is None:
+            abort(404, "The resource with the id \"{}\" could not be found.".format(_id))
+        resource = dict(old, **resource)
+    validate_resource(resource)
+    budget.admit(resources, _id)
+    result = resources.put(_id, resource)
+    budget.enforce(resources.user, _id)
+    return result, resource
+
+
+def add_resource_to(resources, _id, resource):
+    """Add a resource with a new id to the store.
+
+    If the id exists or the resource does not fit, this aborts the execution.
+    """
+    budget.admit(resources)
+    if not resources.add(_id, resource):
+        abort_id_exists(_id)
+    budget.enforce(resources.user, _id)
+
+
+def get_resource_or_none(resources, _id):
+    """Return the resource with the id or None if it is absent or expired."""
+    resource = resources.get(_id)
+    if resource is None or budget.is_expired(resources.user, _id):
+        return None
+    return resource
+
+
+def parse_delete_request(body):
+    """Return the ids and the filter of a request to delete resources.
+
+    One of them is None.
+    If the request is invalid, this aborts the execution with an error.
+    """
+    try:
+        delete_request = json.loads(touni(body))
+    except (ValueError):
+        abort(400, "The expected content should be json, encoded in utf8.")
+    if not isinstance(delete_request, dict) or \
+            ("data" in delete_request) == ("filter" in delete_request):
+        abort(422, "Either the data property with a list of ids or "
+                   "the filter property must be present.")
+    if "filter" in delete_request:
+        attributes = delete_request["filter"]
+        if not isinstance(attributes, dict) or not attributes:
+            abort(422, "The filter property must be an object with attributes. "
+                       "DELETE {}/resources deletes all resources.".format(BASE))
+        return None, attributes
+    ids = delete_request["data"]
+    if not isinstance(ids, list) or not all(
+            isinstance(entry, dict) and entry.get("type") == "id" and
+            isinstance(entry.get("id"), STR_TYPE) for entry in ids):
+        abort(422, "The data property must be a list of objects "
+                   "with the type \"id\" and an id.")
+    return [entry["id"] for entry in ids], None
+
+
+def matches_filter(resource, attributes):
+    """Whether the resource has the attributes.
+
+    A list attribute of the resource matches if it contains the value.
+    """
+    for name, value in attributes.items():
+        actual = resource.get(name)
+        if actual != value and not (isinstance(actual, list) and value in actual):
+            return False
+    return True
+
+
+def delete_resources_from(resources, ids=None, attributes=None):
+    """Delete the resources with the ids or the attributes from the store.
+
+    Return the meta object of the response with the number of deleted
+    resources and the ids which were not found.
+    """
+    if ids is None:
+        ids = [_id for _id, resource in resources.items()
+               if matches_filter(resource, attributes)]
+        return {"deleted": len(resources.pop_many(ids))}
+    ids = list(OrderedDict.fromkeys(ids))
+    deleted = set(resources.pop_many(ids))
+    return {"deleted": len(deleted), "missing": [_id for _id in ids if _id not in deleted]}
+
+
+def subscribe_events(resources, last_event_id=None, max_subscriptions=None, wake=None):
+    """Return a subscription to the changes of the resources.
+
+    If there are max_subscriptions, this aborts with 503 Service Unavailable.
+    """
+    if max_subscriptions is not None and events.count_subscriptions() >= max_subscriptions:
+        raise HTTPError(503, "There are too many event streams. Please try again later.",
+                        headers={"Retry-After": "10"})
+    return events.subscribe(resources.user, last_event_id, wake)
+
+
+# the JSON:API extension for several operations in one request
+ATOMIC_EXTENSION = "https://jsonapi.org/ext/atomic"
+ATOMIC_CONTENT_TYPE = 'application/vnd.api+json; ext="{}"'.format(ATOMIC_EXTENSION)
+
+
+class OperationError(Exception):
+    """An operation of an atomic request failed and none was applied."""
+
+    def __init__(self, index, status, detail):
+        Exception.__init__(self, index, status, detail)
+        self.index = index
+        self.status = status
+        self.detail = detail
+
+    @property
+    def pointer(self):
+        """The JSON pointer to the operation."""
+        return "/atomic:operations/{}".format(self.index)
+
+
+def parse_operation(resources, operation, pending, host=None):
+    """Return the store operation and the result of an atomic operation.
+
+    pending maps the ids changed by the operations before to their resources.
+    If the operation is invalid, this aborts the execution with an error.
+    """
+    if not isinstance(operation, dict) or operation.get("op") not in ("add", "update", "remove"):
+        abort(422, "The op property must be \"add\", \"update\" or \"remove\".")
+    if operation["op"] == "remove" or "ref" in operation:
+        ref = operation.get("ref")
+        if not isinstance(ref, dict) or ref.get("type") != "resource" or \
+                not isinstance(ref.get("id"), STR_TYPE):
+            abort(422, "The ref property must be an object with the type \"resource\" and an id.")
+    if operation["op"] == "remove":
+        pending[ref["id"]] = None
+        return ("delete", ref["id"]), {}
+    resource_data = get_resource_data(operation)
+    resource = resource_data["attributes"]
+    if operation["op"] == "add":
+        _id = (resource_data["id"] if "id" in resource_data else get_id())
+        check_id(_id)
+        store_operation = ("add", _id, resource)
+    else:
+        _id = (ref["id"] if "ref" in operation else resource_data.get("id"))
+        if _id is None:
+            abort(422, "An update needs a ref or an id in the data property.")
+        if "id" in resource_data and resource_data["id"] != _id:
+            abort(409, "The id {} does not match the id of the ref \"{}\".".format(
+                       repr(resource_data["id"]), _id))
+        old = (pending[_id] if _id in pending else get_resource_or_none(resources, _id))
+        if old is None:
+            abort(404, "The resource with the id \"{}\" could not be found.".format(_id))
+        resource = dict(old, **resource)
+        store_operation = ("put", _id, resource)
+    validate_resource(resource)
+    pending[_id] = resource
+    return store_operation, {"data": {"attributes": resource, "type": "resource", "id": _id,
+                                      "links": {"self": get_location_url(_id, host)}}}
+
+
+def apply_operations(resources, body, host=None):
+    """Apply the operations of an atomic request to the store or none of them.
+
+    Return the results of the operations.
+    If an operation fails, OperationError is raised.
+    """
+    try:
+        operations = json.loads(touni(body))
+    except (ValueError):
+        abort(400, "The expected content should be json, encoded in utf8.")
+    if not isinstance(operations, dict) or \
+            not isinstance(operations.get("atomic:operations"), list):
+        abort(422, "The atomic:operations property must be a list of operations.")
+    store_operations = []
+    results = []
+    pending = {}
+    for index, operation in enumerate(operations["atomic:operations"]):
+        try:
+            store_operation, result = parse_operation(resources, operation, pending, host)
+        except HTTPError as error:
+            raise OperationError(index, error.status_code, error.body)
+        store_operations.append(store_operation)
+        results.append(result)
+    added = [operation[1] for operation in store_operations if operation[0] == "add"]
+    if added:
+        budget.admit(resources, count=len(added))
+    try:
+        resources.apply_all(store_operations)
+    except OperationFailed as error:
+        _id = error.operation[1]
+        if error.operation[0] == "add":
+            raise OperationError(error.index, 403, "The id \"{}\" already exists.".format(_id))
+        raise OperationError(error.index, 404, "Resource {} not found.".format(_id))
+    for operation in store_operations:
+        if operation[0] != "delete":
+            budget.enforce(resources.user, operation[1])
+    return results
+
+
+def import_resources_into(resources, lines):
+    """Add or replace the resources of the NDJSON lines in the store.
+
+    Return the Import.
+    """
+    return Import(resources, check_id, budget.admit, budget.enforce).read(lines)
+
+
+def check_ndjson_content_type(content_type):
+    """Abort if the content type is not NDJSON."""
+    if content_type.split(";")[0].strip() != NDJSON_CONTENT_TYPE:
+        abort(415, "The Content-Type header must be \"{}\", not \"{}\".".format(
+                   NDJSON_CONTENT_TYPE, content_type))
+
+
+def abort_id_exists(_id):
+    """Abort because a resource with the id exists."""
+    abort(403, "The id \"{}\" already exists.".format(_id))
+
+
+@post(BASE + "/resources")
+def add_resource():
+    """Add a new resource."""
+    test_jsonapi_header()
+    resources = get_resources()
+    resource, _id = parse_add_request(request.body.read())
+    add_resource_to(resources, _id, resource)
     response.status = 201
     link = get_location_url(_id)
     response.headers["Location"] = link
-    return response_object({"data": {"attributes": resource, "type":"resource", "id": _id},
-            "links": {"self":link}})
+    return resource_object(resource, _id, link)
 
 # call css stylesheet
 @route('/schul_cloud_resources_server_tests/<filepath>')
@@ -212,17 +693,36 @@ def server_static(filepath):
     return static_file(filepath, root=HERE)
 
 
+@put(BASE + "/resources/<_id>")
+def put_resource(_id):
+    """Add or replace a resource."""
+    test_jsonapi_header()
+    resources = get_resources()
+    result, resource = update_resource(resources, _id, request.body.read())
+    link = get_location_url(_id)
+    if result == ADDED:
+        response.status = 201
+        response.headers["Location"] = link
+    return resource_object(resource, _id, link)
+
+
+@patch(BASE + "/resources/<_id>")
+def patch_resource(_id):
+    """Change attributes of a resource."""
+    test_jsonapi_header()
+    resources = get_resources()
+    result, resource = update_resource(resources, _id, request.body.read(), partial=True)
+    return resource_object(resource, _id, get_location_url(_id))
+
+
 @get(BASE + "/resources/<_id>")
 def get_resource(_id):
     """Get a resource identified by id."""
-    if _id == "ids":
-        return get_resource_ids()
     resources = get_resources()
-    resource = resources.get(_id)
+    resource = get_resource_or_none(resources, _id)
     if resource is None:
         abort(404, "The resource with the id \"{}\" could not be found.".format(_id))
-    return response_object({"data": {"attributes": resource, "id": _id, "type": "resource"},
-                            "links": {"self": get_location_url(_id)}})
+    return resource_object(resource, _id, get_location_url(_id))
 
 
 @delete(BASE + "/resources/<_id>")
@@ -233,15 +733,70 @@ def delete_resource(_id):
         abort(404, "Resource {} not found.".format(_id))
 
 
+@get(BASE + "/resources/events")
+def get_resource_events():
+    """Send the changes of the resources as Server-Sent Events."""
+    resources = get_resources()
+    subscription = subscribe_events(resources, request.headers.get("Last-Event-ID"),
+                                    MAX_SUBSCRIPTIONS)
+    response.content_type = EVENTS_CONTENT_TYPE
+    response.headers["Cache-Control"] = "no-cache"
+    return events.iter_events(subscription, request.environ.get("scrst.server_closed",
+                                                                 lambda: False))
+
+
+@get(BASE + "/resources/ids")
 def get_resource_ids():
     """Return the list of current ids."""
     test_jsonapi_header()
     resources = get_resources()
     response.content_type = 'application/vnd.api+json'
-    return response_object({"data": [{"type": "id", "id": _id} for _id in resources],
-                            "links": {"self": get_location_url("ids")}})
+    return get_ids_response(resources)
+
+
+
+@post(BASE + "/resources/delete")
+def delete_some_resources():
+    """Delete the resources with the ids or attributes in the body."""
+    test_jsonapi_header()
+    resources = get_resources()
+    ids, attributes = parse_delete_request(request.body.read())
+    response.content_type = 'application/vnd.api+json'
+    return response_object(meta=delete_resources_from(resources, ids, attributes))
+
+
+@post(BASE + "/operations")
+def post_operations():
+    """Apply several operations at once, see the JSON:API atomic extension."""
+    check_jsonapi_headers(request.content_type, request.headers.get("Accept", "*/*"),
+                          ATOMIC_EXTENSION)
+    resources = get_resources()
+    response.content_type = ATOMIC_CONTENT_TYPE
+    try:
+        results = apply_operations(resources, request.body.read())
+    except OperationError as error:
+        response.status = error.status
+        return error_object(error.status, error.detail, error.pointer)
+    return response_object({"atomic:results": results})
+
+
+@get(BASE + "/export")
+def export_resources():
+    """Send all resources of the user as NDJSON."""
+    resources = get_resources()
+    response.content_type = NDJSON_CONTENT_TYPE
+    return iter_export(resources, get_resource_or_none)
 
 
+@post(BASE + "/import")
+def import_resources():
+    """Add or replace the resources in the NDJSON body."""
+    check_ndjson_content_type(request.content_type)
+    resources = get_resources()
+    result = import_resources_into(resources, request.body).get_result()
+    response.content_type = 'application/vnd.api+json'
+    return response_object(meta=result)
+
 
 @delete(BASE + "/resources")
 def delete_resources():
@@ -251,11 +806,107 @@ def delete_resources():
     response.status = 204
 
 
-@get("/")
-@get("/v1")
-def get_help_page():
-    """Display a help page for the users."""
-    return """
+def get_replication_log():
+    """Return the replication log of the leader.
+
+    If the server is no leader or the token is wrong, this aborts the execution.
+    Without SCRST_REPLICATION_TOKEN, nobody gets the resources of all users.
+    """
+    if replication_log is None:
+        abort(404, "This server is not started with --leader.")
+    if REPLICATION_TOKEN is None:
+        abort(403, "Set SCRST_REPLICATION_TOKEN to replicate the resources.")
+    if request.headers.get("X-Replication-Token") != REPLICATION_TOKEN:
+        abort(403, "The X-Replication-Token header is wrong.")
+    return replication_log
+
+
+@get(BASE + "/replication/log")
+def get_replication_records():
+    """Return the changes after the sequence number since."""
+    from schul_cloud_resources_server_tests.replication import LogTruncated
+    log = get_replication_log()
+    try:
+        since = int(request.query.get("since", "0"))
+        wait = min(float(request.query.get("wait", "0")), 60)
+    except ValueError:
+        abort(400, "since must be an integer and wait a number.")
+    try:
+        records = log.get_records(since, wait=wait)
+    except LogTruncated:
+        abort(410, "The changes after {} are not kept any more.".format(since))
+    response.content_type = "application/json"
+    return json.dumps({"sequence": log.sequence, "records": records})
+
+
+@get(BASE + "/replication/snapshot")
+def get_replication_snapshot():
+    """Return all resources and the sequence number they include."""
+    snapshot = get_replication_log().snapshot(data.get_stores)
+    response.content_type = "application/json"
+    return json.dumps(snapshot)
+
+
+@get(BASE + "/replication/status")
+def get_replication_status():
+    """Return the state of the replication."""
+    response.content_type = "application/json"
+    if follower is not None:
+        return json.dumps(follower.get_status())
+    if replication_log is not None:
+        return json.dumps({"sequence": replication_log.sequence})
+    abort(404, "This server does not replicate.")
+
+
+metrics.describe("scrst_requests_total", "counter", "Requests by route and status.")
+metrics.describe("scrst_request_duration_seconds", "histogram", "Time to handle a request.")
+metrics.describe("scrst_validation_duration_seconds", "histogram", "Time to validate a resource.")
+metrics.describe("scrst_serialization_duration_seconds", "histogram", "Time to encode a response.")
+metrics.describe("scrst_resources", "gauge", "Resources stored for a user.")
+metrics.describe("scrst_resources_bytes", "gauge", "Bytes used by the resources of a user.")
+metrics.describe("scrst_shared_resources_bytes", "gauge", "Bytes used by resources shared by the users.")
+metrics.describe("scrst_evicted_resources_total", "counter", "Resources removed to stay within the budget.")
+metrics.describe("scrst_expired_resources_total", "counter", "Resources removed because they expired.")
+metrics.describe("scrst_ids_cache_hits_total", "counter", "Id listings answered from the cache.")
+metrics.describe("scrst_ids_cache_misses_total", "counter", "Id listings which were encoded.")
+metrics.describe("scrst_event_subscriptions", "gauge", "Open streams of Server-Sent Events.")
+metrics.describe("scrst_replication_lag_records", "gauge", "Changes of the leader the follower did not apply, yet.")
+metrics.describe("scrst_replication_lag_seconds", "gauge", "Seconds since the follower had all changes of the leader.")
+metrics.describe("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.")
+
+
+@metrics.gauge
+def get_store_metrics():
+    """Return the size of the stores."""
+    result = []
+    for store in data.get_stores():
+        labels = {"user": store.user or ""}
+        result.append(("scrst_resources", labels, len(store)))
+        result.append(("scrst_resources_bytes", labels, store.get_size()))
+    result.append(("scrst_shared_resources_bytes", {}, data.store_class.get_shared_size()))
+    result.append(("scrst_evicted_resources_total", {}, budget.evicted))
+    result.append(("scrst_expired_resources_total", {}, budget.expired))
+    result.append(("scrst_ids_cache_hits_total", {}, ids_cache.hits))
+    result.append(("scrst_ids_cache_misses_total", {}, ids_cache.misses))
+    result.append(("scrst_event_subscriptions", {}, events.count_subscriptions()))
+    if follower is not None:
+        records, seconds = follower.get_lag()
+        result.append(("scrst_replication_lag_records", {}, records))
+        result.append(("scrst_replication_lag_seconds", {}, seconds))
+    memory = get_resident_memory()
+    if memory is not None:
+        result.append(("process_resident_memory_bytes", {}, memory))
+    return result
+
+
+@get("/metrics")
+def get_metrics():
+    """Return the metrics of the server for Prometheus."""
+    response.content_type = METRICS_CONTENT_TYPE
+    return metrics.render()
+
+
+HELP_PAGE = """
     <html>
       <head>
        <link rel="stylesheet" type="text/css" href="/schul_cloud_resources_server_tests/stylesheet.css">
@@ -290,6 +941,31 @@ def get_help_page():
               To remove all saved resources. Command:
               <pre>curl -X DELETE "{url}/resources" -H  "accept: application/vnd.api+json"</pre>
             </li>
+            <li>
+              POST {url}/operations<br/>
+              To add and remove several resources at once or not at all. Command:
+              <pre>curl -X POST "{url}/operations" -H  "accept: application/vnd.api+json" -H  "content-type: application/vnd.api+json" -d "{{  \\"atomic:operations\\": [{{  \\"op\\": \\"remove\\",  \\"ref\\": {{  \\"type\\": \\"resource\\",  \\"id\\": \\"cornelsen-physics-1\\"  }}}}]}}"</pre>
+            </li>
+            <li>
+              GET {url}/export<br/>
+              To get all resources as one line of JSON per resource. Command:
+              <pre>curl -X GET "{url}/export" -o resources.ndjson</pre>
+            </li>
+            <li>
+              POST {url}/import<br/>
+              To add or replace the resources of an export. Command:
+              <pre>curl -X POST "{url}/import" -H  "content-type: application/x-ndjson" --data-binary @resources.ndjson</pre>
+            </li>
+            <li>
+              GET {url}/resources/events<br/>
+              To get the changes to the resources as Server-Sent Events. Command:
+              <pre>curl -N -X GET "{url}/resources/events" -H  "accept: text/event-stream"</pre>
+            </li>
+            <li>
+              POST {url}/resources/delete<br/>
+              To remove the resources with the ids or the attributes in the body. Command:
+              <pre>curl -X POST "{url}/resources/delete" -H  "accept: application/vnd.api+json" -H  "content-type: application/vnd.api+json" -d "{{  \\"data\\": [{{  \\"type\\": \\"id\\",  \\"id\\": \\"cornelsen-physics-1\\"  }}]}}"</pre>
+            </li>
             <li>
               GET {url}/resources/{{resourceId}}<br/>
               To get a specific resource. Command:
@@ -311,16 +987,65 @@ def get_help_page():
         </p>
       </body>
     </html>
-    """.format(url=get_endpoint_url())
+"""
+
+# the rendered help pages by Host header
+_help_pages = {}
+MAXIMUM_HELP_PAGES = 100
+
+
+@get("/")
+@get("/v1")
+def get_help_page():
+    """Display a help page for the users."""
+    url = get_endpoint_url()
+    page = _help_pages.get(url)
+    if page is None:
+        if len(_help_pages) >= MAXIMUM_HELP_PAGES:
+            _help_pages.clear()
+        page = _help_pages[url] = HELP_PAGE.format(url=url)
+    return page
 
 
 def main():
     """Start the serer from the command line."""
-    port = (int(sys.argv[1]) if len(sys.argv) >= 2 else 8080)
-    run(host="", port=port, debug=True, reloader=True)
+    import argparse
+    parser = argparse.ArgumentParser(description="Start the resources test server.")
+    parser.add_argument("port", type=int, nargs="?", default=8080)
+    parser.add_argument("--leader", action="store_true",
+                        help="keep the changes for followers")
+    parser.add_argument("--follow", metavar="URL",
+                        help="copy the resources of the leader with this api url")
+    parser.add_argument("--no-reload", dest="reloader", action="store_false",
+                        help="do not restart the server when the code changes")
+    args = parser.parse_args()
+    if args.leader and REPLICATION_TOKEN is None:
+        parser.error("--leader gives the resources of all users to the followers. "
+                     "Set SCRST_REPLICATION_TOKEN to a secret shared with them.")
+    port = args.port
+    reloader = args.reloader
+    serving = not reloader or os.environ.get("BOTTLE_CHILD")
+    journal = os.environ.get("SCRST_JOURNAL")
+    if journal and serving:
+        # only the process which serves the requests writes the journal
+        data.use_journal(journal)
+    if args.leader and serving:
+        data.use_replication_log()
+    if args.follow and serving:
+        data.follow(args.follow, REPLICATION_TOKEN)
+    warm_up()
+    application = app
+    capture = os.environ.get("SCRST_CAPTURE")
+    if capture and serving:
+        from schul_cloud_resources_server_tests.capture import Capture
+        application = Capture(app, Logger(open(capture, "a")), identify=identify)
+    from bottle import run as run_server
+    from schul_cloud_resources_server_tests.wsgi_server import KeepAliveServerAdapter
+    run_server(application, host="", port=port, debug=True, reloader=reloader, quiet=True,
+        server=KeepAliveServerAdapter)
 
 
-__all__ = ["app", "data", "main"]
+__all__ = ["app", "data", "budget", "events", "main"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,605 @@
+"""This module serves the resources api with asyncio.
+
+The application is an ASGI application, see https://asgi.readthedocs.io/.
+It uses the same authentication, validation, store and error format
+as the bottle app in the app module.
+
+The AsgiServer is a small HTTP/1.1 server which serves an ASGI application.
+All connections are handled in one thread, so the server can keep many
+slow or idle keep-alive connections open.
+You can also use another ASGI server such as uvicorn:
+
+    uvicorn schul_cloud_resources_server_tests.asgi:app
+
+This module requires Python 3.
+"""
+import os
+import sys
+import time
+import types
+import asyncio
+import traceback
+from threading import Event
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+from bottle import HTTPError
+from schul_cloud_resources_server_tests.errors import errors
+from schul_cloud_resources_server_tests.validation import warm_up
+from schul_cloud_resources_server_tests.app import (
+    BASE, HERE, HELP_PAGE, data, log, metrics, authenticate, check_jsonapi_headers,
+    parse_add_request, update_resource, add_resource_to, get_resource_or_none,
+    resource_object, get_ids_response, error_object, get_endpoint_url, get_location_url,
+    response_object, parse_delete_request, delete_resources_from, subscribe_events, events,
+    apply_operations, OperationError, ATOMIC_EXTENSION, ATOMIC_CONTENT_TYPE,
+    import_resources_into, check_ndjson_content_type)
+from schul_cloud_resources_server_tests.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from schul_cloud_resources_server_tests.store import ADDED
+from schul_cloud_resources_server_tests.events import (
+    Subscription, format_event, CONTENT_TYPE as EVENTS_CONTENT_TYPE, RETRY, HEARTBEAT)
+from schul_cloud_resources_server_tests.transfer import iter_export, CONTENT_TYPE as NDJSON_CONTENT_TYPE
+
+API_CONTENT_TYPE = "application/vnd.api+json"
+HTML_CONTENT_TYPE = "text/html; charset=UTF-8"
+RESOURCES = BASE + "/resources"
+STATIC = "/schul_cloud_resources_server_tests/"
+# the event streams are idle connections in the event loop
+MAX_SUBSCRIPTIONS = int(os.environ.get("SCRST_MAX_SUBSCRIPTIONS", 1000))
+# seconds between the comments which keep an event stream open
+HEARTBEAT_INTERVAL = 15
+
+
+class Request(object):
+    """The request as the handlers see it."""
+
+    def __init__(self, scope, body):
+        """Create a request from the ASGI scope and the body."""
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.body = body
+        self.headers = {}
+        for name, value in scope["headers"]:
+            self.headers[name.decode("latin-1").lower()] = value.decode("latin-1")
+
+    @property
+    def host(self):
+        """The Host header."""
+        return self.headers.get("host", "")
+
+    def get_store(self):
+        """Return the store of the authenticated user."""
+        return data.get_store(authenticate(self.headers.get("authorization")))
+
+    def check_jsonapi_headers(self, extension=None):
+        """Make sure that the content type is set accordingly."""
+        check_jsonapi_headers(self.headers.get("content-type", "").lower(),
+                              self.headers.get("accept", "*/*"), extension)
+
+
+def json_response(content, status=200, headers=()):
+    """Return a JSON:API response."""
+    return status, [("Content-Type", API_CONTENT_TYPE)] + list(headers), content
+
+
+def add_resource(request):
+    request.check_jsonapi_headers()
+    resources = request.get_store()
+    resource, _id = parse_add_request(request.body)
+    add_resource_to(resources, _id, resource)
+    link = get_location_url(_id, request.host)
+    return json_response(resource_object(resource, _id, link), 201, [("Location", link)])
+
+
+def put_resource(request, _id):
+    request.check_jsonapi_headers()
+    resources = request.get_store()
+    result, resource = update_resource(resources, _id, request.body)
+    link = get_location_url(_id, request.host)
+    if result == ADDED:
+        return json_response(resource_object(resource, _id, link), 201, [("Location", link)])
+    return json_response(resource_object(resource, _id, link))
+
+
+def patch_resource(request, _id):
+    request.check_jsonapi_headers()
+    resources = request.get_store()
+    result, resource = update_resource(resources, _id, request.body, partial=True)
+    return json_response(resource_object(resource, _id, get_location_url(_id, request.host)))
+
+
+def get_resource(request, _id):
+    resources = request.get_store()
+    resource = get_resource_or_none(resources, _id)
+    if resource is None:
+        raise HTTPError(404, "The resource with the id \"{}\" could not be found.".format(_id))
+    return json_response(resource_object(resource, _id, get_location_url(_id, request.host)))
+
+
+def delete_resource(request, _id):
+    resources = request.get_store()
+    if resources.pop(_id, None) is None:
+        raise HTTPError(404, "Resource {} not found.".format(_id))
+    return 200, [], ""
+
+
+def get_resource_ids(request):
+    request.check_jsonapi_headers()
+    resources = request.get_store()
+    return json_response(get_ids_response(resources, request.host))
+
+
+def delete_some_resources(request):
+    request.check_jsonapi_headers()
+    resources = request.get_store()
+    ids, attributes = parse_delete_request(request.body)
+    return json_response(response_object(meta=delete_resources_from(resources, ids, attributes)))
+
+
+def post_operations(request):
+    request.check_jsonapi_headers(ATOMIC_EXTENSION)
+    resources = request.get_store()
+    headers = [("Content-Type", ATOMIC_CONTENT_TYPE)]
+    try:
+        results = apply_operations(resources, request.body, request.host)
+    except OperationError as error:
+        return error.status, headers, error_object(error.status, error.detail, error.pointer)
+    return 200, headers, response_object({"atomic:results": results})
+
+
+def get_resource_events(request):
+    subscription = subscribe_events(request.get_store(), request.headers.get("last-event-id"),
+                                    MAX_SUBSCRIPTIONS)
+    return 200, [("Content-Type", EVENTS_CONTENT_TYPE), ("Cache-Control", "no-cache")], \
+           subscription
+
+
+def export_resources(request):
+    resources = request.get_store()
+    return 200, [("Content-Type", NDJSON_CONTENT_TYPE)], \
+           iter_export(resources, get_resource_or_none)
+
+
+def import_resources(request):
+    check_ndjson_content_type(request.headers.get("content-type", ""))
+    resources = request.get_store()
+    result = import_resources_into(resources, request.body.splitlines()).get_result()
+    return json_response(response_object(meta=result))
+
+
+def delete_resources(request):
+    request.get_store().clear()
+    return 204, [], ""
+
+
+def get_help_page(request):
+    return 200, [("Content-Type", HTML_CONTENT_TYPE)], \
+           HELP_PAGE.format(url=get_endpoint_url(request.host))
+
+
+def get_metrics(request):
+    return 200, [("Content-Type", METRICS_CONTENT_TYPE)], metrics.render()
+
+
+def server_static(request, filepath):
+    path = os.path.join(HERE, filepath)
+    if "/" in filepath or not os.path.isfile(path):
+        raise HTTPError(404, "File does not exist.")
+    with open(path, "rb") as file:
+        return 200, [("Content-Type", "text/css")], file.read()
+
+
+def route(request):
+    """Return the handler and the arguments for the request."""
+    path = request.path
+    method = ("GET" if request.method == "HEAD" else request.method)
+    if path == RESOURCES:
+        handlers = {"POST": add_resource, "DELETE": delete_resources}
+        args = ()
+    elif path == RESOURCES + "/ids":
+        handlers = {"GET": get_resource_ids}
+        args = ()
+    elif path == RESOURCES + "/events":
+        handlers = {"GET": get_resource_events}
+        args = ()
+    elif path == RESOURCES + "/delete":
+        handlers = {"POST": delete_some_resources}
+        args = ()
+    elif path.startswith(RESOURCES + "/") and "/" not in path[len(RESOURCES) + 1:]:
+        handlers = {"GET": get_resource, "DELETE": delete_resource,
+                    "PUT": put_resource, "PATCH": patch_resource}
+        args = (path[len(RESOURCES) + 1:],)
+    elif path == BASE + "/operations":
+        handlers = {"POST": post_operations}
+        args = ()
+    elif path == BASE + "/export":
+        handlers = {"GET": export_resources}
+        args = ()
+    elif path == BASE + "/import":
+        handlers = {"POST": import_resources}
+        args = ()
+    elif path in ("/", BASE):
+        handlers = {"GET": get_help_page}
+        args = ()
+    elif path == "/metrics":
+        handlers = {"GET": get_metrics}
+        args = ()
+    elif path.startswith(STATIC):
+        handlers = {"GET": server_static}
+        args = (path[len(STATIC):],)
+    else:
+        raise HTTPError(404, "Not found: {}".format(repr(path)))
+    handler = handlers.get(method)
+    if handler is None:
+        raise HTTPError(405, "Method not allowed.",
+                        Allow=",".join(sorted(handlers)))
+    return handler, args
+
+
+class ResourcesApp(object):
+    """The ASGI application of the resources api."""
+
+    async def __call__(self, scope, receive, send):
+        """Handle an ASGI connection."""
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        assert scope["type"] == "http", scope["type"]
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        status, headers, content = self.handle(Request(scope, body))
+        if isinstance(content, Subscription):
+            await self.send_events(content, status, headers, send)
+            return
+        if isinstance(content, types.GeneratorType):
+            await self.send_chunks(content, status, headers, send, scope["method"] == "HEAD")
+            return
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        headers.append((b"content-length", str(len(content)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body",
+                    "body": (b"" if scope["method"] == "HEAD" else content)})
+
+    async def send_chunks(self, chunks, status, headers, send, head=False):
+        """Send the chunks of bytes as they are created."""
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if not head:
+            for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send_events(self, subscription, status, headers, send):
+        """Send the events of the subscription until the stream ends."""
+        loop = asyncio.get_event_loop()
+        ready = asyncio.Event()
+        subscription.wake = lambda: loop.call_soon_threadsafe(ready.set)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        try:
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": RETRY, "more_body": True})
+            while True:
+                ready.clear()
+                chunks = []
+                event = subscription.get()
+                while event is not None:
+                    chunks.append(format_event(event))
+                    event = subscription.get()
+                if chunks:
+                    await send({"type": "http.response.body", "body": b"".join(chunks),
+                                "more_body": True})
+                elif subscription.overflowed:
+                    break
+                else:
+                    try:
+                        await asyncio.wait_for(ready.wait(), HEARTBEAT_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await send({"type": "http.response.body", "body": HEARTBEAT,
+                                    "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            events.unsubscribe(subscription)
+
+    def handle(self, request):
+        """Return the status, headers and content of the response."""
+        start = time.time()
+        route_name = "not_found"
+        try:
+            handler, args = route(request)
+            route_name = handler.__name__
+            result = handler(request, *args)
+        except HTTPError as error:
+            headers = [(name, value) for name, value in error.headerlist
+                       if name.lower() not in ("content-type", "content-length")]
+            result = json_response(error_object(error.status_code, error.body),
+                                   error.status_code, headers)
+        except Exception as error:
+            log.error("error", status=500, detail=repr(error),
+                      traceback=traceback.format_exc())
+            result = json_response(error_object(500, "Internal Server Error"), 500)
+        metrics.count("scrst_requests_total", route=route_name, status=result[0])
+        metrics.observe("scrst_request_duration_seconds", time.time() - start, route=route_name)
+        return result
+
+    async def lifespan(self, receive, send):
+        """Handle the start and the end of the server."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                warm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = ResourcesApp()
+
+
+class BadRequest(Exception):
+    """The request could not be parsed."""
+
+    status = 400
+
+
+class RequestTooLarge(BadRequest):
+    """The body of the request is larger than the server accepts."""
+
+    status = 413
+
+
+class AsgiServer(object):
+    """An HTTP/1.1 server for an ASGI application.
+
+    It supports persistent connections and chunked transfer encoding.
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=8080, keep_alive_timeout=75,
+                 max_header_size=65536, max_body_size=4 * 1024 * 1024, backlog=1024):
+        """Create a new server. Call serve_forever() to start it.
+
+        Requests with a body larger than max_body_size bytes get
+        a 413 response, so that clients can not fill the memory.
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.backlog = backlog
+        self._loop = None
+        self._server = None
+        self._started = Event()
+        self._writers = set() # of the open connections
+
+    def serve_forever(self):
+        """Serve until shutdown() is called."""
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._server = loop.run_until_complete(asyncio.start_server(
+                self._handle_connection, self.host or None, self.port,
+                backlog=self.backlog, limit=self.max_header_size))
+            self._started.set()
+            loop.run_forever()
+            self._server.close()
+            self._close_connections()
+            loop.run_until_complete(self._server.wait_closed())
+        finally:
+            self._started.set()
+            loop.close()
+
+    def _close_connections(self):
+        """Close the open connections and wait for their handlers.
+
+        Idle keep-alive connections would keep the server running
+        until their timeout.
+        """
+        loop = self._loop
+        for writer in list(self._writers):
+            writer.close()
+        all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+        tasks = [task for task in all_tasks(loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+    def get_port(self):
+        """Return the port of the server or None if it is not started."""
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    def shutdown(self):
+        """Stop the server."""
+        self._started.wait()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _handle_connection(self, reader, writer):
+        """Handle the requests of a connection."""
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(
+                        reader.readline(), self.keep_alive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                if not request_line.strip():
+                    continue
+                try:
+                    keep_alive = await self._handle_request(request_line, reader, writer)
+                except BadRequest as error:
+                    self._write_error(writer, error.status)
+                    break
+                if not keep_alive:
+                    break
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _write_error(self, writer, status):
+        """Write an error response and close the connection."""
+        content = error_object(status, errors[status]).encode("utf-8")
+        writer.write("HTTP/1.1 {} {}\r\nConnection: close\r\nContent-Type: {}\r\n"
+                     "Content-Length: {}\r\n\r\n".format(
+                         status, errors[status], API_CONTENT_TYPE, len(content)
+                     ).encode("latin-1") + content)
+
+    async def _read_headers(self, reader):
+        """Return the headers as a list of (lower case name, value) bytes."""
+        headers = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise BadRequest("connection closed")
+            if not line.strip():
+                return headers
+            name, colon, value = line.partition(b":")
+            if not colon:
+                raise BadRequest(line)
+            headers.append((name.strip().lower(), value.strip()))
+
+    async def _read_body(self, reader, headers):
+        """Return the body of the request."""
+        header = dict(headers)
+        if b"chunked" in header.get(b"transfer-encoding", b"").lower():
+            chunks = []
+            total = 0
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                total += size
+                if total > self.max_body_size:
+                    raise RequestTooLarge(total)
+                if size == 0:
+                    while (await reader.readline()).strip():
+                        pass # trailers
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+        length = header.get(b"content-length")
+        if length is None:
+            return b""
+        try:
+            length = int(length)
+        except ValueError:
+            raise BadRequest(length)
+        if length > self.max_body_size:
+            raise RequestTooLarge(length)
+        return await reader.readexactly(length)
+
+    async def _handle_request(self, request_line, reader, writer):
+        """Handle one request and return whether to keep the connection."""
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise BadRequest(request_line)
+        headers = await self._read_headers(reader)
+        header = dict(headers)
+        connection = header.get(b"connection", b"").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != b"close"
+        else:
+            keep_alive = connection == b"keep-alive"
+        if header.get(b"expect", b"").lower() == b"100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        body = await self._read_body(reader, headers)
+        path, _, query = target.partition("?")
+        peer = writer.get_extra_info("peername")
+        sockname = writer.get_extra_info("sockname")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": version.split("/")[-1],
+            "method": method.upper(),
+            "scheme": "http",
+            "path": unquote(path),
+            "raw_path": path.encode("latin-1"),
+            "query_string": query.encode("latin-1"),
+            "root_path": "",
+            "headers": headers,
+            "client": (peer[:2] if peer else None),
+            "server": (sockname[:2] if sockname else None),
+        }
+        disconnected = asyncio.Event()
+        state = {"received": False, "chunked": False, "started": False}
+
+        async def receive():
+            if not state["received"]:
+                state["received"] = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                return
+            content = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not state["started"]:
+                state["started"] = True
+                response_headers = list(state["start"].get("headers", []))
+                names = set(name.lower() for name, value in response_headers)
+                if b"content-length" not in names:
+                    if not more_body:
+                        response_headers.append((b"content-length", str(len(content)).encode()))
+                    elif version == "HTTP/1.1":
+                        state["chunked"] = True
+                        response_headers.append((b"transfer-encoding", b"chunked"))
+                    else:
+                        state["close"] = True
+                if not keep_alive or state.get("close"):
+                    response_headers.append((b"connection", b"close"))
+                status = state["start"]["status"]
+                head = ["HTTP/1.1 {} {}\r\n".format(status, errors.get(status, "")).encode("latin-1")]
+                for name, value in response_headers:
+                    head.append(name + b": " + value + b"\r\n")
+                head.append(b"\r\n")
+                writer.write(b"".join(head))
+            if state["chunked"]:
+                if content:
+                    writer.write("{:x}\r\n".format(len(content)).encode() + content + b"\r\n")
+                if not more_body:
+                    writer.write(b"0\r\n\r\n")
+            else:
+                writer.write(content)
+            await writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            disconnected.set()
+        return keep_alive and not state.get("close")
+
+
+def main():
+    """Start the server from the command line."""
+    port = (int(sys.argv[1]) if len(sys.argv) >= 2 else 8080)
+    warm_up()
+    AsgiServer(app, host="", port=port).serve_forever()
+
+
+__all__ = ["app", "ResourcesApp", "AsgiServer", "main"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""This module measures the memory the stores use for the resources.
+
+Generated resources, see the generator module, are added to each store
+through the data interface of the app or with HTTP requests to a
+ResourcesApiTestServer. The benchmark reports
+
+- bytes_per_resource: the memory the resources keep allocated
+- stored_bytes_per_resource: the size of a resource as the store counts it
+- peak_bytes: the most memory allocated while the resources are added
+- retained_bytes: the memory still allocated after delete_resources()
+- rss_*: the resident set size of the process before, at most,
+  after adding and after deleting the resources
+
+Memory is measured with tracemalloc, which requires Python 3.
+The results are written as JSON to compare them over time:
+
+    python -m schul_cloud_resources_server_tests.benchmark --count=100000 \\
+        --via=data --store=dict --store=dedup > memory.json
+"""
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from threading import Thread, Event
+from schul_cloud_resources_server_tests.app import data, get_id
+from schul_cloud_resources_server_tests.store import stores, get_store_class
+from schul_cloud_resources_server_tests.metrics import get_resident_memory
+from schul_cloud_resources_server_tests.generator import ResourceGenerator
+
+USER = "valid1@schul-cloud.org"
+PASSWORD = "123abc"
+
+
+def get_store_names():
+    """Return the names of the stores available on this platform."""
+    names = sorted(stores)
+    try:
+        import fcntl
+    except ImportError:
+        pass
+    else:
+        names.append("shared")
+    return names
+
+
+class ResidentMemorySampler(object):
+    """Sample the resident set size in a background thread."""
+
+    def __init__(self, interval=0.01):
+        """Create a new sampler."""
+        self.interval = interval
+        self.maximum = get_resident_memory()
+        self._stopped = Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self.maximum = max(self.maximum, get_resident_memory())
+
+    def __enter__(self):
+        self._thread = Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+        self.maximum = max(self.maximum, get_resident_memory())
+
+
+class DataLoader(object):
+    """Add resources to the store of the user through the data interface."""
+
+    def __enter__(self):
+        return self
+
+    def add(self, resources):
+        """Add the resources."""
+        store = data.get_store(USER)
+        for resource in resources:
+            store.add(get_id(), resource)
+
+    def __exit__(self, *args):
+        pass
+
+
+class HttpLoader(object):
+    """Add resources with requests to a server in this process.
+
+    The server and the validation are started before the measurement.
+    """
+
+    def __enter__(self):
+        import requests
+        from schul_cloud_resources_server_tests.tests.fixtures import ResourcesApiTestServer
+        self.server = ResourcesApiTestServer()
+        self.session = requests.Session()
+        self.session.auth = (USER, PASSWORD)
+        self.url = self.server.url + "/resources"
+        self.add(ResourceGenerator(-1).generate(1))
+        return self
+
+    def add(self, resources):
+        """Add the resources."""
+        for resource in resources:
+            response = self.session.post(self.url, json={
+                "data": {"type": "resource", "attributes": resource}})
+            if response.status_code != 201:
+                raise ValueError("{} {}".format(response.status_code, response.text))
+
+    def __exit__(self, *args):
+        self.session.close()
+        self.server.shutdown()
+
+
+LOADERS = {"data": DataLoader, "http": HttpLoader}
+
+
+def measure(store_name, count, via="data", seed=0):
+    """Return the memory used by count resources in a store as a dict."""
+    import tracemalloc
+    store_class = data.store_class
+    shared = _SharedLogFile() if store_name == "shared" else None
+    data.store_class = get_store_class(store_name)
+    try:
+        generator = ResourceGenerator(seed)
+        with LOADERS[via]() as loader:
+            data.delete_resources()
+            gc.collect()
+            rss_before = get_resident_memory()
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.get_traced_memory()[0]
+                start = time.time()
+                with ResidentMemorySampler() as sampler:
+                    loader.add(generator.generate(count))
+                duration = time.time() - start
+                gc.collect()
+                loaded, peak = tracemalloc.get_traced_memory()
+                rss_loaded = get_resident_memory()
+                stored_bytes_per_resource = data.get_bytes_per_resource()
+                stored = len(data.get_store(USER))
+                data.delete_resources()
+                gc.collect()
+                retained = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            rss_deleted = get_resident_memory()
+    finally:
+        data.store_class = store_class
+        data.delete_resources()
+        if shared is not None:
+            shared.close()
+    return {
+        "store": store_name,
+        "via": via,
+        "count": count,
+        "stored": stored,
+        "seconds": duration,
+        "bytes_per_resource": (loaded - baseline) / float(count or 1),
+        "stored_bytes_per_resource": stored_bytes_per_resource,
+        "peak_bytes": peak - baseline,
+        "retained_bytes": retained - baseline,
+        "rss_before": rss_before,
+        "rss_peak": sampler.maximum,
+        "rss_loaded": rss_loaded,
+        "rss_deleted": rss_deleted,
+        "python": sys.version.split()[0]
+    }
+
+
+class _SharedLogFile(object):
+    """Use a temporary file for the shared store of this process."""
+
+    def __init__(self):
+        from schul_cloud_resources_server_tests import shared_store
+        self._shared_store = shared_store
+        self._previous = shared_store._log
+        self.directory = tempfile.mkdtemp()
+        shared_store._log = shared_store.SharedLog(os.path.join(self.directory, "shared-store"))
+
+    def close(self):
+        self._shared_store._log.close()
+        self._shared_store._log = self._previous
+        shutil.rmtree(self.directory)
+
+
+def main(argv=None):
+    """Measure the stores from the command line and print JSON."""
+    parser = argparse.ArgumentParser(description="Measure the memory of the stores.")
+    parser.add_argument("--count", type=int, default=10000,
+                        help="the number of resources to add")
+    parser.add_argument("--via", choices=sorted(LOADERS), default="data",
+                        help="add the resources through the data interface or http")
+    parser.add_argument("--store", action="append", default=[],
+                        help="the stores to measure, all by default")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of the generated resources")
+    args = parser.parse_args(argv)
+    stdout = sys.stdout
+    sys.stdout = sys.stderr # the log of the server is not part of the result
+    try:
+        results = [measure(name, args.count, args.via, args.seed)
+                   for name in args.store or get_store_names()]
+    finally:
+        sys.stdout = stdout
+    json.dump(results, stdout, indent=2, sort_keys=True)
+    stdout.write("\n")
+
+
+__all__ = ["measure", "get_store_names", "main"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""This module keeps the stored resources within a budget.
+
+A public server gets resources from any crawler until its memory is full.
+The budget limits
+
+- the resources of all users: When there are too many resources
+  or they use too many bytes, the oldest resources are evicted.
+- the resources of one user: A user who has too many resources
+  or uses too many bytes can not add more resources.
+  The request gets a 507 Insufficient Storage response.
+- the time a resource is kept: Expired resources are not returned any more
+  and a background thread removes them from the stores.
+
+The bytes of all resources are counted as the stores count them,
+see Store.get_size(). A user is charged for the bytes of all of their
+resources, also if the store shares them with others, see Store.get_user_size().
+The budget learns about the resources as a listener of the stores.
+"""
+import time
+from collections import OrderedDict
+from threading import Thread, Lock
+from bottle import HTTPError
+
+get_time = getattr(time, "monotonic", time.time)
+
+USER_RESOURCES_ERROR = "You can not store more than {} resources. Please delete some."
+USER_BYTES_ERROR = "Your resources use more than {} bytes. Please delete some."
+RESOURCE_TOO_LARGE_ERROR = "The resource does not fit into the storage of the server."
+
+
+class Budget(object):
+    """The limits for the stored resources.
+
+    - get_store(user) returns the store of a user
+    - max_resources is the number of resources of all users
+    - max_bytes is the bytes used by all resources, see get_size
+    - max_user_resources is the number of resources a user can store
+    - max_user_bytes is the bytes a user can use
+    - ttl is the number of seconds a resource is kept
+    - sweep_interval is the number of seconds between the removal of expired resources
+    - get_size() returns the bytes used by all resources
+
+    None means no limit.
+    """
+
+    def __init__(self, get_store, max_resources=None, max_bytes=None,
+                 max_user_resources=None, max_user_bytes=None, ttl=None,
+                 sweep_interval=None, get_size=None):
+        """Create a new budget."""
+        self.get_store = get_store
+        self.get_size = get_size
+        self.evicted = 0 # resources removed because of the global limits
+        self.expired = 0 # resources removed because of the ttl
+        self._sweeper = None
+        self._lock = Lock()
+        self.configure(max_resources, max_bytes, max_user_resources,
+                       max_user_bytes, ttl, sweep_interval)
+
+    def configure(self, max_resources=None, max_bytes=None, max_user_resources=None,
+                  max_user_bytes=None, ttl=None, sweep_interval=None):
+        """Change the limits and forget about the stored resources."""
+        self.max_resources = max_resources
+        self.max_bytes = max_bytes
+        self.max_user_resources = max_user_resources
+        self.max_user_bytes = max_user_bytes
+        self.ttl = ttl
+        self.sweep_interval = (sweep_interval or (min(ttl, 60) if ttl else None))
+        with self._lock:
+            self._added = {} # user: OrderedDict(id: time), oldest first
+
+    @property
+    def active(self):
+        """Whether any limit is set."""
+        return any(limit is not None for limit in (
+            self.max_resources, self.max_bytes, self.max_user_resources,
+            self.max_user_bytes, self.ttl))
+
+    def record(self, operation, user, _id=None, resource=None):
+        """Remember when the resources were added.
+
+        This is a listener of the stores.
+        """
+        if not self.active:
+            return
+        with self._lock:
+            if operation == "add" or operation == "put":
+                added = self._added.get(user)
+                if added is None:
+                    added = self._added[user] = OrderedDict()
+                added.pop(_id, None) # a replaced resource is new
+                added[_id] = get_time()
+            elif operation == "delete":
+                self._added.get(user, {}).pop(_id, None)
+            elif operation == "clear":
+                self._added.pop(user, None)
+            elif operation == "reset":
+                self._added = {}
+        if self.ttl is not None and self._sweeper is None:
+            self._start_sweeper()
+
+    def admit(self, store, _id=None, count=1):
+        """Check that the user can add count resources to the store.
+
+        If the user reached a limit, this raises a 507 error.
+        Replacing an existing resource with the id is always possible.
+        """
+        if _id is not None and _id in store:
+            return
+        if self.max_user_resources is not None and \
+                len(store) + count > self.max_user_resources:
+            raise HTTPError(507, USER_RESOURCES_ERROR.format(self.max_user_resources))
+        if self.max_user_bytes is not None and store.get_user_size() >= self.max_user_bytes:
+            raise HTTPError(507, USER_BYTES_ERROR.format(self.max_user_bytes))
+
+    def _count(self):
+        """Return the number of resources of all users."""
+        with self._lock:
+            return sum(map(len, self._added.values()))
+
+    def _is_over_budget(self):
+        """Whether the resources of all users exceed the budget."""
+        return self.max_resources is not None and self._count() > self.max_resources or \
+            self.max_bytes is not None and self.get_size() > self.max_bytes
+
+    def _get_oldest(self, keep):
+        """Return the user and id of the oldest resource but keep or None."""
+        oldest = None
+        with self._lock:
+            for user, added in self._added.items():
+                for _id, added_time in added.items():
+                    if (user, _id) != keep:
+                        if oldest is None or added_time < oldest[0]:
+                            oldest = (added_time, user, _id)
+                        break
+        return (None if oldest is None else oldest[1:])
+
+    def enforce(self, user, _id):
+        """Evict the oldest resources until all resources are within the budget.
+
+        The resource with the id which was just added is not evicted.
+        If it does not fit on its own, it is removed and a 507 error is raised.
+        """
+        if self.max_resources is None and self.max_bytes is None:
+            return
+        while self._is_over_budget():
+            oldest = self._get_oldest((user, _id))
+            if oldest is None:
+                self.get_store(user).pop(_id)
+                raise HTTPError(507, RESOURCE_TOO_LARGE_ERROR)
+            if self.get_store(oldest[0]).pop(oldest[1]) is None:
+                # deleted in the meantime
+                with self._lock:
+                    self._added.get(oldest[0], {}).pop(oldest[1], None)
+            else:
+                self.evicted += 1
+
+    def is_expired(self, user, _id):
+        """Whether the resource of the user is older than the ttl."""
+        if self.ttl is None:
+            return False
+        added = self._added.get(user, {}).get(_id)
+        return added is not None and get_time() - added > self.ttl
+
+    def get_ids(self, store):
+        """Return the ids of the resources in the store which are not expired."""
+        if self.ttl is None:
+            return store
+        return [_id for _id in store if not self.is_expired(store.user, _id)]
+
+    def sweep(self):
+        """Remove the expired resources from the stores."""
+        if self.ttl is None:
+            return
+        deadline = get_time() - self.ttl
+        with self._lock:
+            expired = []
+            for user, added in self._added.items():
+                for _id, added_time in added.items():
+                    if added_time >= deadline:
+                        break # the others are younger
+                    expired.append((user, _id))
+        for user, _id in expired:
+            try:
+                store = self.get_store(user)
+            except KeyError:
+                continue
+            if store.pop(_id) is not None:
+                self.expired += 1
+
+    def _start_sweeper(self):
+        """Start the thread which removes the expired resources."""
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = Thread(target=self._sweep_loop)
+            self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        """Remove the expired resources from time to time."""
+        while True:
+            time.sleep(self.sweep_interval or 60)
+            self.sweep()
+
+    @classmethod
+    def from_environment(cls, environ, get_store, get_size):
+        """Create a budget configured by environment variables.
+
+        - SCRST_MAX_RESOURCES resources of all users
+        - SCRST_MAX_BYTES bytes used by all resources
+        - SCRST_USER_MAX_RESOURCES resources of a user
+        - SCRST_USER_MAX_BYTES bytes used by a user
+        - SCRST_TTL seconds a resource is kept
+        - SCRST_SWEEP_INTERVAL seconds between the removal of expired resources
+        """
+        def get(name, convert):
+            value = environ.get(name)
+            return (convert(value) if value else None)
+        return cls(get_store, get("SCRST_MAX_RESOURCES", int), get("SCRST_MAX_BYTES", int),
+                   get("SCRST_USER_MAX_RESOURCES", int), get("SCRST_USER_MAX_BYTES", int),
+                   get("SCRST_TTL", float), get("SCRST_SWEEP_INTERVAL", float),
+                   get_size=get_size)
+
+
+__all__ = ["Budget"]
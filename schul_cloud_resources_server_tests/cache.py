@@ -0,0 +1,85 @@
+"""This module caches the encoded responses which list the ids of a user.
+
+Clients which synchronize ask for the ids again and again.
+The cache keeps the encoded response for each user and host until the
+resources of the user change. Each change increases the version of the
+user's resources, which makes the cached responses of the user stale.
+
+Other processes change a shared store without notifying the listeners,
+so the store can also give a version, see Store.get_version().
+
+The least recently used responses are removed when the cache
+holds more than max_bytes, see SCRST_IDS_CACHE_BYTES.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResponseCache(object):
+    """Encoded responses by user and host, valid for one version of the resources.
+
+    The cache is a listener of the stores.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        """Create an empty cache."""
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._versions = {} # user: number of changes
+        self._responses = OrderedDict() # (user, host): (version, content)
+        self._size = 0
+        self._lock = Lock()
+
+    def record(self, operation, user, _id=None, resource=None):
+        """Make the responses of the user stale.
+
+        This is a listener of the stores.
+        """
+        with self._lock:
+            if operation == "reset":
+                self._versions = {}
+                self._responses = OrderedDict()
+                self._size = 0
+            else:
+                self._versions[user] = self._versions.get(user, 0) + 1
+
+    def get(self, user, host, create, store_version=None):
+        """Return the response for the user and host.
+
+        create() returns the response as bytes if it is not cached.
+        The response is stale if the store_version changed.
+        """
+        key = (user, host)
+        with self._lock:
+            version = (self._versions.get(user, 0), store_version)
+            entry = self._responses.get(key)
+            if entry is not None and entry[0] == version:
+                # most recently used is last
+                del self._responses[key]
+                self._responses[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        content = create()
+        if len(content) > self.max_bytes:
+            return content
+        with self._lock:
+            if self._versions.get(user, 0) != version[0]:
+                return content # changed while the response was created
+            old = self._responses.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._responses[key] = (version, content)
+            self._size += len(content)
+            while self._size > self.max_bytes:
+                old_key, old = self._responses.popitem(last=False)
+                self._size -= len(old[1])
+        return content
+
+    def get_size(self):
+        """Return the bytes of the cached responses."""
+        return self._size
+
+
+__all__ = ["ResponseCache"]
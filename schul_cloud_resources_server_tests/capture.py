@@ -0,0 +1,143 @@
+"""This module records the requests to a server for replay.
+
+Capture is WSGI middleware which writes one JSON object per request
+to a log, see the log module:
+
+- start is the number of seconds since the capture started
+- method, path, query and body of the request
+- headers without the secrets, see SECRET_HEADERS
+- auth and user identify the user without the password or api key
+- status, location and duration of the response
+
+Event streams are not recorded.
+An export is recorded when it ends, so its content is not held in memory.
+
+Start the server with SCRST_CAPTURE=<file> to capture its requests.
+The replay module sends them to another server.
+"""
+import io
+import time
+import base64
+from bottle import parse_auth, touni
+from schul_cloud_resources_server_tests.events import CONTENT_TYPE as EVENTS_CONTENT_TYPE
+from schul_cloud_resources_server_tests.transfer import CONTENT_TYPE as NDJSON_CONTENT_TYPE
+
+# headers which are not recorded
+SECRET_HEADERS = ("HTTP_AUTHORIZATION", "HTTP_PROXY_AUTHORIZATION", "HTTP_COOKIE", "HTTP_X_PROFILE")
+# larger bodies are not recorded
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def identify(header):
+    """Return the authentication method and the user name of the Authorization header.
+
+    The method is "noauth", "basic" or "apikey".
+    The user name is None if it is not known.
+    """
+    if not header:
+        return "noauth", None
+    basic = parse_auth(header)
+    if basic:
+        return "basic", basic[0]
+    if header.lower().startswith("api-key"):
+        return "apikey", None
+    return "invalid", None
+
+
+def encode_body(body):
+    """Return the body as a JSON value."""
+    try:
+        return touni(body.decode("utf-8"))
+    except UnicodeDecodeError:
+        return {"base64": touni(base64.b64encode(body))}
+
+
+def decode_body(body):
+    """Return the bytes of a body which was encoded by encode_body()."""
+    if isinstance(body, dict):
+        return base64.b64decode(body["base64"])
+    return body.encode("utf-8")
+
+
+class Capture(object):
+    """WSGI middleware which writes the requests to a log.
+
+    - app is the WSGI application
+    - log is a Logger from the log module
+    - identify(header) returns the authentication method and the user name
+    """
+
+    def __init__(self, app, log, identify=identify):
+        """Capture the requests to the app."""
+        self.app = app
+        self.log = log
+        self.identify = identify
+        self.started = time.time()
+
+    def __call__(self, environ, start_response):
+        start = time.time()
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        body = (environ["wsgi.input"].read(length) if length else b"")
+        environ["wsgi.input"] = io.BytesIO(body)
+        response = {}
+        def capture_start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            for name, value in headers:
+                if name.lower() == "location":
+                    response["location"] = value
+                if name.lower() == "content-type" and value.startswith(EVENTS_CONTENT_TYPE):
+                    response["stream"] = "events"
+                elif name.lower() == "content-type" and value.startswith(NDJSON_CONTENT_TYPE):
+                    response["stream"] = "export"
+            if exc_info is None:
+                return start_response(status, headers)
+            return start_response(status, headers, exc_info)
+        result = self.app(environ, capture_start_response)
+        stream = response.pop("stream", None)
+        if stream == "events":
+            # an event stream does not end and can not be replayed
+            return result
+        if stream == "export":
+            return self._record_at_end(result, environ, start, body, response)
+        try:
+            content = list(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        self._record(environ, start, body, response)
+        return content
+
+    def _record_at_end(self, result, environ, start, body, response):
+        """Pass the chunks of the result on and record the request when it ends."""
+        try:
+            for chunk in result:
+                yield chunk
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+            self._record(environ, start, body, response)
+
+    def _record(self, environ, start, body, response):
+        """Write the request and its response to the log."""
+        auth, user = self.identify(environ.get("HTTP_AUTHORIZATION"))
+        headers = dict((name[5:].replace("_", "-").title(), value)
+                       for name, value in environ.items()
+                       if name.startswith("HTTP_") and name not in SECRET_HEADERS)
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        record = dict(
+            start=start - self.started, method=environ["REQUEST_METHOD"],
+            path=environ.get("PATH_INFO", ""), query=environ.get("QUERY_STRING", ""),
+            headers=headers, auth=auth, user=user,
+            duration=time.time() - start, **response)
+        if len(body) <= MAX_BODY_SIZE:
+            record["body"] = encode_body(body)
+        else:
+            record["body_size"] = len(body)
+        self.log.info("capture", **record)
+
+
+__all__ = ["Capture", "identify", "encode_body", "decode_body"]
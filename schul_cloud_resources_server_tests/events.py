@@ -0,0 +1,171 @@
+"""This module sends the changes of the resources as Server-Sent Events.
+
+Clients which wait for new resources ask for the ids again and again.
+Instead, they can keep a connection to GET /v1/resources/events open
+and get an event when a resource of their user is added, replaced or deleted:
+
+    id: 42
+    event: add
+    data: {"id": "cornelsen-physics-1"}
+
+The events are "add", "put", "delete" and "clear".
+The stream keeps the latest events. A client which reconnects with the
+Last-Event-ID header gets the events it missed. If they are not kept
+any more, it gets a "reset" event and should list the ids again.
+
+Each subscriber has a queue of limited size. The stores do not wait for
+slow subscribers: a subscriber whose queue is full gets the events in
+its queue and then the stream ends, so the client reconnects and
+continues with the Last-Event-ID.
+"""
+import json
+import time
+from collections import deque
+from threading import Lock
+try:
+    from queue import Queue, Full, Empty
+except ImportError:
+    from Queue import Queue, Full, Empty
+
+CONTENT_TYPE = "text/event-stream"
+# the first chunk of a stream, clients reconnect after one second
+RETRY = b"retry: 1000\n\n"
+# a comment which keeps the connection open and shows when the client is gone
+HEARTBEAT = b": heartbeat\n\n"
+# the events of the operations of the stores
+EVENT_NAMES = {"add": "add", "put": "put", "delete": "delete", "clear": "clear", "reset": "clear"}
+
+
+def format_event(event):
+    """Return an event as it is sent in the stream."""
+    sequence, name, _id = event
+    data = ({} if _id is None else {"id": _id})
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        sequence, name, json.dumps(data)).encode("utf-8")
+
+
+class Subscription(object):
+    """The events of one user for one client.
+
+    - queue_size is the number of events which wait to be sent
+    - wake() is called when an event arrives
+    """
+
+    def __init__(self, user, queue_size=1000, wake=None):
+        """Create a subscription without events."""
+        self.user = user
+        self.overflowed = False
+        self.wake = wake
+        self._queue = Queue(queue_size)
+
+    def put(self, event):
+        """Add an event without waiting."""
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            self.overflowed = True
+        if self.wake is not None:
+            self.wake()
+
+    def get(self, timeout=None):
+        """Return the next event or None if there is none within timeout seconds."""
+        try:
+            if not timeout:
+                return self._queue.get_nowait()
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class EventStream(object):
+    """The changes of the stores for the subscribers.
+
+    - max_events is the number of events which are kept for reconnecting clients
+    - queue_size is the number of events which wait for a subscriber
+
+    The stream is a listener of the stores.
+    """
+
+    def __init__(self, max_events=1000, queue_size=1000):
+        """Create a stream without events and subscribers."""
+        self.queue_size = queue_size
+        self.sequence = 0
+        self._events = deque(maxlen=max_events) # (sequence, user, name, id, everyone)
+        self._subscriptions = []
+        self._lock = Lock()
+
+    def record(self, operation, user, _id=None, resource=None):
+        """Send the change to the subscribers of the user.
+
+        This is a listener of the stores.
+        """
+        name = EVENT_NAMES[operation]
+        everyone = operation == "reset"
+        with self._lock:
+            self.sequence += 1
+            self._events.append((self.sequence, user, name, _id, everyone))
+            event = (self.sequence, name, _id)
+            for subscription in self._subscriptions:
+                if everyone or subscription.user == user:
+                    subscription.put(event)
+
+    def subscribe(self, user, last_event_id=None, wake=None):
+        """Return a subscription to the events of the user.
+
+        If last_event_id is given, the events after it are sent first.
+        """
+        subscription = Subscription(user, self.queue_size, wake)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._get_missed(user, last_event_id):
+                    subscription.put(event)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _get_missed(self, user, last_event_id):
+        """Return the events of the user after the event id."""
+        try:
+            last = int(last_event_id)
+        except ValueError:
+            last = None
+        first = (self._events[0][0] if self._events else self.sequence + 1)
+        if last is None or last > self.sequence or last + 1 < first:
+            # the server restarted or the events are not kept
+            return [(self.sequence, "reset", None)]
+        return [(sequence, name, _id) for sequence, event_user, name, _id, everyone
+                in self._events if sequence > last and (everyone or event_user == user)]
+
+    def unsubscribe(self, subscription):
+        """Stop sending events to the subscription."""
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def count_subscriptions(self):
+        """Return the number of subscriptions."""
+        return len(self._subscriptions)
+
+    def iter_events(self, subscription, is_closed=lambda: False,
+                    heartbeat_interval=15, poll_interval=1):
+        """Yield the events of the subscription as chunks of a response.
+
+        This ends when the subscription overflowed or is_closed() returns True.
+        """
+        try:
+            yield RETRY
+            last_sent = time.time()
+            while not is_closed():
+                event = subscription.get(poll_interval)
+                if event is not None:
+                    yield format_event(event)
+                    last_sent = time.time()
+                elif subscription.overflowed:
+                    return
+                elif time.time() - last_sent >= heartbeat_interval:
+                    yield HEARTBEAT
+                    last_sent = time.time()
+        finally:
+            self.unsubscribe(subscription)
+
+
+__all__ = ["EventStream", "Subscription", "format_event", "CONTENT_TYPE", "RETRY", "HEARTBEAT"]
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""This module generates many valid resources for load tests.
+
+The resources follow the resource schema: All required attributes are set
+and the content categories are taken from the schema.
+The values are drawn from distributions which resemble a real collection,
+e.g. most resources are German web pages, some are videos with a duration
+and some have long titles and descriptions.
+
+The same seed generates the same resources.
+Write a million resources as one JSON object per line with
+
+    python -m schul_cloud_resources_server_tests.generator 1000000 \\
+        --seed=1 > resources.ndjson
+"""
+import sys
+import json
+import random
+import argparse
+
+# (value, weight)
+LANGUAGES = [("de-de", 55), ("en-en", 15), ("de", 10), ("en", 5), ("fr-fr", 4),
+             ("es-es", 3), ("tr-tr", 3), ("ru-ru", 2), ("it-it", 2), ("pl-pl", 1)]
+MIME_TYPES = [("text/html", 45), ("application/pdf", 20), ("video/mp4", 10),
+              ("image/jpeg", 7), ("image/png", 5), ("audio/mpeg", 4),
+              ("video/webm", 3), ("application/vnd.openxmlformats-officedocument"
+               ".presentationml.presentation", 3), ("application/zip", 2),
+              ("text/plain", 1)]
+LICENSES = [(None, 40), ("cc-by-4.0", 15), ("cc-by-sa-4.0", 15), ("cc-zero", 8),
+            ("cc-by-sa-3.0", 7), ("cc-by-nc-sa-4.0", 6), ("cc-by-nd-4.0", 3),
+            ("proprietary", 6)]
+CONTENT_CATEGORIES = {"l": 60, "rl": 20, "a": 12, "t": 8}
+PROVIDERS = [("Schul-Cloud", "schul-cloud.org", 20), ("YouTube", "www.youtube.com", 15),
+             ("Wikipedia", "de.wikipedia.org", 15), ("Serlo", "de.serlo.org", 10),
+             ("Khan Academy", "www.khanacademy.org", 8), ("LEIFIphysik", "www.leifiphysik.de", 6),
+             ("planet-schule", "www.planet-schule.de", 6), ("Geogebra", "www.geogebra.org", 5),
+             ("ZUM", "www.zum.de", 5), ("Lehrer-Online", "www.lehrer-online.de", 5),
+             ("OpenStax", "openstax.org", 3), ("Europeana", "www.europeana.eu", 2)]
+WORDS = (u"Einführung Grundlagen Übungen Arbeitsblatt Experiment Geschichte Mathematik "
+         u"Physik Chemie Biologie Deutsch Englisch Informatik Geografie Musik Kunst "
+         u"Bruchrechnung Photosynthese Gleichungen Mittelalter Klimawandel Elektrizität "
+         u"Algorithmen Grammatik Vokabeln Quiz Video Lösungen Klasse Sekundarstufe "
+         u"introduction basics exercises worksheet lesson history energy cells fractions "
+         u"programming reading writing the of and for with in").split()
+TAGS = (u"Mathematik Physik Chemie Biologie Informatik Deutsch Englisch Geschichte "
+        u"Sekundarstufe-I Sekundarstufe-II Grundschule Abitur OER Video Arbeitsblatt "
+        u"Experiment interaktiv Quiz open-source").split()
+
+
+def _table(pairs):
+    """Return a list in which each value occurs as often as its weight."""
+    table = []
+    for pair in pairs:
+        table.extend([pair[0]] * pair[-1])
+    return table
+
+
+class ResourceGenerator(object):
+    """Generate valid resources.
+
+    - seed makes the resources reproducible
+    - schema is the resource schema, the one of the api by default
+
+    Iterate over the generator for an endless stream of resources
+    or call generate(count).
+    """
+
+    def __init__(self, seed=0, schema=None):
+        """Create a new generator."""
+        if schema is None:
+            from schul_cloud_resources_api_v1.schema import get_resource_schema
+            schema = get_resource_schema()
+        self.seed = seed
+        self.required = list(schema["required"])
+        self.properties = set(schema["properties"])
+        categories = schema["definitions"]["ContentCategory"]["enum"]
+        self._random = random.Random(seed)
+        self._count = 0
+        self._languages = _table(LANGUAGES)
+        self._mime_types = _table(MIME_TYPES)
+        self._licenses = _table(LICENSES)
+        self._categories = _table([(category, CONTENT_CATEGORIES.get(category, 1))
+                                   for category in categories])
+        self._providers = _table([((name, host), weight)
+                                  for name, host, weight in PROVIDERS])
+
+    def _words(self, count):
+        """Return a text of count random words."""
+        words = WORDS
+        choose = self._random.random
+        return " ".join([words[int(choose() * len(words))] for i in range(count)])
+
+    def _title_length(self):
+        """Return the number of words of a title.
+
+        Most titles are short but some are very long.
+        """
+        return min(int(self._random.lognormvariate(1.5, 0.6)) + 1, 60)
+
+    def resource(self):
+        """Return a new resource."""
+        rnd = self._random.random
+        self._count += 1
+        provider, host = self._providers[int(rnd() * len(self._providers))]
+        mime_type = self._mime_types[int(rnd() * len(self._mime_types))]
+        language = self._languages[int(rnd() * len(self._languages))]
+        languages = [language]
+        if rnd() < 0.1:
+            other = self._languages[int(rnd() * len(self._languages))]
+            if other != language:
+                languages.append(other)
+        license = self._licenses[int(rnd() * len(self._licenses))]
+        licenses = ([] if license is None else
+                    [{"value": license, "copyrighted": license == "proprietary"}])
+        resource = {
+            "title": self._words(self._title_length()),
+            "url": "https://{}/r/{}-{}".format(host, self.seed, self._count),
+            "licenses": licenses,
+            "mimeType": mime_type,
+            "contentCategory": self._categories[int(rnd() * len(self._categories))],
+            "languages": languages,
+            "providerName": provider
+        }
+        if rnd() < 0.5:
+            resource["description"] = self._words(int(self._random.expovariate(1 / 40.0)) + 1)
+        if rnd() < 0.4:
+            resource["tags"] = [TAGS[int(rnd() * len(TAGS))]
+                                for i in range(int(rnd() * 5) + 1)]
+        if rnd() < 0.3:
+            resource["thumbnail"] = "https://{}/thumbnails/{}.jpg".format(host, self._count)
+        if mime_type.startswith(("video/", "image/")):
+            resource["dimensions"] = "{}pxX{}px".format(*(
+                ((640, 480), (1280, 720), (1920, 1080), (800, 600))[int(rnd() * 4)]))
+        if mime_type.startswith(("video/", "audio/")):
+            seconds = int(self._random.expovariate(1 / 600.0)) + 1
+            resource["duration"] = "PT{}M{}S".format(seconds // 60, seconds % 60)
+        return resource
+
+    def generate(self, count):
+        """Return an iterator over count new resources."""
+        for i in range(count):
+            yield self.resource()
+
+    def __iter__(self):
+        while True:
+            yield self.resource()
+
+
+def write_ndjson(resources, stream):
+    """Write the resources as one JSON object per line."""
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    for resource in resources:
+        stream.write(dumps(resource))
+        stream.write("\n")
+
+
+def read_ndjson(stream):
+    """Return an iterator over the resources of an NDJSON file."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def main(argv=None):
+    """Write generated resources to the standard output."""
+    parser = argparse.ArgumentParser(description="Generate valid resources as NDJSON.")
+    parser.add_argument("count", type=int, help="the number of resources")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of the random numbers")
+    args = parser.parse_args(argv)
+    write_ndjson(ResourceGenerator(args.seed).generate(args.count), sys.stdout)
+
+
+__all__ = ["ResourceGenerator", "write_ndjson", "read_ndjson", "main"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""This module makes the resources of the server survive a restart.
+
+All changes are appended to a journal in a directory.
+From time to time, a snapshot of all resources is written
+and the journal starts anew.
+When the server starts, it loads the latest snapshot and
+replays the journal written after the snapshot.
+
+The directory contains these files:
+
+- snapshot.<n> all resources before journal.<n> was started
+- journal.<n> one JSON list per line, one line per operation
+"""
+import os
+import re
+import json
+from threading import Thread, Lock, Event
+
+FILE_NAME = re.compile("^(snapshot|journal)\\.(\\d+)$")
+
+
+class Journal(object):
+    """An append-only journal of the operations on the stores.
+
+    The operations are written in batches by a background thread
+    which syncs each batch to the disk.
+    At most sync_interval seconds of operations can be lost if
+    the process dies.
+    After snapshot_interval operations, a new snapshot is written.
+    """
+
+    def __init__(self, directory, sync_interval=0.1, snapshot_interval=10000):
+        """Create a journal in the directory."""
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.snapshot_interval = snapshot_interval
+        self._lock = Lock()
+        self._sync_lock = Lock()
+        self._lines = []
+        self._file = None
+        self._number = 0
+        self._operations = 0
+        self._stopped = Event()
+        self._thread = None
+        self._snapshot_thread = None
+
+    def _path(self, kind, number):
+        """Return the path of a file in the journal directory."""
+        return os.path.join(self.directory, "{}.{}".format(kind, number))
+
+    def _list(self, kind):
+        """Return the sorted numbers of the files of a kind."""
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = FILE_NAME.match(name)
+            if match and match.group(1) == kind:
+                numbers.append(int(match.group(2)))
+        return sorted(numbers)
+
+    def load(self, apply):
+        """Replay the latest snapshot and the journal after it.
+
+        apply(operation, user, _id, resource) is called for every
+        operation. A snapshot consists of "add" operations.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        snapshots = self._list("snapshot")
+        start = (snapshots[-1] if snapshots else 0)
+        if snapshots:
+            with open(self._path("snapshot", start)) as file:
+                for line in file:
+                    user, _id, resource = json.loads(line)
+                    apply("add", user, _id, resource)
+        journals = [number for number in self._list("journal") if number >= start]
+        for number in journals:
+            with open(self._path("journal", number)) as file:
+                for line in file:
+                    try:
+                        operation = json.loads(line)
+                    except ValueError:
+                        break # the last line was not written completely
+                    apply(*operation)
+        self._number = (journals[-1] if journals else start)
+
+    def open(self, get_stores):
+        """Start journaling and write a snapshot of the loaded resources.
+
+        get_stores() returns the stores to write into a snapshot.
+        """
+        self._get_stores = get_stores
+        self._close(self._rotate())
+        self._thread = Thread(target=self._sync_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, operation, user=None, _id=None, resource=None):
+        """Record an operation.
+
+        This can be used as a listener of the stores.
+        """
+        if operation in ("add", "put"):
+            arguments = [operation, user, _id, resource]
+        elif operation == "delete":
+            arguments = [operation, user, _id]
+        else:
+            arguments = [operation, user]
+        line = json.dumps(arguments, separators=(",", ":"))
+        old_file = None
+        with self._lock:
+            self._lines.append(line + "\n")
+            self._operations += 1
+            if self._operations >= self.snapshot_interval:
+                old_file = self._rotate()
+        # the other writers do not wait for the disk
+        self._close(old_file)
+
+    def _rotate(self):
+        """Start a new journal and write a snapshot for it.
+
+        This must be called with the lock held or before the sync thread runs.
+        The stores are copied now and written in the background.
+        Return the previous journal file which the caller closes with _close().
+        """
+        self._write()
+        old_file = self._file
+        self._number += 1
+        self._operations = 0
+        self._file = open(self._path("journal", self._number), "a")
+        stores = [store.copy() for store in self._get_stores()]
+        self._snapshot_thread = Thread(target=self._write_snapshot,
+                                       args=(self._number, stores))
+        self._snapshot_thread.daemon = True
+        self._snapshot_thread.start()
+        return old_file
+
+    def _close(self, file):
+        """Sync a previous journal file to the disk and close it."""
+        if file is None:
+            return
+        with self._sync_lock:
+            os.fsync(file.fileno())
+            file.close()
+
+    def _write_snapshot(self, number, stores):
+        """Write a snapshot and remove the files it replaces."""
+        path = self._path("snapshot", number)
+        with open(path + ".tmp", "w") as file:
+            for store in stores:
+                for _id, resource in store.items():
+                    file.write(json.dumps([store.user, _id, resource], separators=(",", ":")))
+                    file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(path + ".tmp", path)
+        for kind in ("snapshot", "journal"):
+            for old in self._list(kind):
+                if old < number:
+                    os.remove(self._path(kind, old))
+
+    def _write(self):
+        """Write the recorded operations to the journal file.
+
+        This must be called with the lock held.
+        Return whether operations were written.
+        """
+        lines = self._lines
+        if not lines or self._file is None:
+            return False
+        self._lines = []
+        self._file.write("".join(lines))
+        self._file.flush()
+        return True
+
+    def _sync(self):
+        """Write the recorded operations and sync them to the disk.
+
+        The recording is not blocked while the disk syncs.
+        """
+        with self._lock:
+            if not self._write():
+                return
+            file = self._file
+        with self._sync_lock:
+            if not file.closed:
+                os.fsync(file.fileno())
+
+    def _sync_loop(self):
+        """Write the recorded operations in batches."""
+        while not self._stopped.wait(self.sync_interval):
+            self._sync()
+
+    def close(self):
+        """Write the remaining operations and stop journaling."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sync()
+        with self._lock:
+            self._file.close()
+            if self._snapshot_thread is not None:
+                self._snapshot_thread.join()
+
+
+__all__ = ["Journal"]
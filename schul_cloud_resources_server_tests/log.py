@@ -0,0 +1,156 @@
+"""This module writes the log of the server.
+
+Log records are JSON objects, one per line.
+They are put into a queue and written by a background thread,
+so that a request does not wait for the output.
+The lines are text with only ASCII characters, so they can be written
+to text streams such as io.StringIO and to files under Python 2 and 3.
+"""
+import sys
+import json
+import time
+import random
+from threading import Thread, Lock
+from bottle import HTTPResponse, request, response, touni
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class Logger(object):
+    """A logger which writes JSON lines from a background thread.
+
+    - level is the lowest level which is written
+    - sample_rate is the fraction of the records below "warning" which is written
+    - max_queue is the number of records kept before records are dropped
+    - stream is the file to write to, sys.stdout by default
+
+    The logger is also a bottle plugin which writes a record for each request.
+    """
+
+    name = "log"
+    api = 2
+
+    def __init__(self, stream=None, level="info", sample_rate=1.0, max_queue=10000):
+        """Create a new logger."""
+        self.stream = stream
+        self.level = level
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.write_errors = 0
+        self._queue = Queue(max_queue)
+        self._thread = None
+        self._start_lock = Lock()
+
+    @property
+    def level(self):
+        """The lowest level which is written."""
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+        self._level_number = LEVELS[level]
+
+    def log(self, level, event, **fields):
+        """Write a record about an event."""
+        number = LEVELS[level]
+        if number < self._level_number:
+            return
+        if number < LEVELS["warning"] and self.sample_rate < 1 and \
+                random.random() >= self.sample_rate:
+            return
+        fields["time"] = time.time()
+        fields["level"] = level
+        fields["event"] = event
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(fields)
+        except Full:
+            self.dropped += 1
+
+    def debug(self, event, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event, **fields):
+        self.log("error", event, **fields)
+
+    def _start(self):
+        """Start the thread which writes the records."""
+        with self._start_lock:
+            if self._thread is None:
+                thread = Thread(target=self._write_loop)
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _write_loop(self):
+        """Write the records in batches."""
+        while True:
+            records = [self._queue.get()]
+            try:
+                while len(records) < 1000:
+                    records.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            lines = [touni(json.dumps(record, default=repr)) + u"\n" for record in records]
+            stream = (sys.stdout if self.stream is None else self.stream)
+            try:
+                stream.write(u"".join(lines))
+                stream.flush()
+            except Exception:
+                # e.g. a closed pipe, the thread must keep running
+                self.write_errors += 1
+                self.dropped += len(records)
+            finally:
+                for record in records:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Wait until all records are written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def apply(self, callback, route):
+        """Write a record for each request to the route."""
+        def log_wrapper(*args, **kw):
+            start = time.time()
+            status = 500
+            fields = {}
+            try:
+                result = callback(*args, **kw)
+                status = response.status_code
+                return result
+            except HTTPResponse as error:
+                status = error.status_code
+                if status >= 400:
+                    fields["detail"] = error.body
+                raise
+            finally:
+                self.info("request", route=route.name or route.callback.__name__,
+                          status=status, method=request.method, path=request.path,
+                          duration=time.time() - start, **fields)
+        return log_wrapper
+
+    @classmethod
+    def from_environment(cls, environ):
+        """Create a logger configured by environment variables.
+
+        - SCRST_LOG_LEVEL is one of debug, info, warning and error
+        - SCRST_LOG_SAMPLE_RATE is the fraction of info and debug records to write
+        """
+        return cls(level=environ.get("SCRST_LOG_LEVEL", "info"),
+                   sample_rate=float(environ.get("SCRST_LOG_SAMPLE_RATE", "1")))
+
+
+__all__ = ["Logger", "LEVELS"]
@@ -0,0 +1,168 @@
+"""This module measures the server for monitoring.
+
+The metrics are served in the Prometheus text format, see
+https://prometheus.io/docs/instrumenting/exposition_formats/
+
+Each thread counts in its own dictionary so that no lock is needed
+when a request is measured. The dictionaries are added up when the
+metrics are requested.
+"""
+import os
+import sys
+import time
+from bisect import bisect_left
+from threading import local, Lock
+from bottle import HTTPResponse, response
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value):
+    """Escape a label value."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    """Return the labels as text, labels is a tuple of (name, value) pairs."""
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, escape(value)) for name, value in labels) + "}"
+
+
+def get_resident_memory():
+    """Return the resident set size of this process in bytes or None."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # this is the maximum, not the current value
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (maxrss if sys.platform == "darwin" else maxrss * 1024)
+
+
+class Metrics(object):
+    """The metrics of the server.
+
+    The metrics object is a bottle plugin which counts the requests
+    and measures their duration by route and status.
+    """
+
+    name = "metrics"
+    api = 2
+
+    def __init__(self, buckets=BUCKETS):
+        """Create new empty metrics."""
+        self.buckets = buckets
+        self._local = local()
+        self._values = [] # the values of all threads
+        self._lock = Lock()
+        self._descriptions = {} # name: (type, help)
+        self._gauges = [] # functions returning (name, labels, value)
+
+    def describe(self, name, type, help):
+        """Set the type and the help text of a metric."""
+        self._descriptions[name] = (type, help)
+
+    def gauge(self, function):
+        """Add a function which returns a list of (name, labels, value).
+
+        The function is called when the metrics are requested.
+        """
+        self._gauges.append(function)
+        return function
+
+    def _get_values(self):
+        """Return the values of the current thread."""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._values.append(values)
+            return values
+
+    def count(self, name, **labels):
+        """Count an event."""
+        values = self._get_values()
+        key = (name, tuple(sorted(labels.items())))
+        values[key] = values.get(key, 0) + 1
+
+    def observe(self, name, value, **labels):
+        """Add a value to a histogram."""
+        values = self._get_values()
+        key = (name, tuple(sorted(labels.items())))
+        histogram = values.get(key)
+        if histogram is None:
+            # the bucket counts, the +Inf bucket, the sum
+            histogram = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def apply(self, callback, route):
+        """Measure each request to the route."""
+        route_name = route.name or route.callback.__name__
+        def metrics_wrapper(*args, **kw):
+            start = time.time()
+            status = 500
+            try:
+                result = callback(*args, **kw)
+                status = response.status_code
+                return result
+            except HTTPResponse as error:
+                status = error.status_code
+                raise
+            finally:
+                self.count("scrst_requests_total", route=route_name, status=status)
+                self.observe("scrst_request_duration_seconds", time.time() - start,
+                             route=route_name)
+        return metrics_wrapper
+
+    def collect(self):
+        """Return a dictionary of the summed values of all threads."""
+        with self._lock:
+            all_values = [values.copy() for values in self._values]
+        result = {}
+        for values in all_values:
+            for key, value in values.items():
+                if isinstance(value, list):
+                    total = result.setdefault(key, [0] * len(value))
+                    for i, count in enumerate(value):
+                        total[i] += count
+                else:
+                    result[key] = result.get(key, 0) + value
+        return result
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        metrics = {} # name: [(labels, value)]
+        for (name, labels), value in self.collect().items():
+            metrics.setdefault(name, []).append((labels, value))
+        for gauge in self._gauges:
+            for name, labels, value in gauge():
+                metrics.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name in sorted(metrics):
+            type, help = self._descriptions.get(name, ("untyped", name))
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, type))
+            for labels, value in sorted(metrics[name], key=lambda item: item[0]):
+                if isinstance(value, list):
+                    count = 0
+                    for bound, bucket in zip(self.buckets + ("+Inf",), value):
+                        count += bucket
+                        lines.append("{}_bucket{} {}".format(
+                            name, format_labels(labels + (("le", bound),)), count))
+                    lines.append("{}_sum{} {}".format(name, format_labels(labels), value[-1]))
+                    lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+                else:
+                    lines.append("{}{} {}".format(name, format_labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+
+__all__ = ["Metrics", "get_resident_memory", "CONTENT_TYPE"]
@@ -0,0 +1,151 @@
+"""This module profiles requests to find out why they are slow.
+
+The profiles are added up by route and written to a directory
+as route.pstats files. You can view them with the pstats module
+or convert them, e.g. with flameprof, snakeviz or gprof2dot.
+
+Profiling is switched on for all requests with SCRST_PROFILE=true
+or for single requests by sending the header
+
+    X-Profile: <SCRST_PROFILE_TOKEN>
+
+If neither is configured, the routes are not wrapped at all.
+The statistics are written by a background thread every few seconds
+and when the server exits.
+"""
+import os
+import re
+import time
+import atexit
+import random
+import tempfile
+from threading import Lock, Thread
+from bottle import request
+
+HEADER = "X-Profile"
+
+
+class Profiler(object):
+    """A bottle plugin which profiles requests.
+
+    - directory is where the route.pstats files are written
+    - enabled is whether all requests are profiled
+    - token is the value of the X-Profile header to profile a request
+    - sample_rate is the fraction of the requests which are profiled
+    - routes is a regular expression, only matching route names are profiled
+    - write_interval is the number of seconds between writing the statistics
+    """
+
+    name = "profiler"
+    api = 2
+
+    def __init__(self, directory, enabled=False, token=None, sample_rate=1.0, routes=None,
+                 write_interval=5):
+        """Create a new profiler."""
+        self.directory = directory
+        self.enabled = enabled
+        self.token = token
+        self.sample_rate = sample_rate
+        self.routes = (re.compile(routes) if routes else None)
+        self.write_interval = write_interval
+        self._stats = {} # route name: pstats.Stats
+        self._changed = set() # route names of the statistics to write
+        self._stats_lock = Lock()
+        self._thread = None
+        # Only one profiler can be active at a time.
+        self._lock = Lock()
+
+    def is_active(self):
+        """Whether requests can be profiled."""
+        return self.enabled or bool(self.token)
+
+    def should_profile(self):
+        """Whether the current request should be profiled."""
+        if not self.enabled and request.get_header(HEADER) != self.token:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def apply(self, callback, route):
+        """Profile the requests to the route."""
+        route_name = route.name or route.callback.__name__
+        if not self.is_active() or \
+                (self.routes is not None and not self.routes.search(route_name)):
+            return callback
+        def profile_wrapper(*args, **kw):
+            if not self.should_profile() or not self._lock.acquire(False):
+                return callback(*args, **kw)
+            try:
+                import cProfile
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(callback, *args, **kw)
+                finally:
+                    self._add(route_name, profile)
+            finally:
+                self._lock.release()
+        return profile_wrapper
+
+    def _add(self, route_name, profile):
+        """Add the profile to the statistics of the route."""
+        import pstats
+        with self._stats_lock:
+            stats = self._stats.get(route_name)
+            if stats is None:
+                stats = self._stats[route_name] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._changed.add(route_name)
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        """Start the thread which writes the statistics."""
+        with self._stats_lock:
+            if self._thread is None:
+                thread = Thread(target=self._write_loop)
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+                atexit.register(self.write)
+
+    def _write_loop(self):
+        """Write the changed statistics from time to time."""
+        while True:
+            time.sleep(self.write_interval)
+            self.write()
+
+    def write(self):
+        """Write the statistics which changed since they were written."""
+        with self._stats_lock:
+            if not self._changed:
+                return
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            for route_name in self._changed:
+                self._stats[route_name].dump_stats(self.get_path(route_name))
+            self._changed = set()
+
+    def get_path(self, route_name):
+        """Return the path of the statistics file of a route."""
+        return os.path.join(self.directory, route_name + ".pstats")
+
+    @classmethod
+    def from_environment(cls, environ):
+        """Create a profiler configured by environment variables.
+
+        - SCRST_PROFILE=true profiles all requests
+        - SCRST_PROFILE_TOKEN is the value of the X-Profile header to profile a request
+        - SCRST_PROFILE_DIRECTORY is the directory to write the statistics to
+        - SCRST_PROFILE_SAMPLE_RATE is the fraction of the requests to profile
+        - SCRST_PROFILE_ROUTES is a regular expression to select routes by name
+        """
+        return cls(
+            environ.get("SCRST_PROFILE_DIRECTORY",
+                        os.path.join(tempfile.gettempdir(), "scrst-profiles")),
+            enabled=environ.get("SCRST_PROFILE", "false").lower() == "true",
+            token=environ.get("SCRST_PROFILE_TOKEN"),
+            sample_rate=float(environ.get("SCRST_PROFILE_SAMPLE_RATE", "1")),
+            routes=environ.get("SCRST_PROFILE_ROUTES"))
+
+
+__all__ = ["Profiler"]
@@ -0,0 +1,225 @@
+"""This module sends captured requests to a server and compares the responses.
+
+The requests are captured with the capture module.
+Replay them against a server with
+
+    python -m schul_cloud_resources_server_tests.replay capture.log \\
+        --url=http://localhost:8080/v1 --speed=10 --concurrency=8 \\
+        --basic=valid1@schul-cloud.org:123abc
+
+- --speed=1 sends the requests at the captured times, --speed=10 ten times
+  faster and --speed=max as fast as possible
+- --concurrency is the number of requests sent at the same time
+- --basic=user:password and --apikey=user:key authenticate the captured users,
+  the passwords and api keys are not captured
+
+The report compares the latency and the status codes
+of the captured and the replayed requests as JSON.
+Ids generated by the server are translated to the ids of the new server.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+from threading import Thread, Lock
+import requests
+from schul_cloud_resources_server_tests.capture import decode_body
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+BASE = "/v1"
+ID_IN_PATH = re.compile("(/resources/)([^/]+)")
+
+
+def load(path):
+    """Return the captured requests of a log file."""
+    records = []
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("event") == "capture":
+                records.append(record)
+    records.sort(key=lambda record: record["start"])
+    return records
+
+
+def get_route(path):
+    """Return the path with the id of a resource replaced."""
+    return ID_IN_PATH.sub(lambda match: match.group(1) + (
+        match.group(2) if match.group(2) == "ids" else "<id>"), path)
+
+
+def get_percentiles(durations):
+    """Return the 50th, 90th and 99th percentile of the durations."""
+    durations = sorted(durations)
+    if not durations:
+        return {}
+    def percentile(p):
+        return durations[min(len(durations) - 1, int(len(durations) * p / 100.0))]
+    return {"p50": percentile(50), "p90": percentile(90), "p99": percentile(99),
+            "max": durations[-1]}
+
+
+class Replay(object):
+    """Send captured requests to a server.
+
+    - url is the url of the api, e.g. http://localhost:8080/v1
+    - users is a list of User objects from the test configuration
+    - speed is the factor to speed up the requests, None is as fast as possible
+    - concurrency is the number of requests sent at the same time
+    """
+
+    def __init__(self, url, users=(), speed=1.0, concurrency=8):
+        """Create a new replay."""
+        self.url = url.rstrip("/")
+        self.speed = speed
+        self.concurrency = concurrency
+        self.users = {} # (auth, name): User
+        for user in users:
+            self.users[(user._auth_type, user.name)] = user
+        self.noauth = User(None, "noauth", None, None)
+        self._ids = {} # captured id: replayed id
+        self._lock = Lock()
+
+    def get_user(self, record):
+        """Return the user who sends the captured request."""
+        return self.users.get((record.get("auth"), record.get("user")), self.noauth)
+
+    def get_url(self, path):
+        """Return the url of a captured path on the server."""
+        path = ID_IN_PATH.sub(
+            lambda match: match.group(1) + self._ids.get(match.group(2), match.group(2)), path)
+        if self.url.endswith(BASE) and path.startswith(BASE):
+            return self.url + path[len(BASE):]
+        return re.sub("^(\\w+://[^/]+).*$", "\\1", self.url) + path
+
+    def send(self, session, record):
+        """Send a captured request and return the result."""
+        user = self.get_user(record)
+        url = self.get_url(record["path"])
+        if record.get("query"):
+            url += "?" + record["query"]
+        headers = user._get_auth_headers(record.get("headers", {}))
+        headers.pop("Host", None)
+        headers.pop("Content-Length", None)
+        body = (decode_body(record["body"]) if "body" in record else b"")
+        start = time.time()
+        try:
+            response = session.request(record["method"], url, data=body, headers=headers)
+        except requests.RequestException as error:
+            return {"error": repr(error), "duration": time.time() - start}
+        result = {"status": response.status_code, "duration": time.time() - start}
+        location = response.headers.get("Location")
+        if record.get("location") and location:
+            captured = ID_IN_PATH.search(record["location"])
+            replayed = ID_IN_PATH.search(location)
+            if captured and replayed:
+                with self._lock:
+                    self._ids[captured.group(2)] = replayed.group(2)
+        return result
+
+    def run(self, records):
+        """Send the records and return a list of (record, result)."""
+        requests_queue = Queue(self.concurrency * 2)
+        results = []
+        def work():
+            session = requests.Session()
+            while True:
+                record = requests_queue.get()
+                if record is None:
+                    return
+                result = self.send(session, record)
+                with self._lock:
+                    results.append((record, result))
+        threads = [Thread(target=work) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        started = time.time()
+        first = (records[0]["start"] if records else 0)
+        for record in records:
+            if self.speed:
+                delay = started + (record["start"] - first) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            requests_queue.put(record)
+        for thread in threads:
+            requests_queue.put(None)
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def report(results, duration=None):
+    """Return a report comparing the captured and the replayed requests."""
+    differences = {}
+    routes = {}
+    for record, result in results:
+        route = "{} {}".format(record["method"], get_route(record["path"]))
+        durations = routes.setdefault(route, ([], []))
+        durations[0].append(record["duration"])
+        durations[1].append(result["duration"])
+        replayed = result.get("status", result.get("error"))
+        if replayed != record.get("status"):
+            key = "{} {} -> {}".format(route, record.get("status"), replayed)
+            differences[key] = differences.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "duration": duration,
+        "captured": get_percentiles([record["duration"] for record, result in results]),
+        "replayed": get_percentiles([result["duration"] for record, result in results]),
+        "errors": sum(1 for record, result in results
+                      if "error" in result or result["status"] >= 500),
+        "status_differences": differences,
+        "routes": dict((route, {"captured": get_percentiles(captured),
+                                "replayed": get_percentiles(replayed)})
+                       for route, (captured, replayed) in routes.items())
+    }
+
+
+def get_users(basic, apikey):
+    """Return the users of the --basic and --apikey arguments."""
+    users = []
+    for credentials in basic:
+        name, password = credentials.split(":", 1)
+        users.append(User(None, "basic", name, password))
+    for credentials in apikey:
+        name, key = credentials.split(":", 1)
+        users.append(User(None, "apikey", name, key))
+    return users
+
+
+def main(argv=None):
+    """Replay a capture from the command line."""
+    parser = argparse.ArgumentParser(description="Replay captured requests.")
+    parser.add_argument("capture", help="the file written with SCRST_CAPTURE")
+    parser.add_argument("--url", default="http://localhost:8080/v1",
+                        help="the url of the api of the server")
+    parser.add_argument("--speed", default="1",
+                        help="the factor to speed up the requests or max")
+    parser.add_argument("--concurrency", default=8, type=int,
+                        help="the number of requests sent at the same time")
+    parser.add_argument("--basic", action="append", default=[],
+                        help="user:password of a captured user")
+    parser.add_argument("--apikey", action="append", default=[],
+                        help="user:key of a captured user")
+    args = parser.parse_args(argv)
+    replay = Replay(args.url, get_users(args.basic, args.apikey),
+                    speed=(None if args.speed == "max" else float(args.speed)),
+                    concurrency=args.concurrency)
+    start = time.time()
+    results = replay.run(load(args.capture))
+    json.dump(report(results, time.time() - start), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+
+
+__all__ = ["Replay", "load", "report", "main"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""This module copies the resources of a leader server to followers.
+
+The leader keeps the latest changes to its stores in a replication log.
+A follower reads the log over HTTP and applies the changes to its own stores:
+
+    export SCRST_REPLICATION_TOKEN=secret
+    python -m schul_cloud_resources_server_tests.app 8080 --leader
+    python -m schul_cloud_resources_server_tests.app 8081 --follow=http://localhost:8080/v1
+
+The follower answers reading requests itself.
+Requests which change resources are sent to the leader and the follower
+waits until it has applied the change, so a client reads its own writes.
+
+The leader serves
+
+- GET /v1/replication/log?since=<n>&wait=<seconds> the records after the sequence number n.
+  A record is a list of the sequence number, the time, the operation,
+  the user, the id and the resource.
+  If the records after n are not kept any more, the response is 410 Gone.
+- GET /v1/replication/snapshot all resources and the sequence number they include.
+
+A follower starts with the snapshot and then reads the log.
+These requests need the header X-Replication-Token with the secret of
+SCRST_REPLICATION_TOKEN, which the leader needs to start.
+"""
+import time
+from collections import deque
+from threading import Thread, Condition, Event, Lock
+from bottle import HTTPResponse, request
+
+# the header of a response to a change with the sequence number of the change
+SEQUENCE_HEADER = "X-Replication-Sequence"
+# the header with the secret of the replication, see SCRST_REPLICATION_TOKEN
+TOKEN_HEADER = "X-Replication-Token"
+# methods which change the resources
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# headers which are sent to the leader
+FORWARDED_HEADERS = ("Authorization", "Content-Type", "Accept", "Host")
+
+
+class LogTruncated(Exception):
+    """The records after a sequence number are not kept any more."""
+
+
+class ReplicationLog(object):
+    """The latest changes to the stores of the leader.
+
+    - max_records is the number of records which are kept
+
+    The log is a listener of the stores
+    and a bottle plugin which adds the sequence number to changing responses.
+    """
+
+    name = "replication"
+    api = 2
+
+    def __init__(self, max_records=100000):
+        """Create an empty log."""
+        self.max_records = max_records
+        self.sequence = 0
+        self._records = deque()
+        self._changed = Condition(Lock())
+
+    def record(self, operation, user, _id=None, resource=None):
+        """Append a change to the log.
+
+        This is a listener of the stores.
+        """
+        with self._changed:
+            self.sequence += 1
+            self._records.append((self.sequence, time.time(), operation, user, _id, resource))
+            if len(self._records) > self.max_records:
+                self._records.popleft()
+            self._changed.notify_all()
+
+    def get_records(self, since, limit=1000, wait=0):
+        """Return the records after the sequence number since.
+
+        Wait at most wait seconds for a new record.
+        Raise LogTruncated if the records were removed from the log.
+        """
+        deadline = time.time() + wait
+        with self._changed:
+            while self.sequence <= since and time.time() < deadline:
+                self._changed.wait(deadline - time.time())
+            if since > self.sequence:
+                # the leader restarted and the follower is ahead
+                raise LogTruncated(since)
+            if since == self.sequence:
+                return []
+            first = self._records[0][0] if self._records else self.sequence + 1
+            if since + 1 < first:
+                raise LogTruncated(since)
+            start = since + 1 - first
+            return [list(self._records[index])
+                    for index in range(start, min(len(self._records), start + limit))]
+
+    def snapshot(self, get_stores):
+        """Return the resources of the stores and the sequence number they include."""
+        with self._changed:
+            # copy() does not lock the stores, the changes wait for the log
+            stores = [store.copy() for store in get_stores()]
+            sequence = self.sequence
+        return {"sequence": sequence,
+                "stores": [[store.user, store.items()] for store in stores]}
+
+    def apply(self, callback, route):
+        """Tell the client the sequence number after a change."""
+        if route.method not in WRITE_METHODS:
+            return callback
+        def replication_wrapper(*args, **kw):
+            result = callback(*args, **kw)
+            response_headers(result)[SEQUENCE_HEADER] = str(self.sequence)
+            return result
+        return replication_wrapper
+
+
+def response_headers(result):
+    """Return the headers of the response to a request."""
+    if isinstance(result, HTTPResponse):
+        return result.headers
+    from bottle import response
+    return response.headers
+
+
+class Follower(object):
+    """Copy the resources of a leader into the stores.
+
+    - url is the url of the api of the leader, e.g. http://localhost:8080/v1
+    - data is the data interface of the app, see app.data
+    - token is the secret of the replication
+    - poll_timeout is the number of seconds a request for new records waits
+
+    The follower is also a bottle plugin which sends changes to the leader.
+    """
+
+    name = "follower"
+    api = 2
+
+    def __init__(self, url, data, token=None, poll_timeout=10, retry_interval=1):
+        """Create a follower which is not started."""
+        import requests
+        self.url = url.rstrip("/")
+        self.data = data
+        self.token = token
+        self.poll_timeout = poll_timeout
+        self.retry_interval = retry_interval
+        self.sequence = 0 # the last applied record
+        self.leader_sequence = 0 # the last record of the leader
+        self.caught_up = None # time.time() when the follower last saw all records
+        self.errors = 0
+        self._session = requests.Session()
+        self._proxy = requests.Session()
+        self._stopped = Event()
+        self._applied = Condition(Lock())
+        self._thread = None
+
+    def _get(self, path, **params):
+        """Return the JSON response of the leader."""
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        response = self._session.get(self.url + path, params=params, headers=headers,
+                                     timeout=self.poll_timeout + 10)
+        if response.status_code == 410:
+            raise LogTruncated(params.get("since"))
+        response.raise_for_status()
+        return response.json()
+
+    def load_snapshot(self):
+        """Replace the resources with a snapshot of the leader."""
+        snapshot = self._get("/replication/snapshot")
+        self.data.delete_resources()
+        for user, items in snapshot["stores"]:
+            for _id, resource in items:
+                self.data.apply("add", user, _id, resource)
+        self._set_applied(snapshot["sequence"])
+
+    def _set_applied(self, sequence):
+        """Remember the last applied record."""
+        with self._applied:
+            self.sequence = sequence
+            self._applied.notify_all()
+
+    def poll(self):
+        """Apply the next records of the leader."""
+        try:
+            result = self._get("/replication/log", since=self.sequence,
+                               wait=self.poll_timeout)
+        except LogTruncated:
+            self.load_snapshot()
+            return
+        self.leader_sequence = result["sequence"]
+        for sequence, recorded, operation, user, _id, resource in result["records"]:
+            self.data.apply(operation, user, _id, resource)
+            self._set_applied(sequence)
+        if self.sequence >= self.leader_sequence:
+            self.caught_up = time.time()
+
+    def _run(self):
+        """Follow the leader until the follower is stopped."""
+        loaded = False
+        while not self._stopped.is_set():
+            try:
+                if not loaded:
+                    self.load_snapshot()
+                    loaded = True
+                self.poll()
+            except Exception:
+                self.errors += 1
+                self._stopped.wait(self.retry_interval)
+
+    def start(self):
+        """Start following the leader in a background thread."""
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop following the leader."""
+        self._stopped.set()
+
+    def wait_for(self, sequence, timeout=5):
+        """Wait until the record with the sequence number is applied.
+
+        Return whether it was applied.
+        """
+        deadline = time.time() + timeout
+        with self._applied:
+            while self.sequence < sequence and time.time() < deadline:
+                self._applied.wait(deadline - time.time())
+            return self.sequence >= sequence
+
+    def get_lag(self):
+        """Return the number of records and seconds the follower is behind."""
+        records = max(0, self.leader_sequence - self.sequence)
+        if records == 0 or self.caught_up is None:
+            seconds = 0
+        else:
+            seconds = time.time() - self.caught_up
+        return records, seconds
+
+    def get_status(self):
+        """Return the state of the replication as a dict."""
+        records, seconds = self.get_lag()
+        return {"leader": self.url, "sequence": self.sequence,
+                "leader_sequence": self.leader_sequence,
+                "lag_records": records, "lag_seconds": seconds, "errors": self.errors}
+
+    def forward(self, path):
+        """Send the current request to the leader and return its response."""
+        headers = dict((name, request.headers[name]) for name in FORWARDED_HEADERS
+                       if name in request.headers)
+        url = self.url + path
+        if request.query_string:
+            url += "?" + request.query_string
+        response = self._proxy.request(request.method, url, data=request.body.read(),
+                                       headers=headers, allow_redirects=False)
+        sequence = response.headers.get(SEQUENCE_HEADER)
+        if sequence:
+            self.wait_for(int(sequence))
+        headers = dict((name, value) for name, value in response.headers.items()
+                       if name.lower() in ("content-type", "location", "retry-after"))
+        return HTTPResponse(response.content, response.status_code, headers)
+
+    def apply(self, callback, route):
+        """Send the requests which change resources to the leader."""
+        from schul_cloud_resources_server_tests.app import BASE
+        if route.method not in WRITE_METHODS or not route.rule.startswith(BASE + "/"):
+            return callback
+        def follower_wrapper(*args, **kw):
+            return self.forward(request.path[len(BASE):])
+        return follower_wrapper
+
+
+__all__ = ["ReplicationLog", "Follower", "LogTruncated", "SEQUENCE_HEADER", "TOKEN_HEADER"]
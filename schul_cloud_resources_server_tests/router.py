@@ -0,0 +1,286 @@
+"""This module spreads the users over several servers.
+
+The router is a WSGI application in front of several resources servers,
+the shards. It authenticates a request like the server does and sends it
+to the shard of the user. Each user is placed on a shard by consistent
+hashing, so when a shard is added, only the users of about one shard move.
+
+    python -m schul_cloud_resources_server_tests.app 8081
+    python -m schul_cloud_resources_server_tests.app 8082
+    python -m schul_cloud_resources_server_tests.router 8080 \\
+        --shard=http://localhost:8081 --shard=http://localhost:8082
+
+A shard is added with a POST request to /router/shards with its url as body.
+The resources of a user who moves are copied to the new shard
+with the next request of the user, because only then the router
+has the credentials of the user.
+GET /router/shards lists the shards.
+These requests need the header X-Router-Token with the secret of
+SCRST_ROUTER_TOKEN. Without it, the shards can not be changed,
+because a new shard gets the credentials and resources of the users.
+The events of GET /v1/resources/events are passed on as they arrive.
+"""
+import json
+import bisect
+import hashlib
+import argparse
+from threading import Lock
+from bottle import HTTPError, tob
+from schul_cloud_resources_server_tests.app import BASE, authenticate, error_object
+from schul_cloud_resources_server_tests.errors import errors
+
+# headers which belong to one connection and are not forwarded
+HOP_BY_HOP = ("connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+              "te", "trailers", "transfer-encoding", "upgrade", "content-length")
+RESOURCES = BASE + "/resources"
+OPERATIONS = BASE + "/operations"
+# the paths of the requests which go to the shard of the user
+USER_PATHS = (OPERATIONS, BASE + "/export", BASE + "/import")
+API_CONTENT_TYPE = "application/vnd.api+json"
+
+
+def get_hash(key):
+    """Return the position of a key on the ring."""
+    return int(hashlib.sha256(tob(key)).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent hashing of keys to shards.
+
+    Each shard has replicas points on the ring.
+    A key belongs to the shard of the next point.
+    """
+
+    def __init__(self, shards=(), replicas=100):
+        """Create a ring with the shards."""
+        self.replicas = replicas
+        self.shards = []
+        self._points = [] # sorted positions
+        self._shards = [] # the shard of each position
+        for shard in shards:
+            self.add(shard)
+
+    def add(self, shard):
+        """Add a shard to the ring."""
+        self.shards.append(shard)
+        for replica in range(self.replicas):
+            point = get_hash("{}#{}".format(shard, replica))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._shards.insert(index, shard)
+
+    def get(self, key):
+        """Return the shard of the key."""
+        if not self._points:
+            raise ValueError("The ring has no shards.")
+        index = bisect.bisect(self._points, get_hash(key)) % len(self._points)
+        return self._shards[index]
+
+    def copy(self):
+        """Return a copy of the ring."""
+        ring = HashRing(replicas=self.replicas)
+        ring.shards = list(self.shards)
+        ring._points = list(self._points)
+        ring._shards = list(self._shards)
+        return ring
+
+
+def get_key(user):
+    """Return the key of a user on the ring."""
+    return user or ""
+
+
+class Router(object):
+    """A WSGI application which sends the requests to the shard of the user.
+
+    - shards are the urls of the servers, e.g. http://localhost:8081
+    - pool_size is the number of connections kept open to each shard
+    - token is the secret to change the shards, None to never change them
+    """
+
+    def __init__(self, shards, replicas=100, pool_size=32, token=None):
+        """Create a new router."""
+        import requests
+        self.token = token
+        self.rings = [HashRing([shard.rstrip("/") for shard in shards], replicas)]
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._generations = {} # user: the ring where the resources are
+        self._moving = {} # user: lock while the resources move
+        self._lock = Lock()
+
+    @property
+    def ring(self):
+        """The current ring."""
+        return self.rings[-1]
+
+    def add_shard(self, shard):
+        """Add a shard and move the users to it when they make requests."""
+        with self._lock:
+            ring = self.ring.copy()
+            ring.add(shard.rstrip("/"))
+            self.rings.append(ring)
+
+    def get_shard(self, user, authorization=None):
+        """Return the shard of the user.
+
+        If the user moves to another shard, the resources are copied
+        with the authorization of the user before.
+        """
+        key = get_key(user)
+        generation = self._generations.get(key, 0)
+        if generation == len(self.rings) - 1:
+            return self.ring.get(key)
+        with self._lock:
+            lock = self._moving.setdefault(key, Lock())
+        with lock:
+            generation = self._generations.get(key, 0)
+            current = len(self.rings) - 1
+            old = self.rings[generation].get(key)
+            new = self.rings[current].get(key)
+            if old != new:
+                self.move(old, new, authorization)
+            self._generations[key] = current
+        return new
+
+    def _request(self, method, url, authorization, **kw):
+        """Send a request to a shard with the authorization of a user."""
+        headers = {"Accept": API_CONTENT_TYPE, "Content-Type": API_CONTENT_TYPE}
+        if authorization:
+            headers["Authorization"] = authorization
+        response = self._session.request(method, url, headers=headers, **kw)
+        if response.status_code >= 400 and not (method == "DELETE" and response.status_code == 404):
+            raise HTTPError(502, "Could not move the resources: {} {} {}".format(
+                            method, url, response.status_code))
+        return response
+
+    def move(self, old, new, authorization):
+        """Move the resources of the user from the old to the new shard."""
+        ids = self._request("GET", old + RESOURCES + "/ids", authorization).json()["data"]
+        for _id in [entry["id"] for entry in ids]:
+            url = "/resources/{}".format(_id)
+            resource = self._request("GET", old + BASE + url, authorization).json()["data"]
+            self._request("PUT", new + BASE + url, authorization, data=json.dumps(
+                {"data": {"type": "resource", "id": _id,
+                          "attributes": resource["attributes"]}}))
+            self._request("DELETE", old + BASE + url, authorization)
+
+    def forward(self, shard, environ, body, stream=False):
+        """Send the request to the shard and return the response."""
+        headers = {}
+        for name, value in environ.items():
+            if name.startswith("HTTP_"):
+                name = name[5:].replace("_", "-").title()
+                if name.lower() not in HOP_BY_HOP:
+                    headers[name] = value
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        url = shard + environ.get("PATH_INFO", "/")
+        if environ.get("QUERY_STRING"):
+            url += "?" + environ["QUERY_STRING"]
+        return self._session.request(environ["REQUEST_METHOD"], url, data=body,
+                                     headers=headers, allow_redirects=False, stream=stream)
+
+    def __call__(self, environ, start_response):
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        body = (environ["wsgi.input"].read(length) if length else b"")
+        path = environ.get("PATH_INFO", "/")
+        try:
+            if path.startswith("/router/"):
+                return self.handle_router_request(environ, body, start_response)
+            if path.startswith(RESOURCES) or path in USER_PATHS:
+                authorization = environ.get("HTTP_AUTHORIZATION")
+                shard = self.get_shard(authenticate(authorization), authorization)
+            else:
+                shard = self.ring.get(get_key(None))
+            stream = path in (RESOURCES + "/events", BASE + "/export")
+            response = self.forward(shard, environ, body, stream)
+        except HTTPError as error:
+            return self.error(start_response, error.status_code, error.body, error.headerlist)
+        except Exception as error:
+            return self.error(start_response, 502, "The shard could not be reached: {}".format(error))
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in HOP_BY_HOP]
+        if stream and response.status_code == 200:
+            # the events are passed on as they arrive
+            start_response(get_status_line(response.status_code), headers)
+            return StreamedResponse(response)
+        start_response(get_status_line(response.status_code), headers +
+                       [("Content-Length", str(len(response.content)))])
+        return [response.content]
+
+    def error(self, start_response, status, detail, headers=()):
+        """Answer with a JSON:API error."""
+        content = tob(error_object(status, detail))
+        headers = [(name, value) for name, value in headers
+                   if name.lower() not in ("content-type", "content-length")]
+        start_response(get_status_line(status), headers + [
+            ("Content-Type", API_CONTENT_TYPE), ("Content-Length", str(len(content)))])
+        return [content]
+
+    def handle_router_request(self, environ, body, start_response):
+        """List or add the shards."""
+        if self.token is None:
+            return self.error(start_response, 403, "Set SCRST_ROUTER_TOKEN to change the shards.")
+        if environ.get("HTTP_X_ROUTER_TOKEN") != self.token:
+            return self.error(start_response, 403, "The X-Router-Token header is wrong.")
+        if environ.get("PATH_INFO") != "/router/shards":
+            return self.error(start_response, 404, "Only /router/shards exists.")
+        if environ["REQUEST_METHOD"] == "POST":
+            shard = body.decode("utf-8").strip()
+            if not shard.startswith(("http://", "https://")):
+                return self.error(start_response, 422, "The body must be the url of a shard.")
+            self.add_shard(shard)
+        content = tob(json.dumps({"shards": self.ring.shards,
+                                  "generation": len(self.rings) - 1}))
+        start_response("200 OK", [("Content-Type", "application/json"),
+                                  ("Content-Length", str(len(content)))])
+        return [content]
+
+
+class StreamedResponse(object):
+    """The body of a streamed response of a shard for the WSGI server."""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __iter__(self):
+        return self.response.raw.stream(1024, decode_content=False)
+
+    def close(self):
+        self.response.close()
+
+
+def get_status_line(status):
+    """Return the HTTP status line of a status code."""
+    return "{} {}".format(status, errors.get(status, "").strip()).strip()
+
+
+def main(argv=None):
+    """Start the router from the command line."""
+    import os
+    from bottle import run
+    from schul_cloud_resources_server_tests.wsgi_server import KeepAliveServerAdapter
+    parser = argparse.ArgumentParser(description="Spread the users over servers.")
+    parser.add_argument("port", type=int, nargs="?", default=8080)
+    parser.add_argument("--shard", action="append", default=[], required=True,
+                        help="the url of a server, e.g. http://localhost:8081")
+    parser.add_argument("--threads", type=int, default=32,
+                        help="the number of requests forwarded at the same time")
+    args = parser.parse_args(argv)
+    router = Router(args.shard, pool_size=args.threads,
+                    token=os.environ.get("SCRST_ROUTER_TOKEN"))
+    run(router, host="", port=args.port, quiet=True,
+        server=KeepAliveServerAdapter, threads=args.threads)
+
+
+__all__ = ["Router", "HashRing", "main"]
+
+
+if __name__ == "__main__":
+    main()
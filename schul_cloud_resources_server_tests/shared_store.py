@@ -0,0 +1,375 @@
+"""This module stores the resources in a file shared by worker processes.
+
+When the server runs in several processes, e.g. with
+
+    gunicorn -w 4 schul_cloud_resources_server_tests.app:app
+
+each process has its own stores. With SCRST_STORE=shared, all
+processes on one host append the changes to the same log file
+and read it through mmap.
+
+- Writers append records while they hold a file lock.
+- Readers do not lock. They read the new records at the end of the file
+  and skip a record which is not completely written, yet.
+  Each record is checked with a CRC32.
+- Each process keeps an index from user and id to the position of the
+  resource in the file. The resources are only decoded when they are requested.
+
+The file is never shortened because other processes may read it.
+Delete it while the server is stopped to free the space.
+"""
+import os
+import json
+import mmap
+import struct
+import zlib
+import tempfile
+from threading import Lock
+from schul_cloud_resources_server_tests.store import (
+    Store, DictStore, intern_string, check_operations, ADDED, REPLACED, UNCHANGED)
+
+MAGIC = b"SCRST001"
+HEADER = struct.Struct(">8sQ") # magic, last id
+RECORD = struct.Struct(">II") # length, crc32 of the payload
+
+
+class SharedLog(object):
+    """An append-only log of changes shared by the processes of one host.
+
+    A record is a JSON list of the operation, the user,
+    the id and the resource like the listeners get them.
+    """
+
+    def __init__(self, path):
+        """Open or create the log file."""
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self.pid = os.getpid()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._write_lock = Lock() # the file lock does not lock out other threads
+        self._read_lock = Lock()
+        self._map = None
+        self._offset = HEADER.size # the end of the records in the index
+        self._index = {} # user: {id: (start, length)}
+        self._sizes = {} # user: bytes of the resources
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                self._write_all(HEADER.pack(MAGIC, 0))
+            elif self._read(0, HEADER.size)[:len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a shared store.".format(path))
+        self.refresh()
+
+    def _locked(self):
+        """Return a context manager to lock the file for writing."""
+        return _FileLock(self)
+
+    def _write_all(self, data):
+        """Write the bytes at the current position of the file."""
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def _read(self, position, length):
+        """Read bytes from the file."""
+        os.lseek(self._fd, position, os.SEEK_SET)
+        return os.read(self._fd, length)
+
+    def refresh(self):
+        """Read the records appended since the last refresh."""
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        with self._read_lock:
+            if self._map is None or len(self._map) < size:
+                # Old maps stay valid for the readers which still use them.
+                self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+            view = self._map
+            offset = self._offset
+            while offset + RECORD.size <= size:
+                length, crc = RECORD.unpack_from(view, offset)
+                start = offset + RECORD.size
+                end = start + length
+                if end > size:
+                    break
+                payload = view[start:end]
+                if zlib.crc32(payload) & 0xffffffff != crc:
+                    # the writer is not done, yet
+                    break
+                self._apply(json.loads(payload.decode("utf-8")), start, length)
+                offset = end
+            self._offset = offset
+
+    def _apply(self, record, start, length):
+        """Update the index with a record."""
+        operation = record[0]
+        if operation == "reset":
+            self._index = {}
+            self._sizes = {}
+            return
+        user = record[1]
+        resources = self._index.setdefault(user, {})
+        if operation == "add" or operation == "put":
+            _id = intern_string(record[2])
+            old = resources.get(_id)
+            if old is None or operation == "put":
+                resources[_id] = (start, length)
+                self._sizes[user] = self._sizes.get(user, 0) + length - \
+                    (0 if old is None else old[1])
+        elif operation == "delete":
+            position = resources.pop(record[2], None)
+            if position is not None:
+                self._sizes[user] -= position[1]
+        elif operation == "clear":
+            self._index[user] = {}
+            self._sizes[user] = 0
+
+    def append(self, operation, user=None, _id=None, resource=None):
+        """Append a record.
+
+        Return whether the record changes the resources:
+        Adding an existing id and deleting a missing id do nothing.
+        """
+        data = encode_record(operation, user, _id, resource)
+        with self._locked():
+            self.refresh()
+            resources = self._index.get(user, {})
+            if operation == "add" and _id in resources or \
+                    operation == "delete" and _id not in resources:
+                return False
+            os.lseek(self._fd, self._offset, os.SEEK_SET)
+            self._write_all(data)
+            self.refresh()
+        return True
+
+    def append_all(self, user, operations):
+        """Append the operations of a user with one write or none of them.
+
+        See Store.apply_all() for the operations and the errors.
+        """
+        data = b"".join(encode_record(operation[0], user, *operation[1:])
+                        for operation in operations)
+        with self._locked():
+            self.refresh()
+            check_operations(operations, self._index.get(user, {}).__contains__)
+            os.lseek(self._fd, self._offset, os.SEEK_SET)
+            self._write_all(data)
+            self.refresh()
+
+    def new_id(self):
+        """Return a new id which is unique for all processes."""
+        with self._locked():
+            magic, last_id = HEADER.unpack(self._read(0, HEADER.size))
+            last_id += 1
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            self._write_all(HEADER.pack(magic, last_id))
+        return str(last_id)
+
+    def reserve_id(self, number):
+        """Make sure that new_id() returns numbers greater than number in all processes."""
+        with self._locked():
+            magic, last_id = HEADER.unpack(self._read(0, HEADER.size))
+            if number > last_id:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                self._write_all(HEADER.pack(magic, number))
+
+    def get(self, user, _id):
+        """Return the resource or None."""
+        self.refresh()
+        position = self._index.get(user, {}).get(_id)
+        if position is None:
+            return None
+        start, length = position
+        return json.loads(self._map[start:start + length].decode("utf-8"))[3]
+
+    def get_ids(self, user):
+        """Return a list of the ids of the user."""
+        self.refresh()
+        return list(self._index.get(user, ()))
+
+    def get_size(self, user):
+        """Return the bytes used by the resources of the user."""
+        self.refresh()
+        return self._sizes.get(user, 0)
+
+    def get_offset(self):
+        """Return the end of the records read, which grows with each change."""
+        self.refresh()
+        return self._offset
+
+    def close(self):
+        """Close the file."""
+        os.close(self._fd)
+
+
+def encode_record(operation, user=None, _id=None, resource=None):
+    """Return a record of the log as bytes."""
+    record = [operation, user, _id]
+    if operation in ("add", "put"):
+        record.append(resource)
+    payload = json.dumps(record, separators=(",", ":"),
+                         ensure_ascii=False).encode("utf-8")
+    return RECORD.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+class _FileLock(object):
+    """Lock the log file against other threads and processes."""
+
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        self.log._write_lock.acquire()
+        try:
+            self.log._fcntl.flock(self.log._fd, self.log._fcntl.LOCK_EX)
+        except:
+            self.log._write_lock.release()
+            raise
+
+    def __exit__(self, *args):
+        try:
+            self.log._fcntl.flock(self.log._fd, self.log._fcntl.LOCK_UN)
+        finally:
+            self.log._write_lock.release()
+
+
+_log = None
+_log_lock = Lock()
+
+
+def get_shared_log():
+    """Return the log of this process.
+
+    The file is set by SCRST_SHARED_STORE.
+    A forked process opens the file again because the file lock
+    does not separate processes which share an open file.
+    """
+    global _log
+    with _log_lock:
+        if _log is None or _log.pid != os.getpid():
+            _log = SharedLog(os.environ.get(
+                "SCRST_SHARED_STORE",
+                os.path.join(tempfile.gettempdir(), "scrst-shared-store")))
+    return _log
+
+
+class SharedStore(Store):
+    """This store keeps the resources in a log file shared by processes.
+
+    See the shared_store module.
+    """
+
+    def __init__(self, user, listeners=(), log=None):
+        """Create a store for the resources of a user in the shared log."""
+        Store.__init__(self, user, listeners)
+        self._log = log
+
+    @property
+    def log(self):
+        """The shared log of this process."""
+        return (get_shared_log() if self._log is None else self._log)
+
+    @classmethod
+    def new_id(cls):
+        return get_shared_log().new_id()
+
+    @classmethod
+    def reserve_id(cls, _id):
+        try:
+            number = int(_id)
+        except (ValueError, TypeError):
+            return
+        if str(number) == _id:
+            get_shared_log().reserve_id(number)
+
+    @classmethod
+    def delete_all(cls):
+        get_shared_log().append("reset")
+
+    def add(self, _id, resource):
+        if not self.log.append("add", self.user, _id, resource):
+            return False
+        self._notify("add", _id, resource)
+        return True
+
+    def put(self, _id, resource):
+        old = self.log.get(self.user, _id)
+        if old == resource:
+            return UNCHANGED
+        self.log.append("put", self.user, _id, resource)
+        self._notify("put", _id, resource)
+        return (ADDED if old is None else REPLACED)
+
+    def get(self, _id, default=None):
+        resource = self.log.get(self.user, _id)
+        return (default if resource is None else resource)
+
+    def __getitem__(self, _id):
+        resource = self.log.get(self.user, _id)
+        if resource is None:
+            raise KeyError(_id)
+        return resource
+
+    def pop(self, _id, default=None):
+        resource = self.log.get(self.user, _id)
+        if resource is None or not self.log.append("delete", self.user, _id):
+            return default
+        self._notify("delete", _id)
+        return resource
+
+    def pop_many(self, ids):
+        removed = []
+        for _id in ids:
+            if self.log.append("delete", self.user, _id):
+                removed.append(_id)
+                self._notify("delete", _id)
+        return removed
+
+    def apply_all(self, operations):
+        self.log.append_all(self.user, operations)
+        for operation in operations:
+            self._notify(*operation)
+
+    def clear(self):
+        self.log.append("clear", self.user)
+        self._notify("clear")
+
+    def copy(self):
+        copy = DictStore(self.user)
+        for _id, resource in self.items():
+            copy.add(_id, resource)
+        return copy
+
+    def __contains__(self, _id):
+        self.log.refresh()
+        return _id in self.log._index.get(self.user, ())
+
+    def __iter__(self):
+        return iter(self.log.get_ids(self.user))
+
+    def __len__(self):
+        self.log.refresh()
+        return len(self.log._index.get(self.user, ()))
+
+    def values(self):
+        return [resource for _id, resource in self.items()]
+
+    def items(self):
+        items = []
+        for _id in self.log.get_ids(self.user):
+            resource = self.log.get(self.user, _id)
+            if resource is not None:
+                items.append((_id, resource))
+        return items
+
+    def get_size(self):
+        return self.log.get_size(self.user)
+
+    def get_user_size(self):
+        return self.get_size()
+
+    def get_version(self):
+        return self.log.get_offset()
+
+
+__all__ = ["SharedLog", "SharedStore", "get_shared_log"]
@@ -0,0 +1,492 @@
+"""This module contains the storage of the resources.
+
+A store holds the resources of one user, mapped from id to resource.
+It behaves like a dictionary, so the server can use it like one.
+"""
+import sys
+import json
+import hashlib
+from threading import Lock
+
+if sys.version_info[0] == 2:
+    _intern = intern
+else:
+    _intern = sys.intern
+
+
+def intern_string(string):
+    """Return the interned version of the string if possible.
+
+    Ids and user names occur in many places. Interning them makes
+    all these places share the same object.
+    """
+    try:
+        return _intern(string)
+    except TypeError:
+        # unicode can not be interned in Python 2
+        return string
+
+
+def get_deep_size(obj):
+    """Return the approximate number of bytes a Python object tree uses."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_deep_size(key) + get_deep_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += get_deep_size(value)
+    return size
+
+
+# the results of Store.put()
+ADDED = "added"
+REPLACED = "replaced"
+UNCHANGED = "unchanged"
+
+
+class OperationFailed(Exception):
+    """An operation of Store.apply_all() can not be applied.
+
+    index is the position of the operation.
+    """
+
+    def __init__(self, index, operation):
+        Exception.__init__(self, index, operation)
+        self.index = index
+        self.operation = operation
+
+
+def check_operations(operations, contains):
+    """Raise OperationFailed if an operation can not be applied.
+
+    contains(id) returns whether the id exists before the operations.
+    """
+    exists = {}
+    for index, operation in enumerate(operations):
+        name, _id = operation[:2]
+        if name not in ("add", "put", "delete"):
+            raise ValueError("Unknown operation {}".format(repr(name)))
+        present = (exists[_id] if _id in exists else contains(_id))
+        if name == "add" and present or name == "delete" and not present:
+            raise OperationFailed(index, operation)
+        exists[_id] = name != "delete"
+
+
+class Store(object):
+    """The resources of one user.
+
+    Subclasses decide how a resource is represented in memory
+    by overwriting encode(), decode() and get_stored_size().
+
+    Changes are reported to the listeners.
+    A listener is called as listener(operation, user, _id, resource)
+    with the operation "add", "put", "delete" or "clear".
+    """
+
+    def __init__(self, user, listeners=()):
+        """Create an empty store for the resources of a user."""
+        self.user = user
+        self.listeners = listeners
+        self._resources = {} # id: stored resource
+        self._size = 0 # bytes of the stored resources
+        self._user_size = 0 # bytes of the resources charged to the user
+        # changes and their notifications happen in one step
+        self._lock = Lock()
+
+    _last_id = 0
+    _id_lock = Lock()
+
+    @classmethod
+    def new_id(cls):
+        """Return a new id for a resource."""
+        with Store._id_lock:
+            Store._last_id += 1
+            return str(Store._last_id)
+
+    @classmethod
+    def reserve_id(cls, _id):
+        """Make sure that new_id() does not return an id which is in use."""
+        try:
+            number = int(_id)
+        except (ValueError, TypeError):
+            return
+        if str(number) == _id:
+            with Store._id_lock:
+                Store._last_id = max(Store._last_id, number)
+
+    @classmethod
+    def delete_all(cls):
+        """Delete the resources which outlive the store objects."""
+
+    @classmethod
+    def get_shared_size(cls):
+        """Return the bytes used by resources shared by all stores."""
+        return 0
+
+    def _notify(self, operation, _id=None, resource=None):
+        """Notify the listeners about a change."""
+        for listener in self.listeners:
+            listener(operation, self.user, _id, resource)
+
+    def encode(self, resource):
+        """Return the representation of the resource to store."""
+        raise NotImplementedError("to be implemented by subclasses")
+
+    def decode(self, stored):
+        """Return the resource of the stored representation."""
+        raise NotImplementedError("to be implemented by subclasses")
+
+    def get_stored_size(self, stored):
+        """Return the bytes a stored resource occupies."""
+        raise NotImplementedError("to be implemented by subclasses")
+
+    def get_charged_size(self, stored):
+        """Return the bytes of a stored resource charged to the user."""
+        return self.get_stored_size(stored)
+
+    def release(self, stored):
+        """Free a stored resource which was removed from the store."""
+
+    def is_unchanged(self, stored, resource):
+        """Whether the stored resource equals the resource."""
+        return self.decode(stored) == resource
+
+    def add(self, _id, resource):
+        """Add a resource with a new id.
+
+        Return whether the resource was added.
+        If the id already exists, nothing is changed and False is returned.
+        """
+        with self._lock:
+            if _id in self._resources:
+                return False
+            self._add(_id, resource)
+        return True
+
+    def _add(self, _id, resource):
+        """Add a resource while the lock is held."""
+        stored = self._resources[intern_string(_id)] = self.encode(resource)
+        self._size += self.get_stored_size(stored)
+        self._user_size += self.get_charged_size(stored)
+        self._notify("add", _id, resource)
+
+    def put(self, _id, resource):
+        """Add or replace a resource.
+
+        Return ADDED, REPLACED or UNCHANGED.
+        If the resource equals the stored one, nothing is written.
+        """
+        with self._lock:
+            return self._put(_id, resource)
+
+    def _put(self, _id, resource):
+        """Add or replace a resource while the lock is held."""
+        old = self._resources.get(_id)
+        if old is not None and self.is_unchanged(old, resource):
+            return UNCHANGED
+        stored = self._resources[intern_string(_id)] = self.encode(resource)
+        self._size += self.get_stored_size(stored)
+        self._user_size += self.get_charged_size(stored)
+        if old is not None:
+            self._size -= self.get_stored_size(old)
+            self._user_size -= self.get_charged_size(old)
+            self.release(old)
+        self._notify("put", _id, resource)
+        return (ADDED if old is None else REPLACED)
+
+    def apply_all(self, operations):
+        """Apply all operations in one step or none of them.
+
+        An operation is ("add", id, resource), ("put", id, resource) or ("delete", id).
+        If an "add" finds its id or a "delete" misses it,
+        OperationFailed is raised and nothing is changed.
+        """
+        with self._lock:
+            check_operations(operations, self._resources.__contains__)
+            for operation in operations:
+                if operation[0] == "add":
+                    self._add(operation[1], operation[2])
+                elif operation[0] == "put":
+                    self._put(operation[1], operation[2])
+                else:
+                    self.release(self._pop(operation[1]))
+
+    def get(self, _id, default=None):
+        """Return the resource with the id or the default."""
+        stored = self._resources.get(_id)
+        if stored is None:
+            return default
+        return self.decode(stored)
+
+    def __getitem__(self, _id):
+        return self.decode(self._resources[_id])
+
+    def pop(self, _id, default=None):
+        """Remove the resource and return it or the default if it is absent."""
+        with self._lock:
+            stored = self._pop(_id)
+            if stored is None:
+                return default
+            resource = self.decode(stored)
+            self.release(stored)
+        return resource
+
+    def _pop(self, _id):
+        """Remove a resource while the lock is held and return what was stored.
+
+        The caller releases the stored resource.
+        """
+        stored = self._resources.pop(_id, None)
+        if stored is not None:
+            self._size -= self.get_stored_size(stored)
+            self._user_size -= self.get_charged_size(stored)
+            self._notify("delete", _id)
+        return stored
+
+    def pop_many(self, ids):
+        """Remove the resources with the ids in one step.
+
+        Return the list of the removed ids.
+        The listeners are notified about each removed resource.
+        """
+        removed = []
+        with self._lock:
+            for _id in ids:
+                stored = self._pop(_id)
+                if stored is not None:
+                    self.release(stored)
+                    removed.append(_id)
+            if removed and len(removed) >= len(self._resources):
+                # a dict does not shrink when items are removed
+                self._resources = dict(self._resources)
+        return removed
+
+    def clear(self):
+        """Remove all resources."""
+        with self._lock:
+            resources = self._resources
+            self._resources = {}
+            self._size = 0
+            self._user_size = 0
+            for stored in resources.values():
+                self.release(stored)
+            self._notify("clear")
+
+    def copy(self):
+        """Return a copy of the store which does not notify the listeners.
+
+        The stored resources are shared and not copied.
+        """
+        copy = self.__class__(self.user)
+        # no lock: the journal copies the stores while it is notified
+        copy._resources = self._resources.copy()
+        copy._size = self._size
+        copy._user_size = self._user_size
+        return copy
+
+    def __contains__(self, _id):
+        return _id in self._resources
+
+    def __iter__(self):
+        return iter(list(self._resources))
+
+    def __len__(self):
+        return len(self._resources)
+
+    def values(self):
+        """Return a list of all resources."""
+        return [self.decode(stored) for stored in list(self._resources.values())]
+
+    def items(self):
+        """Return a list of all (id, resource) pairs."""
+        return [(_id, self.decode(stored)) for _id, stored in list(self._resources.items())]
+
+    def get_size(self):
+        """Return the number of bytes used by the stored resources."""
+        return self._size
+
+    def get_user_size(self):
+        """Return the number of bytes charged to the user, see get_charged_size().
+
+        Unlike get_size(), this includes the resources shared with other stores.
+        """
+        return self._user_size
+
+    def get_version(self):
+        """Return what changes when other processes change the resources.
+
+        None means that only the listeners of this process see the changes.
+        """
+        return None
+
+
+class DictStore(Store):
+    """This store keeps the resources as Python objects."""
+
+    def encode(self, resource):
+        return resource
+
+    def decode(self, stored):
+        return stored
+
+    def get_stored_size(self, stored):
+        return get_deep_size(stored)
+
+
+class CompactStore(Store):
+    """This store keeps the resources as compact JSON encoded in UTF-8.
+
+    A resource posted by a crawler is a tree of many small objects
+    which take several times the memory of their JSON text.
+    The resources are only decoded when they are requested.
+    """
+
+    def encode(self, resource):
+        return json.dumps(resource, separators=(",", ":"),
+                          ensure_ascii=False).encode("utf-8")
+
+    def decode(self, stored):
+        return json.loads(stored.decode("utf-8"))
+
+    def get_stored_size(self, stored):
+        return sys.getsizeof(stored)
+
+    def is_unchanged(self, stored, resource):
+        return CompactStore.encode(self, resource) == stored or \
+            Store.is_unchanged(self, stored, resource)
+
+
+class BodyPool(object):
+    """Resource bodies stored once and counted by reference.
+
+    A body is found by the SHA-256 hash of its bytes.
+    """
+
+    def __init__(self):
+        """Create an empty pool."""
+        self._bodies = {} # hash: [body, references]
+        self._size = 0
+        self._lock = Lock()
+
+    def add(self, body):
+        """Add a reference to the body and return its hash."""
+        key = hashlib.sha256(body).digest()
+        with self._lock:
+            entry = self._bodies.get(key)
+            if entry is None:
+                self._bodies[key] = [body, 1]
+                self._size += sys.getsizeof(body)
+            else:
+                entry[1] += 1
+        return key
+
+    def get(self, key):
+        """Return the body with the hash."""
+        return self._bodies[key][0]
+
+    def release(self, key):
+        """Remove a reference to the body and the body with the last reference."""
+        with self._lock:
+            entry = self._bodies[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._bodies[key]
+                self._size -= sys.getsizeof(entry[0])
+
+    def clear(self):
+        """Remove all bodies."""
+        with self._lock:
+            self._bodies = {}
+            self._size = 0
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get_size(self):
+        """Return the number of bytes used by the bodies."""
+        return self._size
+
+
+class DedupStore(CompactStore):
+    """This store keeps each distinct resource only once for all users.
+
+    Crawlers post the same resource under different ids and users.
+    The resources are encoded as canonical JSON, the bodies are kept
+    in the pool and the store maps the ids to the hashes of the bodies.
+    The size of a store is the size of its hashes,
+    the pool is counted by get_shared_size().
+    """
+
+    pool = BodyPool() # the pool of all stores which get no other pool
+
+    def __init__(self, user, listeners=(), pool=None):
+        """Create an empty store which keeps the bodies in the pool."""
+        CompactStore.__init__(self, user, listeners)
+        if pool is not None:
+            self.pool = pool
+
+    @staticmethod
+    def canonical(resource):
+        """Return the canonical JSON of the resource."""
+        return json.dumps(resource, separators=(",", ":"), sort_keys=True,
+                          ensure_ascii=False).encode("utf-8")
+
+    def encode(self, resource):
+        return self.pool.add(self.canonical(resource))
+
+    def is_unchanged(self, stored, resource):
+        # equal resources have the same hash
+        return hashlib.sha256(self.canonical(resource)).digest() == stored
+
+    def decode(self, stored):
+        return json.loads(self.pool.get(stored).decode("utf-8"))
+
+    def get_stored_size(self, stored):
+        return sys.getsizeof(stored)
+
+    def get_charged_size(self, stored):
+        # the user pays for the body even if other stores share it
+        return sys.getsizeof(self.pool.get(stored))
+
+    def release(self, stored):
+        self.pool.release(stored)
+
+    def copy(self):
+        """Return a copy of the store which does not notify the listeners.
+
+        The copy holds the bodies so that it does not depend on the pool.
+        """
+        copy = CompactStore(self.user)
+        for _id, stored in list(self._resources.items()):
+            body = copy._resources[_id] = self.pool.get(stored)
+            copy._size += copy.get_stored_size(body)
+        copy._user_size = copy._size
+        return copy
+
+    @classmethod
+    def delete_all(cls):
+        cls.pool.clear()
+
+    @classmethod
+    def get_shared_size(cls):
+        return cls.pool.get_size()
+
+
+stores = {
+    "dict": DictStore,
+    "compact": CompactStore,
+    "dedup": DedupStore
+}
+
+
+def get_store_class(name):
+    """Return the store class by its name."""
+    if name == "shared":
+        # this needs fcntl and is not available on all platforms
+        from schul_cloud_resources_server_tests.shared_store import SharedStore
+        return SharedStore
+    return stores[name]
+
+
+__all__ = ["ADDED", "REPLACED", "UNCHANGED", "OperationFailed", "Store", "DictStore", "CompactStore", "DedupStore", "BodyPool", "stores", "get_store_class", "intern_string"]
@@ -19,6 +19,7 @@ import json
 import shutil
 import os
 import base64
+import re
 import schul_cloud_resources_api_v1.auth as auth
 from schul_cloud_resources_api_v1.rest import ApiException
 from schul_cloud_resources_api_v1 import ApiClient, ResourceApi
@@ -75,6 +76,7 @@ def pytest_addoption(parser):
     - token to add the token to a list
     - basic to add the credentials to a list
     - noauth if you do not want to test without authentication
+    - concurrency to set the number of parallel requests
     """
     parser.addoption("--url", action="store", default="http://localhost:8080/v1/",
         help="url: the url of the server api to connect to")
@@ -84,6 +86,8 @@ def pytest_addoption(parser):
         help="basic: list of basic authentications to use")
     parser.addoption("--apikey", action="append", default=[],
         help="apikey: list of api key authentications to use")
+    parser.addoption("--concurrency", action="store", default="20", type=int,
+        help="concurrency: the number of requests sent at the same time")
 
 ERROR_BASIC = "user name and password must be divided by \":\" when "\
               "using --basic=username:password as a test parameter"
@@ -285,6 +289,12 @@ def url(request):
     return request.config.getoption("--url").rstrip("/")
 
 
+@pytest.fixture
+def concurrency(request):
+    """The number of requests which are sent at the same time."""
+    return request.config.getoption("--concurrency")
+
+
 @pytest.fixture
 def client(url):
     """The client object connected to the API."""
@@ -304,19 +314,37 @@ def api(user1):
 
 
 def step(function):
-    """Allow pytest -m stepX to run test up to a certain number."""
-    step_number = len(_steps) + 1
-    step_only_marker = "step{}only".format(step_number)
-    marker_only = getattr(pytest.mark, step_only_marker)
-    step_marker = "step{}".format(step_number)
-    marker = getattr(pytest.mark, step_marker)
-    def mark_function(marker):
-        marker(function)
-    for mark_step in _steps:
-        mark_step(marker)
-    _steps.append(mark_function)
-    return marker_only(marker(function))
-_steps = []
+    """Allow pytest -m stepX to run test up to a certain number.
+
+    The test only records its number.
+    The markers are added when the tests are collected.
+    """
+    global _last_step
+    _last_step += 1
+    function._step = _last_step
+    return function
+_last_step = 0
+STEP_MARKER = re.compile(r"\bstep(\d+)(only)?\b")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """Add the step markers used by -m to the tests.
+
+    - stepN is added to the tests up to the number N.
+    - stepNonly is added to the test with the number N.
+    """
+    steps = STEP_MARKER.findall(config.getoption("markexpr", "") or "")
+    if not steps:
+        return
+    steps = [(int(number), bool(only)) for number, only in steps]
+    for item in items:
+        number = getattr(getattr(item, "function", None), "_step", None)
+        if number is None:
+            continue
+        for step_number, only in steps:
+            if number == step_number if only else number <= step_number:
+                item.add_marker("step{}{}".format(step_number, "only" if only else ""))
 __builtins__["step"] = step
 
 
@@ -1,59 +1,21 @@
 import pytest
 import time
+import os
+import sys
+import socket
+import subprocess
+import requests
 import schul_cloud_resources_api_v1.auth as auth
-from schul_cloud_resources_server_tests.app import data, app
+from schul_cloud_resources_server_tests.app import data, app, import_resources_into
+from schul_cloud_resources_server_tests.validation import warm_up
 from schul_cloud_resources_api_v1 import ApiClient, ResourceApi
-from bottle import ServerAdapter
+from schul_cloud_resources_server_tests.wsgi_server import KeepAliveServerAdapter
 from threading import Thread
 
 
-class StoppableWSGIRefServerAdapter(ServerAdapter):
-    """A bottle adapter for tests which is stoppable.
-
-    copied from bottle
-    """
-
-    def run(self, app):
-        from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
-        from wsgiref.simple_server import make_server
-        import socket
-
-        class FixedHandler(WSGIRequestHandler):
-            def address_string(self): # Prevent reverse DNS lookups please.
-                return self.client_address[0]
-            def log_request(*args, **kw):
-                if not self.quiet:
-                    return WSGIRequestHandler.log_request(*args, **kw)
-
-        handler_cls = self.options.get('handler_class', FixedHandler)
-        server_cls  = self.options.get('server_class', WSGIServer)
-
-        if ':' in self.host: # Fix wsgiref for IPv6 addresses.
-            if getattr(server_cls, 'address_family') == socket.AF_INET:
-                class server_cls(server_cls):
-                    address_family = socket.AF_INET6
-
-        self.srv = make_server(self.host, self.port, app, server_cls, handler_cls)
-        self.srv.serve_forever()
-        while not self.get_port(): time.sleep(0.001)
-
-    def shutdown(self, blocking=True):
-        """Stop the server.
-        
-        If blocking is True, this returns when the server is shut down.
-        If blocking is False, the server is notified to shut down.
-        """
-        thread=Thread(target=self.srv.shutdown)
-        thread.start()
-        if blocking:
-            thread.join()
-
-    def get_port(self):
-        """Return the port of the server."""
-        try:
-            return self.srv.socket.getsockname()[1]
-        except AttributeError:
-            return None
+# The adapter used to be based on wsgiref which closes the connection
+# after each request. The name is kept for the test suites which use it.
+StoppableWSGIRefServerAdapter = KeepAliveServerAdapter
 
 
 class ParallelBottleServer(object):
@@ -64,7 +26,7 @@ class ParallelBottleServer(object):
     def __init__(self, app, host="127.0.0.1", port=0):
         """Start the server with a bottle app."""
         self._server = StoppableWSGIRefServerAdapter(host=host, port=port)
-        self._thread = Thread(target=app.run, kwargs=dict(server=self._server))
+        self._thread = Thread(target=app.run, kwargs=dict(server=self._server, quiet=True))
         self._thread.start()
         while not self._server.get_port(): time.sleep(0.0001)
 
@@ -78,6 +40,72 @@ class ParallelBottleServer(object):
         self._thread.join()
 
 
+class ResourcesServerProcess(object):
+    """The resources server in another process.
+
+    The arguments are passed to the server, e.g. "--leader".
+    env sets environment variables of the server.
+    """
+
+    url_prefix = "/v1"
+
+    def __init__(self, *args, **kw):
+        """Start the server and wait until it answers."""
+        self.port = kw.get("port") or get_free_port()
+        with open(os.devnull, "w") as devnull:
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "schul_cloud_resources_server_tests.app",
+                 str(self.port), "--no-reload"] + list(args),
+                stdout=devnull, stderr=devnull, env=dict(os.environ, **kw.get("env", {})))
+        for i in range(200):
+            try:
+                requests.get(self.url)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.05)
+
+    @property
+    def url(self):
+        return "http://localhost:{}{}".format(self.port, self.url_prefix)
+
+    def shutdown(self):
+        """Stop the server."""
+        self._process.kill()
+        self._process.wait()
+
+
+def get_free_port():
+    """Return a port no server listens on."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class ParallelAsgiServer(object):
+    """A server that runs an ASGI application in parallel.
+
+    This requires Python 3.
+    """
+
+    url_prefix = ""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        """Start the server with an ASGI application."""
+        from schul_cloud_resources_server_tests.asgi import AsgiServer
+        self._server = AsgiServer(app, host=host, port=port)
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.start()
+        while not self._server.get_port(): time.sleep(0.0001)
+
+    url = ParallelBottleServer.url
+
+    def shutdown(self):
+        """Shut down the server."""
+        self._server.shutdown()
+        self._thread.join()
+
 
 class ResourcesApiTestServer(ParallelBottleServer):
     """Interface to get the objects."""
@@ -87,6 +115,7 @@ class ResourcesApiTestServer(ParallelBottleServer):
     def __init__(self):
         """Create a new server serving the resources api."""
         ParallelBottleServer.__init__(self, app)
+        warm_up()
 
     def get_resources(self):
         """Return all currently saved resources."""
@@ -96,6 +125,14 @@ class ResourcesApiTestServer(ParallelBottleServer):
         """Clean up all resources."""
         data.delete_resources()
 
+    def load_resources(self, path, user=None):
+        """Add the resources of an NDJSON file to the store of the user.
+
+        Return the number of loaded resources, see the transfer module.
+        """
+        with open(path, "rb") as file:
+            return import_resources_into(data.get_store(user), file).imported
+
     @property
     def api(self):
         """An resources api client connected to the server."""
@@ -104,6 +141,21 @@ class ResourcesApiTestServer(ParallelBottleServer):
         return ResourceApi(client)
 
 
+class AsyncResourcesApiTestServer(ParallelAsgiServer, ResourcesApiTestServer):
+    """The resources api served with asyncio, see the asgi module.
+
+    This requires Python 3.
+    """
+
+    url_prefix = ResourcesApiTestServer.url_prefix
+
+    def __init__(self):
+        """Create a new server serving the resources api."""
+        from schul_cloud_resources_server_tests.asgi import app as asgi_app
+        ParallelAsgiServer.__init__(self, asgi_app)
+        warm_up()
+
+
 @pytest.fixture(scope="session")
 def session_resources_server():
     """Return the server to store resources."""
@@ -120,5 +172,24 @@ def resources_server(session_resources_server):
     session_resources_server.delete_resources()
 
 
+@pytest.fixture(scope="session")
+def session_async_resources_server():
+    """Return the server to store resources which uses asyncio."""
+    session_async_resources_server = AsyncResourcesApiTestServer()
+    yield session_async_resources_server
+    session_async_resources_server.shutdown()
+
+
+@pytest.fixture
+def async_resources_server(session_async_resources_server):
+    """Return a fresh server object with no resources which uses asyncio."""
+    session_async_resources_server.delete_resources()
+    yield session_async_resources_server
+    session_async_resources_server.delete_resources()
+
+
 __all__  = ["StoppableWSGIRefServerAdapter", "ParallelBottleServer", "ResourcesApiTestServer",
-            "session_resources_server", "resources_server"]
+            "ResourcesServerProcess", "get_free_port",
+            "ParallelAsgiServer", "AsyncResourcesApiTestServer",
+            "session_resources_server", "resources_server",
+            "session_async_resources_server", "async_resources_server"]
@@ -0,0 +1,62 @@
+"""Test that clients which send too many requests are rejected."""
+import requests
+from threading import Thread, Event
+from bottle import HTTPError
+from pytest import fixture, raises
+from schul_cloud_resources_server_tests.app import admission
+from schul_cloud_resources_server_tests.admission import TokenBucket, AdmissionControl
+from schul_cloud_resources_server_tests.tests.assertions import assertIsError
+
+
+@fixture
+def limited_server(resources_server):
+    """A server which allows two requests per user."""
+    admission.configure(rate=0.1, burst=2)
+    yield resources_server
+    admission.configure()
+
+
+def test_bucket_gives_burst_tokens():
+    bucket = TokenBucket(1, 3)
+    assert [bucket.take() for i in range(3)] == [0, 0, 0]
+    assert 0 < bucket.take() <= 1
+
+
+def test_too_many_requests_are_rejected(limited_server):
+    url = limited_server.url + "/resources/ids"
+    assert requests.get(url).status_code == 200
+    assert requests.get(url).status_code == 200
+    response = requests.get(url)
+    assertIsError(response, 429)
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_users_are_limited_separately(limited_server):
+    url = limited_server.url + "/resources/ids"
+    for i in range(3):
+        requests.get(url)
+    response = requests.get(url, auth=("valid1@schul-cloud.org", "123abc"))
+    assert response.status_code == 200
+
+
+def test_requests_in_flight_are_limited():
+    """Requests over SCRST_MAX_IN_FLIGHT are rejected while others run."""
+    control = AdmissionControl.from_environment({"SCRST_MAX_IN_FLIGHT": "1"})
+    entered = Event()
+    release = Event()
+    def slow_request():
+        entered.set()
+        release.wait(5)
+        return "done"
+    handle = control.apply(slow_request, None)
+    thread = Thread(target=handle)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        with raises(HTTPError) as error:
+            handle()
+        assert error.value.status_code == 429
+    finally:
+        release.set()
+        thread.join()
+    assert handle() == "done"
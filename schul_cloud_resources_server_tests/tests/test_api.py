@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 import requests
 import time
+import threading
 from pytest import fixture, mark, raises, skip
 from schul_cloud_resources_server_tests.tests.assertions import *
 from schul_cloud_resources_api_v1.rest import ApiException
@@ -608,6 +609,91 @@ class TestAuthentication:
         assertIsError(result, 401)
 
 
+def in_parallel(function, count):
+    """Call function(i) in count threads at the same time.
+
+    Return the results in the order of i.
+    """
+    results = [None] * count
+    errors = []
+    start = threading.Event()
+    def run(i):
+        start.wait()
+        try:
+            results[i] = function(i)
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class TestConcurrency:
+    """Test requests which the server handles at the same time.
+
+    Races show up when the server handles requests in parallel.
+    Use --concurrency to set the number of parallel requests.
+    """
+
+    @fixture
+    def post(self, a_user, url):
+        """Return a function which posts a resource."""
+        def post(resource, **kw):
+            return a_user.post(url + "/resources", json=resource_dict(resource, **kw),
+                               headers={"Content-Type": API_CONTENT_TYPE})
+        return post
+
+    @step
+    def test_only_one_post_to_the_same_id_succeeds(
+            self, a_user, post, concurrency, valid_resources):
+        """Many clients post to the same id but only one gets 201."""
+        a_user.api.delete_resources()
+        responses = in_parallel(
+            lambda i: post(valid_resources[i % len(valid_resources)], id="race"),
+            concurrency)
+        statuses = [response.status_code for response in responses]
+        assert statuses.count(201) == 1, statuses
+        assert statuses.count(403) == concurrency - 1, statuses
+        winner = statuses.index(201)
+        resource = a_user.api.get_resource("race")
+        assert resource.data.attributes == valid_resources[winner % len(valid_resources)]
+
+    @step
+    def test_generated_ids_are_unique(self, a_user, post, concurrency, a_valid_resource):
+        """Resources posted at the same time get different ids."""
+        a_user.api.delete_resources()
+        responses = in_parallel(lambda i: post(a_valid_resource), concurrency)
+        assert [response.status_code for response in responses] == [201] * concurrency
+        ids = [response.json()["data"]["id"] for response in responses]
+        assert len(set(ids)) == concurrency, ids
+        listed = [data.id for data in a_user.api.get_resource_ids().data]
+        assert sorted(listed) == sorted(ids)
+
+    @step
+    def test_delete_all_resources_while_adding(
+            self, a_user, url, post, concurrency, a_valid_resource):
+        """Deleting all resources while adding leaves the server consistent."""
+        a_user.api.delete_resources()
+        def add_or_delete(i):
+            if i % 4 == 0:
+                return a_user.delete(url + "/resources")
+            return post(a_valid_resource, id="interleaved-{}".format(i))
+        responses = in_parallel(add_or_delete, concurrency)
+        for response in responses:
+            assert response.status_code in (201, 204), response.text
+        for data in a_user.api.get_resource_ids().data:
+            resource = a_user.api.get_resource(data.id)
+            assert resource.data.attributes == a_valid_resource
+        a_user.api.delete_resources()
+        assert a_user.api.get_resource_ids().data == []
+
+
 # TODO: test links and jsonapi properties of get resource and get resource ids
 
 
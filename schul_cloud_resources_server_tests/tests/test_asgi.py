@@ -0,0 +1,135 @@
+"""Test the resources api served with asyncio.
+
+The whole api is tested by running test_api.py against the asgi module:
+
+    python -m schul_cloud_resources_server_tests.asgi 8081
+    python -m schul_cloud_resources_server_tests.tests --url=http://localhost:8081/v1
+"""
+import sys
+import json
+import time
+import socket
+import requests
+from pytest import mark
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+pytestmark = mark.skipif(sys.version_info < (3, 5), reason="asyncio requires Python 3.5")
+
+
+def get_port(server):
+    """Return the port of the server."""
+    return int(server.url.split(":")[-1].split("/")[0])
+
+
+def test_server_works_on_data(async_resources_server, valid_resource):
+    """The asyncio server uses the same store as the bottle server."""
+    async_resources_server.api.add_resource({"data": {"type": "resource", "attributes": valid_resource}})
+    assert async_resources_server.get_resources() == [valid_resource]
+
+
+def test_connection_is_kept_alive(async_resources_server, a_valid_resource):
+    """Several requests can be sent over one connection."""
+    port = get_port(async_resources_server)
+    connection = HTTPConnection("localhost", port)
+    for i in range(3):
+        connection.request("GET", "/v1/resources/ids")
+        response = connection.getresponse()
+        assert response.status == 200
+        response.read()
+    connection.close()
+
+
+def test_idle_connections_do_not_block_requests(async_resources_server):
+    """Slow clients which do not send a request do not block the others."""
+    port = get_port(async_resources_server)
+    idle = [socket.create_connection(("localhost", port)) for i in range(100)]
+    try:
+        idle[0].send(b"GET /v1/resources/ids HTTP/1.1\r\n") # incomplete
+        response = requests.get(async_resources_server.url + "/resources/ids", timeout=5)
+        assert response.status_code == 200
+    finally:
+        for connection in idle:
+            connection.close()
+
+
+def test_errors_are_jsonapi(async_resources_server):
+    response = requests.get(async_resources_server.url + "/resources/unknown")
+    assert response.status_code == 404
+    assert response.headers["Content-Type"] == "application/vnd.api+json"
+    assert response.json()["errors"][0]["status"] == "404"
+
+
+def test_large_bodies_are_refused(async_resources_server):
+    """The body is not read if it is too large."""
+    port = get_port(async_resources_server)
+    connection = socket.create_connection(("localhost", port))
+    try:
+        connection.sendall(b"POST /v1/resources HTTP/1.1\r\nHost: localhost\r\n"
+                           b"Content-Length: 1000000000\r\n\r\n")
+        assert connection.recv(1024).startswith(b"HTTP/1.1 413 ")
+    finally:
+        connection.close()
+
+
+def test_shutdown_with_idle_connection():
+    """Open keep-alive connections do not keep the server running."""
+    from schul_cloud_resources_server_tests.asgi import app
+    from schul_cloud_resources_server_tests.tests.fixtures import ParallelAsgiServer
+    server = ParallelAsgiServer(app)
+    connection = HTTPConnection("localhost", server._server.get_port())
+    connection.request("GET", "/v1/resources/ids")
+    connection.getresponse().read()
+    start = time.time()
+    server.shutdown()
+    assert time.time() - start < 5
+    connection.close()
+
+
+def test_several_resources_can_be_deleted(async_resources_server, a_valid_resource):
+    async_resources_server.api.add_resource({"data": {"type": "resource", "id": "1",
+                                                      "attributes": a_valid_resource}})
+    response = requests.post(async_resources_server.url + "/resources/delete",
+                             json={"data": [{"type": "id", "id": "1"}, {"type": "id", "id": "2"}]},
+                             headers={"Content-Type": "application/vnd.api+json"})
+    assert response.json()["meta"] == {"deleted": 1, "missing": ["2"]}
+    assert async_resources_server.get_resources() == []
+
+
+def test_events_are_streamed(async_resources_server, a_valid_resource):
+    response = requests.get(async_resources_server.url + "/resources/events", stream=True)
+    try:
+        lines = response.iter_lines()
+        assert next(lines) == b"retry: 1000"
+        async_resources_server.api.add_resource({"data": {"type": "resource", "id": "1",
+                                                          "attributes": a_valid_resource}})
+        assert next(lines) == b""
+        assert next(lines).startswith(b"id: ")
+        assert next(lines) == b"event: add"
+    finally:
+        response.close()
+
+
+def test_operations_are_applied(async_resources_server, a_valid_resource):
+    response = requests.post(async_resources_server.url + "/operations", json={
+        "atomic:operations": [{"op": "add", "data": {"type": "resource", "id": "1",
+                                                     "attributes": a_valid_resource}},
+                              {"op": "remove", "ref": {"type": "resource", "id": "2"}}]},
+        headers={"Content-Type": "application/vnd.api+json"})
+    assert response.status_code == 404
+    assert response.json()["errors"][0]["source"]["pointer"] == "/atomic:operations/1"
+    assert async_resources_server.get_resources() == []
+
+
+def test_resources_are_exported_and_imported(async_resources_server, a_valid_resource):
+    line = json.dumps({"type": "resource", "id": "1", "attributes": a_valid_resource})
+    response = requests.post(async_resources_server.url + "/import", data=line + "\n{\n",
+                             headers={"Content-Type": "application/x-ndjson"})
+    assert response.json()["meta"]["imported"] == 1
+    assert response.json()["meta"]["invalid"] == 1
+    response = requests.get(async_resources_server.url + "/export")
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert json.loads(response.content) == json.loads(line)
@@ -0,0 +1,22 @@
+"""Test the memory benchmark of the stores."""
+from pytest import mark, importorskip
+from schul_cloud_resources_server_tests.benchmark import measure, get_store_names
+
+
+@mark.parametrize("store", get_store_names())
+def test_memory_of_the_stores(store):
+    importorskip("tracemalloc")
+    result = measure(store, 200)
+    assert result["store"] == store
+    assert result["stored"] == 200
+    assert result["bytes_per_resource"] > 0
+    assert result["peak_bytes"] >= result["bytes_per_resource"] * 200
+    assert result["retained_bytes"] < result["bytes_per_resource"] * 200
+    assert result["rss_peak"] >= result["rss_before"]
+
+
+def test_resources_are_added_with_http():
+    importorskip("tracemalloc")
+    result = measure("dict", 10, via="http")
+    assert result["stored"] == 10
+    assert result["via"] == "http"
@@ -0,0 +1,119 @@
+"""Test the limits of the stored resources."""
+import time
+import requests
+from pytest import fixture, raises
+from bottle import HTTPError
+from schul_cloud_resources_server_tests.app import budget as app_budget
+from schul_cloud_resources_server_tests.budget import Budget
+from schul_cloud_resources_server_tests.store import DictStore, DedupStore, BodyPool
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+
+
+@fixture
+def stores():
+    """The stores of the users."""
+    return {}
+
+
+def get_size(stores):
+    return sum(store.get_size() for store in stores.values())
+
+
+@fixture
+def budget(stores):
+    """A budget for the stores without limits."""
+    budget = Budget(stores.__getitem__, get_size=lambda: get_size(stores))
+    for user in ("a", "b"):
+        stores[user] = DictStore(user, [budget.record])
+    return budget
+
+
+def add(budget, store, _id, resource):
+    """Add a resource like the server does."""
+    budget.admit(store)
+    store.add(_id, resource)
+    budget.enforce(store.user, _id)
+
+
+def test_the_oldest_resources_are_evicted(budget, stores, valid_resource):
+    budget.configure(max_resources=3)
+    add(budget, stores["a"], "1", valid_resource)
+    add(budget, stores["b"], "2", valid_resource)
+    add(budget, stores["a"], "3", valid_resource)
+    add(budget, stores["b"], "4", valid_resource)
+    assert list(stores["a"]) == ["3"]
+    assert sorted(stores["b"]) == ["2", "4"]
+    assert budget.evicted == 1
+
+
+def test_bytes_are_limited(budget, stores, valid_resource):
+    budget.configure(max_bytes=DictStore("").get_stored_size(valid_resource) * 2)
+    for _id in "12345":
+        add(budget, stores["a"], _id, valid_resource)
+    assert list(stores["a"]) == ["4", "5"]
+
+
+def test_a_resource_larger_than_the_budget_is_rejected(budget, stores, valid_resource):
+    budget.configure(max_bytes=10)
+    with raises(HTTPError) as error:
+        add(budget, stores["a"], "1", valid_resource)
+    assert error.value.status_code == 507
+    assert list(stores["a"]) == []
+
+
+def test_users_are_limited(budget, stores, valid_resource):
+    budget.configure(max_user_resources=2)
+    add(budget, stores["a"], "1", valid_resource)
+    add(budget, stores["a"], "2", valid_resource)
+    with raises(HTTPError) as error:
+        add(budget, stores["a"], "3", valid_resource)
+    assert error.value.status_code == 507
+    budget.admit(stores["a"], "2") # replacing is possible
+    add(budget, stores["b"], "3", valid_resource)
+
+
+def test_users_pay_for_shared_resources(budget, valid_resource):
+    pool = BodyPool()
+    store = DedupStore("a", [budget.record], pool)
+    DedupStore("b", pool=pool).add("1", valid_resource)
+    body_size = pool.get_size()
+    budget.configure(max_user_bytes=body_size * 2)
+    add(budget, store, "1", valid_resource)
+    add(budget, store, "2", valid_resource)
+    assert store.get_user_size() == body_size * 2
+    assert store.get_size() < body_size
+    with raises(HTTPError) as error:
+        add(budget, store, "3", valid_resource)
+    assert error.value.status_code == 507
+    store.pop("1")
+    assert store.get_user_size() == body_size
+def test_expired_resources_are_hidden_and_swept(budget, stores, valid_resource):
+    budget.configure(ttl=0.05, sweep_interval=3600)
+    add(budget, stores["a"], "1", valid_resource)
+    assert budget.get_ids(stores["a"]) == ["1"]
+    time.sleep(0.1)
+    add(budget, stores["a"], "2", valid_resource)
+    assert budget.is_expired("a", "1")
+    assert budget.get_ids(stores["a"]) == ["2"]
+    assert "1" in stores["a"]
+    budget.sweep()
+    assert list(stores["a"]) == ["2"]
+    assert budget.expired == 1
+
+
+@fixture
+def limited_server(resources_server):
+    """The server with a limit of one resource per user."""
+    app_budget.configure(max_user_resources=1)
+    yield resources_server
+    app_budget.configure()
+
+
+def test_the_server_rejects_resources_over_the_limit(limited_server, valid_resource):
+    body = {"data": {"attributes": valid_resource, "type": "resource"}}
+    assert USER.post(limited_server.url + "/resources", json=body).status_code == 201
+    response = USER.post(limited_server.url + "/resources", json=body)
+    assert response.status_code == 507
+    assert response.json()["errors"][0]["status"] == "507"
@@ -0,0 +1,96 @@
+"""Test the cache of the id listings."""
+from schul_cloud_resources_server_tests.app import ids_cache
+from schul_cloud_resources_server_tests.cache import ResponseCache
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+
+
+class Create(object):
+    """Count the created responses."""
+
+    def __init__(self, content=b"ids"):
+        self.content = content
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.content
+
+
+def test_the_response_is_cached():
+    cache = ResponseCache()
+    create = Create()
+    assert cache.get("a", "host", create) == b"ids"
+    assert cache.get("a", "host", create) == b"ids"
+    assert create.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_a_change_makes_the_responses_of_the_user_stale():
+    cache = ResponseCache()
+    create = Create()
+    cache.get("a", "host", create)
+    cache.get("b", "host", create)
+    cache.record("add", "a", "1", {})
+    cache.get("a", "host", create)
+    cache.get("b", "host", create)
+    assert create.calls == 3
+
+
+def test_a_new_store_version_makes_the_response_stale():
+    cache = ResponseCache()
+    create = Create()
+    cache.get("a", "host", create, 1)
+    cache.get("a", "host", create, 1)
+    cache.get("a", "host", create, 2)
+    assert create.calls == 2
+
+def test_the_host_is_part_of_the_key():
+    cache = ResponseCache()
+    create = Create()
+    cache.get("a", "localhost", create)
+    cache.get("a", "example.org", create)
+    assert create.calls == 2
+
+
+def test_reset_removes_all_responses():
+    cache = ResponseCache()
+    cache.get("a", "host", Create())
+    cache.record("reset", None)
+    assert cache.get_size() == 0
+
+
+def test_the_least_recently_used_responses_are_removed():
+    cache = ResponseCache(max_bytes=6)
+    first, second, third = Create(b"111"), Create(b"222"), Create(b"333")
+    cache.get("a", "host", first)
+    cache.get("b", "host", second)
+    cache.get("a", "host", first)
+    cache.get("c", "host", third)
+    assert cache.get_size() == 6
+    cache.get("a", "host", first)
+    cache.get("b", "host", second)
+    assert (first.calls, second.calls) == (1, 2)
+
+
+def test_a_change_while_creating_is_not_cached():
+    cache = ResponseCache()
+    def create():
+        cache.record("delete", "a", "1")
+        return b"old"
+    cache.get("a", "host", create)
+    assert cache.get_size() == 0
+
+
+def test_the_server_lists_the_ids_after_changes(resources_server, valid_resource):
+    url = resources_server.url + "/resources"
+    body = {"data": {"attributes": valid_resource, "type": "resource", "id": "cached"}}
+    assert USER.get(url + "/ids").json()["data"] == []
+    hits = ids_cache.hits
+    assert USER.get(url + "/ids").json()["data"] == []
+    assert ids_cache.hits == hits + 1
+    assert USER.post(url, json=body).status_code == 201
+    assert USER.get(url + "/ids").json()["data"] == [{"type": "id", "id": "cached"}]
+    assert USER.delete(url + "/cached").status_code == 200
+    assert USER.get(url + "/ids").json()["data"] == []
@@ -0,0 +1,107 @@
+"""Test capturing requests and replaying them against a server."""
+import io
+import json
+import time
+import requests
+from threading import Thread
+from bottle import run
+from pytest import fixture
+from schul_cloud_resources_server_tests.app import app, identify
+from schul_cloud_resources_server_tests.capture import Capture
+from schul_cloud_resources_server_tests.log import Logger
+from schul_cloud_resources_server_tests.replay import Replay, report
+from schul_cloud_resources_server_tests.wsgi_server import KeepAliveServerAdapter
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+API_KEY_USER = User(None, "apikey", "valid1@schul-cloud.org", "abcdefghijklmn")
+
+
+class CaptureServer(object):
+    """A server which captures the requests to the app."""
+
+    def __init__(self):
+        """Start the server."""
+        self.stream = io.StringIO()
+        self.log = Logger(self.stream)
+        self._server = KeepAliveServerAdapter(host="127.0.0.1", port=0)
+        self._thread = Thread(target=run, kwargs=dict(
+            app=Capture(app, self.log, identify=identify),
+            server=self._server, quiet=True))
+        self._thread.start()
+        while not self._server.get_port(): time.sleep(0.0001)
+        self.url = "http://localhost:{}/v1".format(self._server.get_port())
+
+    def records(self):
+        """Return the captured requests."""
+        self.log.flush()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def shutdown(self):
+        """Stop the server."""
+        self._server.shutdown()
+        self._thread.join()
+
+
+@fixture
+def capture_server(resources_server):
+    """A server which captures its requests."""
+    server = CaptureServer()
+    yield server
+    server.shutdown()
+
+
+def test_secrets_are_not_captured(capture_server):
+    API_KEY_USER.get(capture_server.url + "/resources/ids",
+                     headers={"Cookie": "session=secret"})
+    USER.get(capture_server.url + "/resources/ids")
+    requests.get(capture_server.url + "/resources/ids",
+                 headers={"Authorization": "api-key key=aW52YWxpZA=="})
+    records = capture_server.records()
+    assert [(record["auth"], record["user"]) for record in records] == [
+        ("apikey", "valid1@schul-cloud.org"),
+        ("basic", "valid1@schul-cloud.org"),
+        ("invalid", None)]
+    assert [record["status"] for record in records] == [200, 200, 401]
+    for record in records:
+        assert "Authorization" not in record["headers"]
+        assert "Cookie" not in record["headers"]
+    log = capture_server.stream.getvalue()
+    assert "123abc" not in log
+    assert "session=secret" not in log
+    assert "aW52YWxpZA==" not in log
+
+
+def test_the_export_is_recorded_when_it_ends(capture_server, a_valid_resource):
+    line = json.dumps({"type": "resource", "id": "1", "attributes": a_valid_resource})
+    USER.post(capture_server.url + "/import", data=line,
+              headers={"Content-Type": "application/x-ndjson"})
+    response = USER.get(capture_server.url + "/export")
+    assert json.loads(response.content)["id"] == "1"
+    records = capture_server.records()
+    for i in range(100):
+        if len(records) == 2:
+            break
+        time.sleep(0.01) # the server closes the export after it is sent
+        records = capture_server.records()
+    assert [(record["path"], record["status"]) for record in records] == [
+        ("/v1/import", 200), ("/v1/export", 200)]
+def test_captured_requests_are_replayed(capture_server, resources_server,
+                                        valid_resource):
+    """The replay translates the ids of the created resources."""
+    body = {"data": {"attributes": valid_resource, "type": "resource"}}
+    response = USER.post(capture_server.url + "/resources", json=body)
+    assert response.status_code == 201
+    url = capture_server.url + "/resources/" + response.json()["data"]["id"]
+    assert USER.get(url).status_code == 200
+    assert requests.get(url).status_code == 404
+    assert USER.delete(url).status_code == 200
+    assert USER.get(url).status_code == 404
+    records = capture_server.records()
+    resources_server.delete_resources()
+    replay = Replay(resources_server.url, [USER], speed=None, concurrency=1)
+    result = report(replay.run(records))
+    assert result["requests"] == 5
+    assert result["errors"] == 0
+    assert result["status_differences"] == {}
+    assert list(replay._ids.values()) != list(replay._ids.keys())
@@ -0,0 +1,56 @@
+"""Test the deletion of several resources with one request."""
+from pytest import fixture
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+HEADERS = {"Content-Type": "application/vnd.api+json"}
+
+
+@fixture
+def resources_url(resources_server, valid_resource):
+    """The resources url of the server with three resources."""
+    url = resources_server.url + "/resources"
+    for _id, language in (("1", "de"), ("2", "en"), ("3", "de")):
+        resource = dict(valid_resource, languages=[language])
+        body = {"data": {"attributes": resource, "type": "resource", "id": _id}}
+        assert USER.post(url, json=body, headers=HEADERS).status_code == 201
+    return url
+
+
+def get_ids(url):
+    return sorted(entry["id"] for entry in USER.get(url + "/ids").json()["data"])
+
+
+def delete(url, body):
+    return USER.post(url + "/delete", json=body, headers=HEADERS)
+
+
+def test_delete_by_ids(resources_url):
+    response = delete(resources_url, {"data": [{"type": "id", "id": "1"},
+                                               {"type": "id", "id": "4"}]})
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"deleted": 1, "missing": ["4"]}
+    assert get_ids(resources_url) == ["2", "3"]
+
+
+def test_delete_by_filter(resources_url):
+    response = delete(resources_url, {"filter": {"languages": "de"}})
+    assert response.json()["meta"] == {"deleted": 2}
+    assert get_ids(resources_url) == ["2"]
+
+
+def test_an_empty_filter_is_rejected(resources_url):
+    response = delete(resources_url, {"filter": {}})
+    assert response.status_code == 422
+    assert get_ids(resources_url) == ["1", "2", "3"]
+
+
+def test_ids_must_be_listed_like_the_ids_response(resources_url):
+    assert delete(resources_url, {"data": ["1"]}).status_code == 422
+    assert delete(resources_url, {"data": [], "filter": {"title": "x"}}).status_code == 422
+
+
+def test_delete_is_not_an_id(resources_server, valid_resource):
+    body = {"data": {"attributes": valid_resource, "type": "resource", "id": "delete"}}
+    response = USER.post(resources_server.url + "/resources", json=body, headers=HEADERS)
+    assert response.status_code == 403
@@ -0,0 +1,87 @@
+"""Test the Server-Sent Events of the changes."""
+import requests
+from schul_cloud_resources_server_tests.events import EventStream, RETRY, format_event
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+
+
+def get_events(subscription):
+    """Return the events waiting for the subscription."""
+    result = []
+    event = subscription.get()
+    while event is not None:
+        result.append(event)
+        event = subscription.get()
+    return result
+
+
+def test_subscribers_get_the_events_of_their_user():
+    stream = EventStream()
+    subscription = stream.subscribe("a")
+    stream.record("add", "a", "1", {})
+    stream.record("add", "b", "2", {})
+    stream.record("delete", "a", "1")
+    assert get_events(subscription) == [(1, "add", "1"), (3, "delete", "1")]
+
+
+def test_a_reset_is_a_clear_for_everyone():
+    stream = EventStream()
+    subscription = stream.subscribe("a")
+    stream.record("reset", None)
+    assert get_events(subscription) == [(1, "clear", None)]
+
+
+def test_missed_events_are_sent_after_the_last_event_id():
+    stream = EventStream()
+    stream.record("add", "a", "1", {})
+    stream.record("add", "a", "2", {})
+    stream.record("add", "b", "3", {})
+    assert get_events(stream.subscribe("a", "1")) == [(2, "add", "2")]
+
+
+def test_a_reset_event_is_sent_when_events_are_lost():
+    stream = EventStream(max_events=2)
+    for _id in "123":
+        stream.record("add", "a", _id, {})
+    assert get_events(stream.subscribe("a", "0")) == [(3, "reset", None)]
+    assert get_events(stream.subscribe("a", "1")) == [(2, "add", "2"), (3, "add", "3")]
+    assert get_events(stream.subscribe("a", "invalid")) == [(3, "reset", None)]
+
+
+def test_a_full_queue_ends_the_stream():
+    stream = EventStream(queue_size=1)
+    subscription = stream.subscribe("a")
+    stream.record("add", "a", "1", {})
+    stream.record("add", "a", "2", {})
+    chunks = list(stream.iter_events(subscription))
+    assert chunks == [RETRY, format_event((1, "add", "1"))]
+    assert stream.count_subscriptions() == 0
+
+
+def test_the_stream_ends_when_the_server_closes():
+    stream = EventStream()
+    subscription = stream.subscribe("a")
+    assert list(stream.iter_events(subscription, lambda: True)) == [RETRY]
+
+
+def test_format_event():
+    assert format_event((5, "put", "x")) == b'id: 5\nevent: put\ndata: {"id": "x"}\n\n'
+
+
+def test_the_server_sends_events(resources_server, valid_resource):
+    url = resources_server.url + "/resources"
+    response = USER.get(url + "/events", stream=True, headers={"Accept": "text/event-stream"})
+    try:
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        lines = response.iter_lines()
+        assert next(lines) == b"retry: 1000"
+        body = {"data": {"attributes": valid_resource, "type": "resource", "id": "streamed"}}
+        assert USER.post(url, json=body).status_code == 201
+        assert next(lines) == b""
+        assert next(lines).startswith(b"id: ")
+        assert next(lines) == b"event: add"
+        assert next(lines) == b'data: {"id": "streamed"}'
+    finally:
+        response.close()
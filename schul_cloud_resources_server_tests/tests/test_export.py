@@ -0,0 +1,110 @@
+"""Test the export and the import of the resources as NDJSON."""
+import io
+import json
+from pytest import raises
+from schul_cloud_resources_server_tests.transfer import (
+    Import, iter_export, iter_batches, get_headers, main, CONTENT_TYPE)
+from schul_cloud_resources_server_tests.generator import ResourceGenerator, write_ndjson
+from schul_cloud_resources_server_tests.store import DictStore
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+
+
+def to_line(_id, resource):
+    return json.dumps({"type": "resource", "id": _id, "attributes": resource})
+
+
+def test_the_export_can_be_imported(a_valid_resource):
+    store = DictStore("user")
+    for _id in ["1", "2", "3"]:
+        store.add(_id, a_valid_resource)
+    lines = b"".join(iter_export(store, batch_size=2)).splitlines()
+    assert len(lines) == 3
+    copy = DictStore("user")
+    assert Import(copy).read(lines).imported == 3
+    assert sorted(copy) == ["1", "2", "3"]
+    assert copy.get("2") == a_valid_resource
+
+
+def test_invalid_lines_are_skipped(a_valid_resource, invalid_resource):
+    store = DictStore("user")
+    lines = [to_line("1", a_valid_resource), "", "{", to_line("2", invalid_resource),
+             json.dumps(a_valid_resource)]
+    result = Import(store, batch_size=1).read(lines).get_result()
+    assert result["imported"] == 2
+    assert result["invalid"] == 2
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    assert len(store) == 2 and "1" in store
+
+
+def test_batches_are_limited_by_lines_and_bytes():
+    lines = [b"a" * 10, b"b" * 10, b"c" * 30, b"d", b"e", b"f"]
+    assert list(iter_batches(lines, 2, max_bytes=25)) == [
+        [b"a" * 10, b"b" * 10], [b"c" * 30], [b"d", b"e"], [b"f"]]
+
+
+def test_the_server_exports_and_imports(resources_server, a_valid_resource):
+    url = resources_server.url
+    body = "\n".join([to_line("1", a_valid_resource), to_line("invalid id", a_valid_resource),
+                      json.dumps(a_valid_resource)])
+    response = USER.post(url + "/import", data=body, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 200
+    meta = response.json()["meta"]
+    assert (meta["imported"], meta["invalid"]) == (2, 1)
+    assert meta["errors"][0]["line"] == 2
+    response = USER.get(url + "/export")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith(CONTENT_TYPE)
+    lines = [json.loads(line) for line in response.content.splitlines()]
+    assert len(lines) == 2
+    assert {"type": "resource", "id": "1", "attributes": a_valid_resource} in lines
+
+
+def test_the_import_needs_ndjson(resources_server):
+    response = USER.post(resources_server.url + "/import", json={})
+    assert response.status_code == 415
+
+
+def test_the_fixture_loads_a_file(resources_server, tmpdir):
+    path = tmpdir.join("resources.ndjson")
+    with io.open(str(path), "w", encoding="utf-8") as file:
+        write_ndjson(ResourceGenerator(0).generate(5), file)
+    assert resources_server.load_resources(str(path), "valid1@schul-cloud.org") == 5
+    response = USER.get(resources_server.url + "/resources/ids")
+    assert len(response.json()["data"]) == 5
+
+
+def test_the_command_line_copies_the_resources(resources_server, a_valid_resource, tmpdir,
+                                               capsys):
+    path = str(tmpdir.join("resources.ndjson"))
+    with open(path, "w") as file:
+        file.write("\n".join(to_line(_id, a_valid_resource) for _id in "123") + "\n")
+    args = ["--url", resources_server.url, "--basic", "valid1@schul-cloud.org:123abc"]
+    main(["import", path, "--batch-size", "2"] + args)
+    assert "\"imported\": 3" in capsys.readouterr().out
+    resources_server.delete_resources()
+    main(["import", path] + args)
+    exported = str(tmpdir.join("exported.ndjson"))
+    main(["export", exported] + args)
+    with open(exported) as file:
+        assert sorted(json.loads(line)["id"] for line in file) == ["1", "2", "3"]
+
+
+def test_the_command_line_reports_errors(resources_server, tmpdir, capsys):
+    path = str(tmpdir.join("resources.ndjson"))
+    with open(path, "w") as file:
+        file.write("{}\n")
+    with raises(SystemExit) as error:
+        main(["import", path, "--url", resources_server.url,
+              "--basic", "valid1@schul-cloud.org:wrong"])
+    assert error.value.code == 1
+    assert "/import: Could not do basic authentication" in capsys.readouterr().err
+
+
+def test_the_headers_authenticate_like_the_tests():
+    assert get_headers() == {}
+    assert get_headers("valid1@schul-cloud.org:123abc") == USER._get_auth_headers({})
+    key_user = User(None, "apikey", "valid1@schul-cloud.org", "abcdefghijklmn")
+    assert get_headers(apikey="valid1@schul-cloud.org:abcdefghijklmn") == \
+        key_user._get_auth_headers({})
@@ -0,0 +1,39 @@
+"""Test the generator of resources for load tests."""
+import io
+from itertools import islice
+from pytest import fixture
+from schul_cloud_resources_server_tests.generator import (
+    ResourceGenerator, write_ndjson, read_ndjson)
+from schul_cloud_resources_server_tests.validation import get_validation_error
+
+
+@fixture
+def resource_generator():
+    """Return a generator of valid resources which always starts the same."""
+    return ResourceGenerator(seed=0)
+
+
+def test_generated_resources_are_valid(resource_generator):
+    for resource in resource_generator.generate(1000):
+        assert get_validation_error(resource) is None, resource
+
+
+def test_the_seed_reproduces_the_resources():
+    assert list(ResourceGenerator(1).generate(20)) == list(ResourceGenerator(1).generate(20))
+    assert list(ResourceGenerator(1).generate(20)) != list(ResourceGenerator(2).generate(20))
+
+
+def test_resources_differ(resource_generator):
+    resources = list(islice(resource_generator, 1000))
+    assert len(set(resource["url"] for resource in resources)) == 1000
+    assert len(set(resource["mimeType"] for resource in resources)) > 5
+    assert any(len(resource["title"]) > 100 for resource in resources)
+
+
+def test_ndjson_can_be_read(resource_generator):
+    resources = list(resource_generator.generate(100))
+    stream = io.StringIO()
+    write_ndjson(resources, stream)
+    assert len(stream.getvalue().splitlines()) == 100
+    stream.seek(0)
+    assert list(read_ndjson(stream)) == resources
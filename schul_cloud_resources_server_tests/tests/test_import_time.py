@@ -0,0 +1,45 @@
+"""Test that the server starts quickly.
+
+The server is started often in short-lived containers, e.g. for crawler builds.
+These tests fail if starting the server gets slower.
+"""
+import sys
+import subprocess
+from pytest import fixture, mark
+
+pytestmark = mark.skipif(sys.version_info < (3, 7), reason="-X importtime requires Python 3.7")
+
+# modules which take long to import and are only needed later
+LAZY_MODULES = ["jsonschema", "schul_cloud_resources_api_v1.schema", "pprint", "cProfile", "pstats"]
+
+# the time to import the server without bottle relative to bottle
+MAXIMUM_IMPORT_TIME_RELATIVE_TO_BOTTLE = 1.0
+
+
+@fixture(scope="module")
+def import_times():
+    """Return a dictionary of the cumulative import time in microseconds by module."""
+    output = subprocess.check_output(
+        [sys.executable, "-X", "importtime", "-c",
+         "import schul_cloud_resources_server_tests.app"],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative, module = line.split(":", 1)[1].split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+    return times
+
+
+@mark.parametrize("module", LAZY_MODULES)
+def test_module_is_imported_when_it_is_used(import_times, module):
+    assert module not in import_times
+
+
+def test_server_imports_fast(import_times):
+    bottle = import_times["bottle"]
+    server = import_times["schul_cloud_resources_server_tests.app"] - bottle
+    assert server < bottle * MAXIMUM_IMPORT_TIME_RELATIVE_TO_BOTTLE, \
+        "importing the server takes {}ms, bottle {}ms".format(server / 1000., bottle / 1000.)
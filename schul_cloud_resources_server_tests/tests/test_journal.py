@@ -0,0 +1,110 @@
+"""Test that the journal restores the resources."""
+import os
+import threading
+from pytest import fixture
+from schul_cloud_resources_server_tests.journal import Journal
+from schul_cloud_resources_server_tests.store import CompactStore, Store
+from schul_cloud_resources_server_tests.app import data, get_id
+
+
+class Server(object):
+    """The stores of a server which uses a journal."""
+
+    def __init__(self, directory, **kw):
+        """Load the stores from the journal."""
+        self.journal = Journal(directory, **kw)
+        self.stores = {}
+        self.journal.load(self.apply)
+        self.journal.open(self.stores.values)
+
+    def __getitem__(self, user):
+        """Return the store of the user."""
+        if user not in self.stores:
+            self.stores[user] = CompactStore(user, [self.journal.record])
+        return self.stores[user]
+
+    def apply(self, operation, user, _id=None, resource=None):
+        """Apply an operation while loading."""
+        store = self.stores.setdefault(user, CompactStore(user))
+        if operation == "add":
+            store.add(_id, resource)
+        elif operation == "delete":
+            store.pop(_id)
+        elif operation == "clear":
+            store.clear()
+        store.listeners = [self.journal.record]
+
+    def restart(self, **kw):
+        """Stop the server and load it from the journal."""
+        self.journal.close()
+        return Server(self.journal.directory, **kw)
+
+
+@fixture
+def server(tmpdir):
+    """A server with a journal."""
+    return Server(str(tmpdir))
+
+
+def test_added_resources_are_restored(server, valid_resources):
+    for i, resource in enumerate(valid_resources):
+        server["user"].add(str(i), resource)
+    server = server.restart()
+    assert sorted(server["user"].items()) == sorted(
+        (str(i), resource) for i, resource in enumerate(valid_resources))
+
+
+def test_deleted_resources_stay_deleted(server, a_valid_resource):
+    server["user1"].add("1", a_valid_resource)
+    server["user1"].add("2", a_valid_resource)
+    server["user2"].add("1", a_valid_resource)
+    server["user1"].pop("1")
+    server["user2"].clear()
+    server = server.restart()
+    assert list(server["user1"]) == ["2"]
+    assert len(server["user2"]) == 0
+
+
+def test_snapshots_replace_the_journal(tmpdir, a_valid_resource):
+    server = Server(str(tmpdir), snapshot_interval=3)
+    for i in range(10):
+        server["user"].add(str(i), a_valid_resource)
+    server = server.restart()
+    assert sorted(server["user"]) == sorted(map(str, range(10)))
+    assert len(tmpdir.listdir()) <= 4
+
+
+def test_the_rotation_syncs_without_the_lock(tmpdir, a_valid_resource, monkeypatch):
+    server = Server(str(tmpdir), snapshot_interval=2, sync_interval=3600)
+    fsync = os.fsync
+    locked = []
+    recording = threading.current_thread()
+    def checked_fsync(fd):
+        if threading.current_thread() is recording: # not the snapshot thread
+            locked.append(server.journal._lock.locked())
+        fsync(fd)
+    monkeypatch.setattr(os, "fsync", checked_fsync)
+    for i in range(4):
+        server["user"].add(str(i), a_valid_resource)
+    assert locked and not any(locked)
+    server = server.restart()
+    assert sorted(server["user"]) == ["0", "1", "2", "3"]
+def test_restored_ids_are_not_generated_again(tmpdir, a_valid_resource):
+    """After a restart, the server does not hand out the restored ids."""
+    listeners = data.listeners[:]
+    try:
+        journal = data.use_journal(str(tmpdir))
+        _id = get_id()
+        assert data.get_store(None).add(_id, a_valid_resource)
+        journal.close()
+        data.listeners[:] = listeners
+        # restart
+        data.delete_resources()
+        Store._last_id = 0
+        journal = data.use_journal(str(tmpdir))
+        assert data.get_store(None).get(_id) == a_valid_resource
+        assert data.get_store(None).add(get_id(), a_valid_resource)
+        journal.close()
+    finally:
+        data.listeners[:] = listeners
+        data.delete_resources()
@@ -0,0 +1,63 @@
+"""Test the log of the server."""
+import io
+import json
+from pytest import fixture
+from schul_cloud_resources_server_tests.log import Logger
+
+
+@fixture
+def stream():
+    """The stream the log is written to."""
+    return io.StringIO()
+
+
+def records(log, stream):
+    """Return the records written to the stream."""
+    log.flush()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_json(stream):
+    log = Logger(stream)
+    log.info("request", status=200)
+    record, = records(log, stream)
+    assert record["event"] == "request"
+    assert record["level"] == "info"
+    assert record["status"] == 200
+
+
+def test_level_filters_records(stream):
+    log = Logger(stream, level="warning")
+    log.info("request")
+    log.error("error")
+    assert [record["event"] for record in records(log, stream)] == ["error"]
+
+
+def test_sampling_keeps_errors(stream):
+    log = Logger(stream, sample_rate=0)
+    for i in range(10):
+        log.info("request")
+    log.error("error")
+    assert [record["event"] for record in records(log, stream)] == ["error"]
+
+
+class BrokenStream(io.StringIO):
+    """A stream which fails once, like a closed pipe."""
+
+    broken = True
+
+    def write(self, text):
+        if self.broken:
+            self.broken = False
+            raise IOError("broken pipe")
+        return io.StringIO.write(self, text)
+
+
+def test_log_survives_write_errors():
+    stream = BrokenStream()
+    log = Logger(stream)
+    log.info("lost")
+    log.flush()
+    log.info("written")
+    assert [record["event"] for record in records(log, stream)] == ["written"]
+    assert log.write_errors == 1
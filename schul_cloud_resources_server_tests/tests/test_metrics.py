@@ -0,0 +1,43 @@
+"""Test the metrics of the server."""
+import requests
+from threading import Thread
+from schul_cloud_resources_server_tests.metrics import Metrics
+
+
+def test_counts_of_all_threads_are_added():
+    metrics = Metrics()
+    threads = [Thread(target=metrics.count, args=("requests",), kwargs={"route": "a"})
+               for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.count("requests", route="a")
+    assert 'requests{route="a"} 4\n' in metrics.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics(buckets=(1, 2))
+    metrics.describe("duration", "histogram", "Time.")
+    metrics.observe("duration", 0.5)
+    metrics.observe("duration", 1.5)
+    metrics.observe("duration", 3)
+    lines = metrics.render().splitlines()
+    assert lines == [
+        "# HELP duration Time.",
+        "# TYPE duration histogram",
+        'duration_bucket{le="1"} 1',
+        'duration_bucket{le="2"} 2',
+        'duration_bucket{le="+Inf"} 3',
+        "duration_sum 5.0",
+        "duration_count 3"]
+
+
+def test_server_serves_metrics(resources_server, a_valid_resource):
+    resources_server.api.add_resource({"data": {"type": "resource", "attributes": a_valid_resource}})
+    response = requests.get(resources_server.url.rsplit("/", 1)[0] + "/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert 'scrst_requests_total{route="add_resource",status="201"}' in response.text
+    assert 'scrst_resources{user=""} 1' in response.text
+    assert "scrst_validation_duration_seconds_count" in response.text
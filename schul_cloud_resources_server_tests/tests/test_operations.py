@@ -0,0 +1,85 @@
+"""Test the requests with several operations, see the JSON:API atomic extension."""
+from pytest import fixture, raises
+from schul_cloud_resources_server_tests.app import ATOMIC_CONTENT_TYPE
+from schul_cloud_resources_server_tests.store import DictStore, OperationFailed
+from schul_cloud_resources_server_tests.tests.conftest import User
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+HEADERS = {"Content-Type": ATOMIC_CONTENT_TYPE, "Accept": ATOMIC_CONTENT_TYPE}
+
+
+def test_all_operations_are_applied(a_valid_resource):
+    store = DictStore("user")
+    store.add("1", a_valid_resource)
+    store.apply_all([("delete", "1"), ("add", "1", a_valid_resource), ("put", "2", a_valid_resource)])
+    assert sorted(store) == ["1", "2"]
+
+
+def test_no_operation_is_applied_if_one_fails(a_valid_resource):
+    store = DictStore("user")
+    with raises(OperationFailed) as error:
+        store.apply_all([("add", "1", a_valid_resource), ("delete", "1"), ("delete", "1")])
+    assert error.value.index == 2
+    assert len(store) == 0
+
+
+@fixture
+def operations(resources_server):
+    """Post operations to the server and return the response."""
+    url = resources_server.url + "/operations"
+    def operations(*operations, **kw):
+        return USER.post(url, json={"atomic:operations": list(operations)},
+                         headers=kw.get("headers", HEADERS))
+    return operations
+
+
+def add(_id, resource):
+    return {"op": "add", "data": {"type": "resource", "id": _id, "attributes": resource}}
+
+
+def remove(_id):
+    return {"op": "remove", "ref": {"type": "resource", "id": _id}}
+
+
+def get_ids(resources_server):
+    response = USER.get(resources_server.url + "/resources/ids")
+    return sorted(entry["id"] for entry in response.json()["data"])
+
+
+def test_operations_return_their_results(operations, resources_server, a_valid_resource):
+    response = operations(add("1", a_valid_resource), add("2", a_valid_resource),
+                          {"op": "update", "ref": {"type": "resource", "id": "1"},
+                           "data": {"type": "resource", "attributes": {"title": "changed"}}},
+                          remove("2"))
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == ATOMIC_CONTENT_TYPE
+    results = response.json()["atomic:results"]
+    assert [result.get("data", {}).get("id") for result in results] == ["1", "2", "1", None]
+    assert results[2]["data"]["attributes"]["title"] == "changed"
+    assert get_ids(resources_server) == ["1"]
+
+
+def test_a_failing_operation_changes_nothing(operations, resources_server, a_valid_resource):
+    response = operations(add("1", a_valid_resource), remove("2"))
+    assert response.status_code == 404
+    error = response.json()["errors"][0]
+    assert error["source"] == {"pointer": "/atomic:operations/1"}
+    assert get_ids(resources_server) == []
+
+
+def test_an_invalid_resource_is_pointed_at(operations, invalid_resource, a_valid_resource):
+    response = operations(add("1", a_valid_resource), add("2", invalid_resource))
+    assert response.status_code == 422
+    assert response.json()["errors"][0]["source"] == {"pointer": "/atomic:operations/1"}
+
+
+def test_the_plain_media_type_is_accepted(operations, a_valid_resource):
+    response = operations(add("1", a_valid_resource),
+                          headers={"Content-Type": "application/vnd.api+json"})
+    assert response.status_code == 200
+
+
+def test_other_extensions_are_rejected(operations, a_valid_resource):
+    response = operations(add("1", a_valid_resource), headers={
+        "Content-Type": 'application/vnd.api+json; ext="https://example.org/ext"'})
+    assert response.status_code == 415
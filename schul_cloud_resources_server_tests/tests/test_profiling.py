@@ -0,0 +1,59 @@
+"""Test the profiling of requests."""
+import os
+import pstats
+import requests
+from bottle import Bottle
+from pytest import fixture
+from schul_cloud_resources_server_tests.profiling import Profiler
+from schul_cloud_resources_server_tests.tests.fixtures import ParallelBottleServer
+
+
+def hello():
+    return "hello"
+
+
+@fixture
+def serve(tmpdir):
+    """Return a function which serves a bottle app with a profiler."""
+    servers = []
+    def serve(**kw):
+        profiler = Profiler(str(tmpdir), **kw)
+        app = Bottle()
+        app.route("/hello")(hello)
+        app.install(profiler)
+        servers.append(ParallelBottleServer(app))
+        return servers[-1].url + "/hello", profiler
+    yield serve
+    for server in servers:
+        server.shutdown()
+
+
+def test_disabled_profiler_does_not_wrap_the_route(tmpdir):
+    app = Bottle()
+    app.route("/hello")(hello)
+    assert Profiler(str(tmpdir)).apply(hello, app.routes[0]) is hello
+
+
+def test_requests_are_profiled_by_route(serve):
+    url, profiler = serve(enabled=True)
+    assert requests.get(url).text == "hello"
+    assert requests.get(url).text == "hello"
+    assert not os.path.exists(profiler.get_path("hello"))
+    profiler.write()
+    stats = pstats.Stats(profiler.get_path("hello"))
+    assert any(function[2] == "hello" and stats.stats[function][0] == 2
+               for function in stats.stats)
+
+
+def test_profile_requests_with_the_token(serve):
+    url, profiler = serve(token="secret")
+    requests.get(url)
+    assert not profiler._stats
+    requests.get(url, headers={"X-Profile": "secret"})
+    assert "hello" in profiler._stats
+
+
+def test_profile_only_matching_routes(serve):
+    url, profiler = serve(enabled=True, routes="^add_resource$")
+    requests.get(url)
+    assert not profiler._stats
@@ -0,0 +1,68 @@
+"""Test to replace and change resources with PUT and PATCH."""
+import sys
+import json
+import requests
+from pytest import fixture, skip
+from schul_cloud_resources_server_tests.app import data
+
+HEADERS = {"Content-Type": "application/vnd.api+json"}
+
+
+@fixture(params=["resources_server", "async_resources_server"])
+def url(request):
+    """Return the url of the resources of a server."""
+    if request.param == "async_resources_server" and sys.version_info < (3, 5):
+        skip("asyncio requires Python 3.5")
+    return request.getfixturevalue(request.param).url + "/resources/"
+
+
+def send(method, url, resource, **kw):
+    """Send a resource with the method."""
+    document = {"data": dict(type="resource", attributes=resource, **kw)}
+    return requests.request(method, url, data=json.dumps(document), headers=HEADERS)
+
+
+def test_put_creates_and_replaces(url, valid_resources):
+    """PUT adds a new resource and replaces an existing one."""
+    response = send("PUT", url + "put-id", valid_resources[0])
+    assert response.status_code == 201
+    assert response.headers["Location"].endswith("/resources/put-id")
+    response = send("PUT", url + "put-id", valid_resources[1])
+    assert response.status_code == 200
+    assert response.json()["data"]["attributes"] == valid_resources[1]
+    assert requests.get(url + "put-id").json()["data"]["attributes"] == valid_resources[1]
+
+
+def test_unchanged_resource_is_not_written(url, a_valid_resource):
+    """Writes of the same content are skipped."""
+    send("PUT", url + "1", a_valid_resource)
+    operations = []
+    data.listeners.append(lambda *args: operations.append(args))
+    try:
+        assert send("PUT", url + "1", a_valid_resource).status_code == 200
+    finally:
+        data.listeners.pop()
+    assert operations == []
+
+
+def test_put_checks_the_id_in_the_body(url, a_valid_resource):
+    """The id in the document must match the url."""
+    assert send("PUT", url + "1", a_valid_resource, id="2").status_code == 409
+
+
+def test_patch_changes_attributes(url, a_valid_resource):
+    """PATCH changes only the attributes which are sent."""
+    send("PUT", url + "1", a_valid_resource)
+    response = send("PATCH", url + "1", {"title": "new title"}, id="1")
+    assert response.status_code == 200
+    expected = dict(a_valid_resource, title="new title")
+    assert requests.get(url + "1").json()["data"]["attributes"] == expected
+
+
+def test_patch_requires_a_resource(url):
+    assert send("PATCH", url + "missing", {"title": "new title"}).status_code == 404
+
+
+def test_patched_resource_is_validated(url, a_valid_resource):
+    send("PUT", url + "1", a_valid_resource)
+    assert send("PATCH", url + "1", {"title": 1}).status_code == 422
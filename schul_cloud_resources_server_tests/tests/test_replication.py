@@ -0,0 +1,86 @@
+"""Test the replication from a leader to followers."""
+import os
+import sys
+import subprocess
+import requests
+from pytest import fixture, raises
+from schul_cloud_resources_server_tests.replication import ReplicationLog, LogTruncated
+from schul_cloud_resources_server_tests.store import DictStore
+from schul_cloud_resources_server_tests.tests.conftest import User
+from schul_cloud_resources_server_tests.tests.fixtures import ResourcesServerProcess
+
+USER = User(None, "basic", "valid1@schul-cloud.org", "123abc")
+ENV = {"SCRST_REPLICATION_TOKEN": "secret"}
+
+
+def test_records_are_numbered(valid_resource):
+    log = ReplicationLog()
+    log.record("add", "user", "1", valid_resource)
+    log.record("delete", "user", "1")
+    records = log.get_records(0)
+    assert [record[0] for record in records] == [1, 2]
+    assert records[1][2:] == ["delete", "user", "1", None]
+    assert log.get_records(1)[0][0] == 2
+    assert log.get_records(2) == []
+
+
+def test_removed_records_need_a_snapshot(valid_resource):
+    log = ReplicationLog(max_records=2)
+    store = DictStore("user", [log.record])
+    for _id in "123":
+        store.add(_id, valid_resource)
+    with raises(LogTruncated):
+        log.get_records(0)
+    assert [record[0] for record in log.get_records(1)] == [2, 3]
+    snapshot = log.snapshot(lambda: [store])
+    assert snapshot["sequence"] == 3
+    assert [user for user, items in snapshot["stores"]] == ["user"]
+    assert sorted(_id for _id, resource in snapshot["stores"][0][1]) == ["1", "2", "3"]
+
+
+@fixture
+def leader():
+    """The url of a leader in another process."""
+    server = ResourcesServerProcess("--leader", env=ENV)
+    yield server.url
+    server.shutdown()
+
+
+@fixture
+def follower(leader):
+    """The url of a follower in another process."""
+    server = ResourcesServerProcess("--follow", leader, env=ENV)
+    yield server.url
+    server.shutdown()
+
+
+def test_followers_copy_the_resources(leader, follower, a_valid_resource):
+    body = {"data": {"attributes": a_valid_resource, "type": "resource"}}
+    response = USER.post(leader + "/resources", json=body)
+    assert response.status_code == 201
+    first = response.json()["data"]["id"]
+    # written to the follower, sent to the leader
+    response = USER.post(follower + "/resources", json=body)
+    assert response.status_code == 201
+    second = response.json()["data"]["id"]
+    assert response.headers["Location"] == follower + "/resources/" + second
+    assert USER.get(leader + "/resources/" + second).status_code == 200
+    assert USER.get(follower + "/resources/" + first).json()["data"]["attributes"] == \
+        a_valid_resource
+    assert USER.delete(follower + "/resources/" + first).status_code == 200
+    assert USER.get(follower + "/resources/" + first).status_code == 404
+    assert USER.get(leader + "/resources/" + first).status_code == 404
+    status = requests.get(follower + "/replication/status").json()
+    assert status["lag_records"] == 0
+    assert status["sequence"] == requests.get(leader + "/replication/status").json()["sequence"]
+
+
+def test_a_leader_needs_a_token():
+    env = dict(os.environ)
+    env.pop("SCRST_REPLICATION_TOKEN", None)
+    process = subprocess.Popen([sys.executable, "-m", "schul_cloud_resources_server_tests.app",
+                                "0", "--leader", "--no-reload"], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    assert process.returncode == 2
+    assert b"SCRST_REPLICATION_TOKEN" in error
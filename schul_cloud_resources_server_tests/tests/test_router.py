@@ -0,0 +1,138 @@
+"""Test the router which spreads the users over several servers."""
+import json
+import time
+import requests
+from threading import Thread
+from bottle import run
+from pytest import fixture
+from schul_cloud_resources_server_tests.router import Router, HashRing
+from schul_cloud_resources_server_tests.wsgi_server import KeepAliveServerAdapter
+from schul_cloud_resources_server_tests.tests.conftest import User
+from schul_cloud_resources_server_tests.tests.fixtures import (
+    ResourcesServerProcess, get_free_port)
+
+USERS = [User(None, "basic", "valid1@schul-cloud.org", "123abc"),
+         User(None, "basic", "valid2@schul-cloud.org", "supersecure"),
+         User(None, "noauth", None, None)]
+TOKEN = "secret"
+
+
+def test_few_keys_move_when_a_shard_is_added():
+    ring = HashRing(["a", "b", "c"])
+    keys = [str(i) for i in range(3000)]
+    before = dict((key, ring.get(key)) for key in keys)
+    assert set(before.values()) == set("abc")
+    ring.add("d")
+    moved = [key for key in keys if ring.get(key) != before[key]]
+    assert all(ring.get(key) == "d" for key in moved)
+    assert 300 < len(moved) < 1200
+
+
+@fixture
+def shard():
+    """A server in another process."""
+    server = ResourcesServerProcess()
+    yield server
+    server.shutdown()
+
+
+class RouterServer(object):
+    """The router in a thread."""
+
+    def __init__(self, router):
+        self.router = router
+        self._server = KeepAliveServerAdapter(host="127.0.0.1", port=0)
+        self._thread = Thread(target=run, kwargs=dict(
+            app=router, server=self._server, quiet=True))
+        self._thread.start()
+        while not self._server.get_port(): time.sleep(0.0001)
+        self.url = "http://localhost:{}/v1".format(self._server.get_port())
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+@fixture
+def router(shard):
+    """A router with one shard."""
+    server = RouterServer(Router([shard.url[:-3]], token=TOKEN))
+    yield server
+    server.shutdown()
+
+
+def get_moving_port(router):
+    """Return a port for a new shard to which a user moves."""
+    while True:
+        port = get_free_port()
+        ring = router.ring.copy()
+        ring.add("http://localhost:{}".format(port))
+        if any(ring.get(user.name or "") != router.ring.get(user.name or "")
+               for user in USERS):
+            return port
+
+
+def post(user, url, resource):
+    body = {"data": {"attributes": resource, "type": "resource"}}
+    response = user.post(url + "/resources", json=body)
+    assert response.status_code == 201
+    return response.json()["data"]["id"]
+
+
+def get_ids(user, url):
+    response = user.get(url + "/resources/ids")
+    assert response.status_code == 200
+    return sorted(entry["id"] for entry in response.json()["data"])
+
+
+def test_users_keep_their_resources_when_a_shard_is_added(router, shard, a_valid_resource):
+    ids = dict((user.name, [post(user, router.url, a_valid_resource) for i in range(2)])
+               for user in USERS)
+    assert requests.get(router.url + "/resources/ids",
+                        auth=("valid1@schul-cloud.org", "invalid")).status_code == 401
+    port = get_moving_port(router.router)
+    new_shard = ResourcesServerProcess(port=port)
+    try:
+        response = requests.post(router.url[:-3] + "/router/shards", data=new_shard.url[:-3],
+                                 headers={"X-Router-Token": TOKEN})
+        assert response.json()["generation"] == 1
+        for user in USERS:
+            assert get_ids(user, router.url) == sorted(ids[user.name])
+            moved = router.router.get_shard(user.name) == new_shard.url[:-3]
+            on_shard, other = ((new_shard, shard) if moved else (shard, new_shard))
+            assert get_ids(user, on_shard.url) == sorted(ids[user.name])
+            assert get_ids(user, other.url) == []
+    finally:
+        new_shard.shutdown()
+
+
+def test_events_are_passed_on(router, shard, a_valid_resource):
+    user = USERS[0]
+    response = user.get(router.url + "/resources/events", stream=True)
+    try:
+        lines = response.iter_lines()
+        assert next(lines) == b"retry: 1000"
+        _id = post(user, router.url, a_valid_resource)
+        assert [next(lines) for i in range(4)][1:] == [
+            b"id: 1", b"event: add", 'data: {{"id": "{}"}}'.format(_id).encode()]
+    finally:
+        response.close()
+        shard.shutdown() # ends the stream the router reads
+
+
+def test_the_export_comes_from_the_shard_of_the_user(router, a_valid_resource):
+    user = USERS[0]
+    _id = post(user, router.url, a_valid_resource)
+    response = user.get(router.url + "/export")
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.iter_lines()] == [_id]
+
+
+def test_the_shards_need_the_token(router):
+    url = router.url[:-3] + "/router/shards"
+    assert requests.post(url, data="http://example.org").status_code == 403
+    assert requests.get(url, headers={"X-Router-Token": TOKEN}).status_code == 200
+    router.router.token = None
+    response = requests.post(url, data="http://example.org", headers={"X-Router-Token": TOKEN})
+    assert response.status_code == 403
+    assert len(router.router.ring.shards) == 1
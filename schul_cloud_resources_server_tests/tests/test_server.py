@@ -1,5 +1,6 @@
 import requests
 from pytest import raises
+from schul_cloud_resources_server_tests.app import data
 
 
 def test_server_is_there(resources_server):
@@ -13,10 +14,17 @@ def test_server_works_on_data(resources_server, valid_resource):
     assert resources_server.get_resources() == [valid_resource]
 
 
+def test_server_reports_bytes_per_resource(resources_server, a_valid_resource):
+    """The memory usage of the resources can be observed."""
+    assert data.get_bytes_per_resource() == 0
+    resources_server.api.add_resource({"data": {"type": "resource", "attributes": a_valid_resource}})
+    assert data.get_bytes_per_resource() > 0
+
+
 # this must be the last test
 def test_server_stops(resources_server):
     """Test that the server stops in the end."""
     resources_server.shutdown()
-    with raises(requests.exceptions.ReadTimeout):
+    with raises((requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError)):
         requests.get(resources_server.url,timeout=0.01)
     
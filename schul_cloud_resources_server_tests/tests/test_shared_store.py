@@ -0,0 +1,124 @@
+"""Test the store which is shared by worker processes."""
+import os
+import sys
+from multiprocessing import Process
+from pytest import fixture, mark, raises
+pytestmark = mark.skipif(sys.platform.startswith("win"), reason="needs fcntl")
+from schul_cloud_resources_server_tests import shared_store
+from schul_cloud_resources_server_tests.shared_store import SharedLog, SharedStore
+from schul_cloud_resources_server_tests.store import OperationFailed
+
+
+@fixture
+def path(tmpdir):
+    """Return the path of a shared log file."""
+    return str(tmpdir.join("shared-store"))
+
+
+def store(path, user="user"):
+    """Return a store with its own log like in another process."""
+    return SharedStore(user, log=SharedLog(path))
+
+
+def test_resources_are_visible_to_other_logs(path, valid_resource):
+    """Two opened logs share the resources."""
+    store1 = store(path)
+    store2 = store(path)
+    assert store1.add("1", valid_resource)
+    assert store2["1"] == valid_resource
+    assert not store2.add("1", valid_resource)
+    assert store2.pop("1") == valid_resource
+    assert "1" not in store1
+    assert store1.pop("1") is None
+
+
+def test_pop_many_skips_missing_ids(path, valid_resource):
+    """Only the present resources are removed."""
+    store1 = store(path)
+    store1.add("1", valid_resource)
+    store1.add("2", valid_resource)
+    assert store(path).pop_many(["2", "3"]) == ["2"]
+    assert list(store1) == ["1"]
+
+
+def test_apply_all_writes_all_operations_or_none(path, valid_resource):
+    """The operations are checked before they are written."""
+    store1 = store(path)
+    with raises(OperationFailed):
+        store1.apply_all([("add", "1", valid_resource), ("delete", "2")])
+    store1.apply_all([("add", "1", valid_resource), ("put", "2", valid_resource)])
+    assert sorted(store(path)) == ["1", "2"]
+
+
+def test_the_version_changes_with_other_logs(path, valid_resource):
+    """Caches of other processes see the changes in the version."""
+    store1 = store(path)
+    version = store1.get_version()
+    store(path).add("1", valid_resource)
+    assert store1.get_version() != version
+
+def test_users_are_separated(path, valid_resource):
+    """Each user sees only the own resources."""
+    store(path, "a").add("1", valid_resource)
+    other = store(path, "b")
+    assert list(other) == []
+    other.add("2", valid_resource)
+    other.clear()
+    assert list(store(path, "a")) == ["1"]
+
+
+def test_a_torn_record_is_not_read(path, valid_resource):
+    """Readers skip a record which is written in the moment."""
+    store1 = store(path)
+    store1.add("1", valid_resource)
+    with open(path, "ab") as file:
+        file.write(b"\x00\x00\x00\x10\x00\x00\x00\x00[\"add\"")
+    store2 = store(path)
+    assert list(store2) == ["1"]
+    # the next writer overwrites the torn record
+    assert store1.add("2", valid_resource)
+    assert sorted(store2) == ["1", "2"]
+
+
+def test_other_files_are_not_opened(tmpdir):
+    """The log does not overwrite other files."""
+    path = tmpdir.join("file")
+    path.write("this is no log")
+    with raises(ValueError):
+        SharedLog(str(path))
+
+
+def add_resources(path, resource, count):
+    """Add resources with new ids."""
+    log = SharedLog(path)
+    shared = SharedStore("user", log=log)
+    for i in range(count):
+        assert shared.add(log.new_id(), resource)
+
+
+def test_processes_create_unique_ids(path, valid_resource):
+    """Worker processes add resources concurrently."""
+    processes = [Process(target=add_resources, args=(path, valid_resource, 50))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert sorted(map(int, store(path))) == list(range(1, 201))
+
+
+def test_reserved_ids_are_not_created_by_other_logs(path):
+    """Imported ids move the counter in the file."""
+    log = SharedLog(path)
+    log.reserve_id(10)
+    log.reserve_id(5)
+    assert SharedLog(path).new_id() == "11"
+
+
+def test_the_store_reserves_ids_in_the_shared_log(monkeypatch, tmpdir):
+    monkeypatch.setenv("SCRST_SHARED_STORE", str(tmpdir.join("reserved")))
+    monkeypatch.setattr(shared_store, "_log", None)
+    SharedStore.reserve_id("41")
+    SharedStore.reserve_id("x")
+    assert SharedLog(str(tmpdir.join("reserved"))).new_id() == "42"
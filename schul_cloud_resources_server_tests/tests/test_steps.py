@@ -0,0 +1,35 @@
+"""Test the selection of the tests by their step."""
+from schul_cloud_resources_server_tests.tests.conftest import pytest_collection_modifyitems
+
+
+class Config(object):
+
+    def __init__(self, markexpr):
+        self.markexpr = markexpr
+
+    def getoption(self, name, default=None):
+        return self.markexpr
+
+
+class Item(object):
+
+    def __init__(self, number):
+        self.function = lambda: None
+        self.function._step = number
+        self.markers = []
+
+    def add_marker(self, marker):
+        self.markers.append(marker)
+
+
+def test_only_the_selected_markers_are_added():
+    items = [Item(number) for number in range(1, 5)]
+    pytest_collection_modifyitems(Config("step2 or step3only"), items)
+    assert [item.markers for item in items] == [
+        ["step2"], ["step2"], ["step3only"], []]
+
+
+def test_no_markers_without_steps():
+    item = Item(1)
+    pytest_collection_modifyitems(Config("not slow"), [item])
+    assert item.markers == []
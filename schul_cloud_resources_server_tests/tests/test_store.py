@@ -0,0 +1,84 @@
+"""Test the stores which hold the resources of a user."""
+from pytest import fixture, mark
+from schul_cloud_resources_server_tests.store import stores, DictStore, CompactStore, DedupStore, BodyPool
+
+
+@fixture(params=sorted(stores))
+def store(request):
+    """Return an empty store of each kind."""
+    if request.param == "dedup":
+        return DedupStore("user", pool=BodyPool())
+    return stores[request.param]("user")
+
+
+def test_added_resource_can_be_retrieved(store, valid_resource):
+    """A stored resource comes back equal."""
+    assert store.add("id", valid_resource)
+    assert store["id"] == valid_resource
+    assert store.get("id") == valid_resource
+    assert store.values() == [valid_resource]
+
+
+def test_can_not_add_twice(store, valid_resources):
+    """Adding to an existing id does not replace the resource."""
+    assert store.add("id", valid_resources[0])
+    assert not store.add("id", valid_resources[1])
+    assert store["id"] == valid_resources[0]
+
+
+def test_pop_and_clear(store, a_valid_resource):
+    """Resources can be removed."""
+    store.add("1", a_valid_resource)
+    store.add("2", a_valid_resource)
+    assert store.pop("1") == a_valid_resource
+    assert store.pop("1") is None
+    assert list(store) == ["2"]
+    store.clear()
+    assert len(store) == 0
+    assert store.get_size() == 0
+
+
+def test_pop_many(store, a_valid_resource):
+    """Several resources are removed at once."""
+    listened = []
+    store.listeners = [lambda operation, user, _id, resource: listened.append(_id)]
+    for _id in "123":
+        store.add(_id, a_valid_resource)
+    assert store.pop_many(["1", "3", "4"]) == ["1", "3"]
+    assert list(store) == ["2"]
+    assert listened == ["1", "2", "3", "1", "3"]
+    assert store.pop_many(["2"]) == ["2"]
+    assert store.get_size() == 0
+
+
+def test_compact_store_uses_less_memory(valid_resources):
+    """The reason for the compact store is to save memory."""
+    dict_store = DictStore("user")
+    compact_store = CompactStore("user")
+    for i, resource in enumerate(valid_resources):
+        dict_store.add(str(i), resource)
+        compact_store.add(str(i), resource)
+    assert 0 < compact_store.get_size() < dict_store.get_size()
+
+
+def test_dedup_store_keeps_equal_resources_once(a_valid_resource):
+    """Equal resources of different users share the memory."""
+    pool = BodyPool()
+    store1 = DedupStore("user1", pool=pool)
+    store2 = DedupStore("user2", pool=pool)
+    store1.add("1", a_valid_resource)
+    store1.add("2", dict(reversed(list(a_valid_resource.items()))))
+    store2.add("1", a_valid_resource)
+    assert len(pool) == 1
+    assert store2.pop("1") == a_valid_resource
+    store1.clear()
+    assert len(pool) == 0
+
+
+def test_dedup_store_copy_is_independent(a_valid_resource):
+    """A copy for the journal keeps the resources when they are deleted."""
+    store = DedupStore("user", pool=BodyPool())
+    store.add("1", a_valid_resource)
+    copy = store.copy()
+    store.clear()
+    assert copy["1"] == a_valid_resource
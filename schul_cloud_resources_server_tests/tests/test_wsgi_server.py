@@ -0,0 +1,109 @@
+"""Test the WSGI server with persistent connections."""
+import time
+import socket
+from bottle import Bottle, request
+from pytest import fixture
+from schul_cloud_resources_server_tests.tests.fixtures import ParallelBottleServer
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+
+app = Bottle()
+
+
+@app.route("/hello")
+def hello():
+    return "hello"
+
+
+@app.route("/stream")
+def stream():
+    yield "hel"
+    yield "lo"
+
+
+@app.post("/echo")
+def echo():
+    return request.body.read()
+
+
+@fixture
+def server():
+    server = ParallelBottleServer(app)
+    yield server
+    server.shutdown()
+
+
+@fixture
+def connection(server):
+    """A connection to the server."""
+    connection = HTTPConnection("localhost", server._server.get_port())
+    yield connection
+    connection.close()
+
+
+def test_connection_is_kept_alive(connection):
+    connection.request("GET", "/hello")
+    response = connection.getresponse()
+    assert response.version == 11
+    assert response.read() == b"hello"
+    sock = connection.sock
+    for i in range(3):
+        connection.request("POST", "/echo", body=b"x" * i)
+        assert connection.getresponse().read() == b"x" * i
+    assert connection.sock is sock
+
+
+def test_response_without_length_is_chunked(connection):
+    connection.request("GET", "/stream")
+    response = connection.getresponse()
+    assert response.getheader("Transfer-Encoding") == "chunked"
+    assert response.read() == b"hello"
+    connection.request("GET", "/hello")
+    assert connection.getresponse().read() == b"hello"
+
+
+def test_chunked_request_body(connection):
+    connection.putrequest("POST", "/echo")
+    connection.putheader("Transfer-Encoding", "chunked")
+    connection.endheaders()
+    connection.send(b"3\r\nhel\r\n2\r\nlo\r\n0\r\n\r\n")
+    assert connection.getresponse().read() == b"hello"
+
+
+def test_unread_body_is_skipped(connection):
+    connection.request("GET", "/hello", body=b"ignored")
+    assert connection.getresponse().read() == b"hello"
+    connection.request("GET", "/hello")
+    assert connection.getresponse().read() == b"hello"
+
+
+def test_idle_connections_do_not_block_others(server):
+    """Idle connections give their thread to waiting connections."""
+    port = server._server.get_port()
+    idle = []
+    for i in range(20):
+        connection = HTTPConnection("localhost", port, timeout=5)
+        connection.request("GET", "/hello")
+        connection.getresponse().read()
+        idle.append(connection)
+    start = time.time()
+    connection = HTTPConnection("localhost", port, timeout=5)
+    connection.request("GET", "/hello")
+    assert connection.getresponse().read() == b"hello"
+    assert time.time() - start < 2
+    for connection in idle:
+        connection.close()
+
+
+def test_shutdown_with_idle_connection(connection):
+    server = ParallelBottleServer(app)
+    connection = HTTPConnection("localhost", server._server.get_port())
+    connection.request("GET", "/hello")
+    connection.getresponse().read()
+    start = time.time()
+    server.shutdown()
+    assert time.time() - start < 5
+    connection.close()
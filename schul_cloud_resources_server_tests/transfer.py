@@ -0,0 +1,270 @@
+"""This module exports and imports the resources of a user as NDJSON.
+
+Each line is a JSON object like the data of a resource in the api:
+
+    {"type":"resource","id":"cornelsen-physics-1","attributes":{"title":...}}
+
+A line may also be a resource without an id, like the generator module
+writes them. Such a resource gets a new id when it is imported.
+
+The server streams the resources with GET /v1/export and loads them
+with POST /v1/import. The import validates the resources in batches,
+skips the invalid lines and adds or replaces each batch at once.
+The command line copies the resources between files and servers:
+
+    python -m schul_cloud_resources_server_tests.transfer export backup.ndjson \\
+        --url=http://localhost:8080/v1 --basic=valid1@schul-cloud.org:123abc
+    python -m schul_cloud_resources_server_tests.generator 100000 > resources.ndjson
+    python -m schul_cloud_resources_server_tests.transfer import resources.ndjson \\
+        --url=http://localhost:8080/v1 --basic=valid1@schul-cloud.org:123abc
+
+Use - as the file for the standard input or output.
+The import sends the lines in batches which stay below the body limit
+of the servers, see MAX_BATCH_BYTES.
+"""
+import sys
+import json
+import base64
+import argparse
+from schul_cloud_resources_server_tests.validation import get_validation_error
+
+if sys.version_info[0] == 2:
+    STR_TYPE = basestring
+else:
+    STR_TYPE = str
+
+CONTENT_TYPE = "application/x-ndjson"
+# the number of resources which are validated and added at once
+BATCH_SIZE = 1000
+# the number of errors which are reported
+MAX_ERRORS = 100
+# the bytes of the lines the command line sends with one request,
+# below the 4 MiB body limit of the ASGI server
+MAX_BATCH_BYTES = 1024 * 1024
+
+
+def iter_export(store, get_resource=None, batch_size=100):
+    """Yield the resources of the store as NDJSON in chunks of bytes.
+
+    get_resource(store, id) returns a resource or None to skip it.
+    Only the ids are copied, so the memory does not grow with the resources.
+    """
+    if get_resource is None:
+        get_resource = lambda store, _id: store.get(_id)
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    lines = []
+    for _id in store:
+        resource = get_resource(store, _id)
+        if resource is None:
+            continue # deleted in the meantime
+        lines.append(dumps({"type": "resource", "id": _id, "attributes": resource}))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_line(line):
+    """Return the id or None and the resource of a line."""
+    data = json.loads(line.decode("utf-8") if isinstance(line, bytes) else line)
+    if not isinstance(data, dict):
+        raise ValueError("A line must be a JSON object.")
+    if "attributes" not in data:
+        return None, data
+    if data.get("type", "resource") != "resource" or not isinstance(data["attributes"], dict):
+        raise ValueError("The type must be \"resource\" and the attributes an object.")
+    _id = data.get("id")
+    if _id is not None and not isinstance(_id, STR_TYPE):
+        raise ValueError("The id must be a string.")
+    return _id, data["attributes"]
+
+
+class Import(object):
+    """The import of lines of NDJSON into a store.
+
+    - check_id(id) raises an exception if the id can not be used
+    - admit(store, count=n) raises an exception if n new resources do not fit
+    - enforce(user, id) is called for each imported resource
+    """
+
+    def __init__(self, store, check_id=None, admit=None, enforce=None, batch_size=BATCH_SIZE):
+        """Create an import which did not import anything."""
+        self.store = store
+        self.check_id = check_id
+        self.admit = admit
+        self.enforce = enforce
+        self.batch_size = batch_size
+        self.imported = 0
+        self.errors = [] # {"line": number, "detail": message}
+        self.error_count = 0
+
+    def error(self, number, detail):
+        """Remember an invalid line."""
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"line": number, "detail": detail})
+
+    def read(self, lines):
+        """Import the lines."""
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                _id, resource = parse_line(line)
+                validation_error = get_validation_error(resource)
+                if validation_error is not None:
+                    raise ValueError(str(validation_error))
+                if _id is None:
+                    _id = self.store.new_id()
+                elif self.check_id is not None:
+                    self.check_id(_id)
+            except Exception as error:
+                self.error(number, getattr(error, "body", None) or str(error))
+                continue
+            batch.append(("put", _id, resource))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self
+
+    def write(self, batch):
+        """Add or replace the resources of a batch at once."""
+        count = len([operation for operation in batch if operation[1] not in self.store])
+        if self.admit is not None and count:
+            self.admit(self.store, count=count)
+        self.store.apply_all(batch)
+        numbers = [int(operation[1]) for operation in batch if operation[1].isdigit()]
+        if numbers:
+            # reserving the largest id reserves all of them
+            self.store.reserve_id(str(max(numbers)))
+        if self.enforce is not None:
+            for operation in batch:
+                self.enforce(self.store.user, operation[1])
+        self.imported += len(batch)
+
+    def get_result(self):
+        """Return the number of imported resources and the errors as a dict."""
+        return {"imported": self.imported, "invalid": self.error_count, "errors": self.errors}
+
+
+def iter_batches(lines, batch_size, max_bytes=MAX_BATCH_BYTES):
+    """Yield lists of at most batch_size lines and max_bytes bytes.
+
+    A line longer than max_bytes is a batch of its own.
+    """
+    batch = []
+    size = 0
+    for line in lines:
+        if batch and (len(batch) >= batch_size or size + len(line) > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(line)
+        size += len(line)
+    if batch:
+        yield batch
+
+
+def get_error_detail(response):
+    """Return the detail of an error response of the server."""
+    try:
+        return response.json()["errors"][0]["detail"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return response.text.strip() or response.reason
+
+
+def get_headers(basic=None, apikey=None):
+    """Return the headers which authenticate a user of the command line.
+
+    basic is "user:password" and apikey is "user:key".
+    """
+    if basic:
+        credentials = basic
+        scheme = "basic {}"
+    elif apikey:
+        credentials = apikey.split(":", 1)[1]
+        scheme = "api-key key={}"
+    else:
+        return {}
+    encoded = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"Authorization": scheme.format(encoded)}
+
+
+def open_file(path, mode):
+    """Open the file or return the standard stream for -."""
+    if path == "-":
+        stream = (sys.stdin if "r" in mode else sys.stdout)
+        return getattr(stream, "buffer", stream)
+    return open(path, mode)
+
+
+def export_file(url, headers, path):
+    """Write the resources of the server at the url to the file."""
+    import requests
+    response = requests.get(url + "/export", headers=headers, stream=True)
+    response.raise_for_status()
+    output = open_file(path, "wb")
+    for chunk in response.iter_content(65536):
+        output.write(chunk)
+    output.flush()
+
+
+def import_file(url, headers, path, batch_size=BATCH_SIZE):
+    """Send the resources of the file to the server at the url.
+
+    Return the number of imported resources and the errors as a dict.
+    """
+    import requests
+    headers = dict(headers, **{"Content-Type": CONTENT_TYPE})
+    result = {"imported": 0, "invalid": 0, "errors": []}
+    offset = 0
+    for batch in iter_batches(open_file(path, "rb"), batch_size):
+        response = requests.post(url + "/import", data=b"".join(
+            line if line.endswith(b"\n") else line + b"\n" for line in batch), headers=headers)
+        response.raise_for_status()
+        meta = response.json()["meta"]
+        result["imported"] += meta["imported"]
+        result["invalid"] += meta["invalid"]
+        result["errors"].extend(dict(error, line=error["line"] + offset)
+                                for error in meta["errors"])
+        offset += len(batch)
+    del result["errors"][MAX_ERRORS:]
+    return result
+
+
+def main(argv=None):
+    """Export or import resources from the command line."""
+    import requests
+    parser = argparse.ArgumentParser(description="Copy resources as NDJSON.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("file", help="the NDJSON file or - for the standard input or output")
+    parser.add_argument("--url", default="http://localhost:8080/v1",
+                        help="the url of the api of the server")
+    parser.add_argument("--basic", help="user:password of the user")
+    parser.add_argument("--apikey", help="user:key of the user")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="the number of resources sent with one request")
+    args = parser.parse_args(argv)
+    headers = get_headers(args.basic, args.apikey)
+    url = args.url.rstrip("/")
+    try:
+        if args.command == "export":
+            export_file(url, headers, args.file)
+        else:
+            result = import_file(url, headers, args.file, args.batch_size)
+            json.dump(result, sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write("\n")
+    except requests.HTTPError as error:
+        parser.exit(1, "{} {}: {}\n".format(error.response.status_code, error.response.url,
+                                            get_error_detail(error.response)))
+
+
+__all__ = ["Import", "iter_export", "parse_line", "CONTENT_TYPE", "main"]
+
+
+if __name__ == "__main__":
+    main()
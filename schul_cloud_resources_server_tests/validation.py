@@ -0,0 +1,51 @@
+"""This module validates the resources against the resource schema.
+
+Importing the schema module and jsonschema takes most of the start time
+of the server. Thus, they are imported when the first resource is validated
+or in the background after the server started, see warm_up().
+The schema files are read only once.
+"""
+from threading import Thread, Lock
+
+_lock = Lock()
+_validate = None
+
+
+def _load():
+    """Return a function which validates a resource."""
+    global _validate
+    with _lock:
+        if _validate is None:
+            import jsonschema
+            from schul_cloud_resources_api_v1.schema import get_schemas
+            schemas = get_schemas()
+            resource_schema = schemas["resource"].get_schema()
+            store = {}
+            for schema in schemas.values():
+                store[schema.get_uri()] = schema.get_schema()
+            def validate(resource):
+                """Return the validation error of the resource or None."""
+                resolver = jsonschema.RefResolver.from_schema(resource_schema, store=store)
+                try:
+                    jsonschema.validate(resource, resource_schema, resolver=resolver)
+                except jsonschema.ValidationError as error:
+                    return error
+                return None
+            _validate = validate
+    return _validate
+
+
+def get_validation_error(resource):
+    """Return the validation error of the resource or None if it is valid."""
+    return (_validate or _load())(resource)
+
+
+def warm_up():
+    """Load the schema in the background."""
+    if _validate is None:
+        thread = Thread(target=_load)
+        thread.daemon = True
+        thread.start()
+
+
+__all__ = ["get_validation_error", "warm_up"]
@@ -0,0 +1,368 @@
+"""This module contains a WSGI server with persistent connections.
+
+The wsgiref server of the standard library speaks HTTP/1.0 and closes
+the connection after each response, so a client pays a TCP handshake
+per request. This server
+
+- keeps HTTP/1.1 connections open for further requests,
+- sends responses without a Content-Length with chunked transfer encoding,
+- reads chunked request bodies and
+- handles the connections in a small pool of threads.
+
+A connection waiting for its next request gives its thread away
+when other connections wait for a thread.
+"""
+import io
+import select
+import socket
+import time
+from threading import Thread
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler, make_server
+from bottle import ServerAdapter
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+# statuses which have no body
+NO_BODY = ("204", "304")
+
+
+class RequestBody(object):
+    """The body of a request as wsgi.input.
+
+    The application can not read more than the body.
+    What it does not read is skipped before the next request.
+    """
+
+    def __init__(self, stream, length):
+        """Read length bytes of the stream."""
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.readline(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def skip(self):
+        """Skip the rest of the body."""
+        while self.remaining and self.read(65536):
+            pass
+
+
+class BodyTooLarge(Exception):
+    """The chunked body of a request is too large."""
+
+
+def read_chunked(stream, max_size):
+    """Return the chunked body of a request as a file."""
+    body = io.BytesIO()
+    while True:
+        line = stream.readline(65537)
+        size = int(line.split(b";")[0].strip(), 16) # ValueError if invalid
+        if size == 0:
+            while stream.readline(65537).strip():
+                pass # trailers
+            body.seek(0)
+            return body
+        if body.tell() + size > max_size:
+            raise BodyTooLarge(size)
+        body.write(stream.read(size))
+        stream.readline(65537)
+
+
+class KeepAliveServerHandler(ServerHandler):
+    """Write an HTTP/1.1 response.
+
+    Responses without a Content-Length are chunked.
+    """
+
+    http_version = "1.1"
+    chunked = False
+
+    def cleanup_headers(self):
+        ServerHandler.cleanup_headers(self)
+        request_handler = self.request_handler
+        if "Content-Length" not in self.headers and \
+                self.status.split(" ", 1)[0] not in NO_BODY and \
+                request_handler.command != "HEAD":
+            if request_handler.request_version == "HTTP/1.1":
+                self.chunked = True
+                self.headers["Transfer-Encoding"] = "chunked"
+            else:
+                request_handler.close_connection = True
+        if request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+    def write(self, data):
+        if not self.status:
+            raise AssertionError("write() before start_response()")
+        elif not self.headers_sent:
+            self.bytes_sent = len(data)
+            self.send_headers()
+        else:
+            self.bytes_sent += len(data)
+        if self.chunked:
+            if data:
+                self._write("{:x}\r\n".format(len(data)).encode("ascii") + data + b"\r\n")
+        else:
+            self._write(data)
+        self._flush()
+
+    def finish_content(self):
+        ServerHandler.finish_content(self)
+        if self.chunked:
+            self._write(b"0\r\n\r\n")
+            self._flush()
+
+    def handle_error(self):
+        # the client can not know where the response ends
+        self.request_handler.close_connection = True
+        ServerHandler.handle_error(self)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Handle the requests of a connection until it is closed."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately. With Nagle's algorithm,
+    # the body waits for the delayed acknowledgement of the headers.
+    disable_nagle_algorithm = True
+    # seconds a connection waits for the next request
+    keep_alive_timeout = 15
+    # the largest chunked request body
+    max_chunked_body_size = 4 * 1024 * 1024
+
+    def address_string(self): # Prevent reverse DNS lookups please.
+        return self.client_address[0]
+
+    def log_request(self, *args, **kw):
+        if not getattr(self.server, "quiet", False):
+            return WSGIRequestHandler.log_request(self, *args, **kw)
+
+    def setup(self):
+        WSGIRequestHandler.setup(self)
+        if self.disable_nagle_algorithm: # not done by Python 2
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+
+    def handle(self):
+        """Handle the requests of the connection."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def wait_for_request(self):
+        """Return whether the client sends another request.
+
+        The connection is closed when it is idle and other
+        connections wait for a thread or the server stops.
+        """
+        if self.is_buffered():
+            return True
+        deadline = time.time() + self.keep_alive_timeout
+        while time.time() < deadline:
+            if self.server.is_closed() or self.server.has_waiting_connections():
+                return False
+            try:
+                readable = select.select([self.connection], [], [], 0.05)[0]
+            except (select.error, ValueError):
+                return False
+            if readable:
+                return True
+        return False
+
+    def is_buffered(self):
+        """Whether the next request was already read into the buffer."""
+        peek = getattr(self.rfile, "peek", None)
+        if peek is None:
+            return False
+        timeout = self.connection.gettimeout()
+        self.connection.settimeout(0) # do not wait in peek()
+        try:
+            return bool(peek(1))
+        except (socket.error, ValueError):
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def handle_one_request(self):
+        """Handle one request of the connection."""
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, socket.error):
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if not self.parse_request(): # An error code has been sent, just exit
+            self.close_connection = True
+            return
+        if self.request_version != "HTTP/1.1":
+            self.close_connection = True
+        environ = self.get_environ()
+        # long responses like event streams end when the server stops
+        environ["scrst.server_closed"] = self.server.is_closed
+        if "chunked" in environ.get("HTTP_TRANSFER_ENCODING", "").lower():
+            try:
+                body = read_chunked(self.rfile, self.max_chunked_body_size)
+            except BodyTooLarge:
+                self.send_error(413)
+                self.close_connection = True
+                return
+            except ValueError:
+                self.send_error(400)
+                self.close_connection = True
+                return
+            environ["CONTENT_LENGTH"] = str(len(body.getvalue()))
+            del environ["HTTP_TRANSFER_ENCODING"]
+            stream = body
+        else:
+            stream = self.rfile
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            self.send_error(400)
+            self.close_connection = True
+            return
+        body = RequestBody(stream, length)
+        handler = KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), environ,
+            multithread=True)
+        handler.request_handler = self      # backpointer for logging
+        handler.run(self.server.get_app())
+        try:
+            body.skip()
+        except (socket.timeout, socket.error):
+            self.close_connection = True
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """A WSGI server which handles connections in a pool of threads."""
+
+    threads = 8
+    quiet = False
+
+    def __init__(self, *args, **kw):
+        """Create a new server and start its threads."""
+        WSGIServer.__init__(self, *args, **kw)
+        self._connections = Queue()
+        self._closed = False
+        self._workers = []
+        for i in range(self.threads):
+            thread = Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def process_request(self, request, client_address):
+        """Give the connection to a thread of the pool."""
+        self._connections.put((request, client_address))
+
+    def _work(self):
+        """Handle connections until the server is closed."""
+        while True:
+            connection = self._connections.get()
+            if connection is None:
+                return
+            request, client_address = connection
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def has_waiting_connections(self):
+        """Whether connections wait for a thread."""
+        return not self._connections.empty()
+
+    def is_closed(self):
+        """Whether the server is closed."""
+        return self._closed
+
+    def server_close(self):
+        """Close the server and stop the threads."""
+        self._closed = True
+        WSGIServer.server_close(self)
+        for thread in self._workers:
+            self._connections.put(None)
+        for thread in self._workers:
+            thread.join()
+
+
+class KeepAliveServerAdapter(ServerAdapter):
+    """A bottle adapter for the server with persistent connections.
+
+    It can be stopped with shutdown().
+    The option threads is the number of threads which handle connections.
+    """
+
+    srv = None
+
+    def run(self, app):
+        server_class = self.options.get("server_class", ThreadPoolWSGIServer)
+        handler_class = self.options.get("handler_class", KeepAliveRequestHandler)
+        if ":" in self.host: # Fix wsgiref for IPv6 addresses.
+            if getattr(server_class, "address_family") == socket.AF_INET:
+                class server_class(server_class):
+                    address_family = socket.AF_INET6
+
+        class Server(server_class):
+            threads = self.options.get("threads", server_class.threads)
+            quiet = self.quiet
+
+        self.srv = make_server(self.host, self.port, app, Server, handler_class)
+        try:
+            self.srv.serve_forever()
+        finally:
+            self.srv.server_close()
+
+    def shutdown(self, blocking=True):
+        """Stop the server.
+
+        If blocking is True, this returns when the server is shut down.
+        If blocking is False, the server is notified to shut down.
+        """
+        thread = Thread(target=self.srv.shutdown)
+        thread.start()
+        if blocking:
+            thread.join()
+
+    def get_port(self):
+        """Return the port of the server."""
+        try:
+            return self.srv.server_port
+        except AttributeError:
+            return None
+
+
+__all__ = ["KeepAliveServerAdapter", "ThreadPoolWSGIServer", "KeepAliveRequestHandler"]